@@ -0,0 +1,298 @@
+import json
+import math
+import os
+
+import numpy as np
+
+# USD per unit of each currency; CRM_FX_RATES='{"EUR": 1.1, "CHF": 1.12}'
+# overrides or extends the table. Totals are reported in CRM_BASE_CURRENCY.
+FX_RATES = {"USD": 1.0, "EUR": 1.08, "GBP": 1.27, "INR": 0.012, "AUD": 0.66,
+            "CAD": 0.73, "SGD": 0.74, "JPY": 0.0067}
+FX_RATES.update(json.loads(os.getenv("CRM_FX_RATES", "{}")))
+BASE_CURRENCY = os.getenv("CRM_BASE_CURRENCY", "USD")
+
+# Stage names are compared by their letters only: "ClosedWon", "Closed Won", "closed-won"
+WON_STAGES = {"closedwon", "won"}
+LOST_STAGES = {"closedlost", "lost"}
+
+GROUPS = ("stage", "company", "competitor")
+
+
+def _amount(value):
+    """
+    Deal value as a float; NaN when missing or not a number ("Unknown").
+    """
+    if isinstance(value, bool):
+        return math.nan
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        try:
+            return float(value.replace(",", "").strip())
+        except ValueError:
+            return math.nan
+    return math.nan
+
+
+def _currency(value):
+    return (value.strip().upper() or None) if isinstance(value, str) else None
+
+
+def _stage_key(stage):
+    return "".join(ch for ch in str(stage or "").lower() if ch.isalpha())
+
+
+class _Categories:
+    """
+    Label <-> integer code, codes given in order of first appearance.
+    """
+
+    def __init__(self):
+        self.codes = {}
+        self.labels = []
+
+    def code(self, label):
+        code = self.codes.get(label)
+        if code is None:
+            code = self.codes[label] = len(self.labels)
+            self.labels.append(label)
+        return code
+
+
+class _Column:
+    """
+    Growable NumPy array: appends are amortized O(1) by doubling.
+    """
+
+    def __init__(self, dtype, values=()):
+        self.data = np.array(values, dtype=dtype)
+        self.size = len(self.data)
+
+    def append(self, value):
+        if self.size == len(self.data):
+            grown = np.empty(max(16, 2 * self.size), dtype=self.data.dtype)
+            grown[:self.size] = self.data[:self.size]
+            self.data = grown
+        self.data[self.size] = value
+        self.size += 1
+
+    def view(self):
+        return self.data[:self.size]
+
+
+class DealColumns:
+    """
+    The deals as columns: value (float, NaN if unknown) and currency,
+    stage and company as category codes, plus one (row, competitor code)
+    entry per competitor named on a deal.
+
+    Built once per dataset version and then kept current by the store
+    like its other indexes (add() appends a row, update() patches one),
+    so a commit of a few deals does not rebuild a million rows. Query
+    results are cached until the next change.
+    """
+
+    def __init__(self, records):
+        self.currencies = _Categories()
+        self.stages = _Categories()
+        self.companies = _Categories()
+        self.competitors = _Categories()
+        self._cache = {}
+
+        self.value = _Column(np.float64, [_amount(r.get("value")) for r in records])
+        self.currency = _Column(np.int32, [self.currencies.code(_currency(r.get("currency"))) for r in records])
+        self.stage = _Column(np.int32, [self.stages.code(r.get("stage")) for r in records])
+        self.company = _Column(np.int32, [self.companies.code(r.get("company_name")) for r in records])
+
+        rows, codes = [], []
+        for row, record in enumerate(records):
+            for name in self._competitor_names(record.get("competitors")):
+                rows.append(row)
+                codes.append(self.competitors.code(name))
+        self.competitor_row = _Column(np.int64, rows)
+        self.competitor_code = _Column(np.int32, codes)
+        self.competitor_live = _Column(np.bool_, [True] * len(rows))
+
+    @staticmethod
+    def _competitor_names(competitors):
+        if not isinstance(competitors, list):
+            return []
+        return list(dict.fromkeys(c.strip() for c in competitors if isinstance(c, str) and c.strip()))
+
+    def __len__(self):
+        return self.value.size
+
+    # ---------------- incremental maintenance (store index protocol) ----------------
+
+    def add(self, record):
+        row = self.value.size
+        self.value.append(_amount(record.get("value")))
+        self.currency.append(self.currencies.code(_currency(record.get("currency"))))
+        self.stage.append(self.stages.code(record.get("stage")))
+        self.company.append(self.companies.code(record.get("company_name")))
+        for name in self._competitor_names(record.get("competitors")):
+            self.competitor_row.append(row)
+            self.competitor_code.append(self.competitors.code(name))
+            self.competitor_live.append(True)
+        self._cache.clear()
+
+    def update(self, pos, record, fields):
+        """
+        Patch row pos for a pending update of `fields`.
+        """
+        if "value" in fields:
+            self.value.data[pos] = _amount(fields["value"])
+        if "currency" in fields:
+            self.currency.data[pos] = self.currencies.code(_currency(fields["currency"]))
+        if "stage" in fields:
+            self.stage.data[pos] = self.stages.code(fields["stage"])
+        if "company_name" in fields:
+            self.company.data[pos] = self.companies.code(fields["company_name"])
+        if "competitors" in fields:
+            names = self._competitor_names(fields["competitors"])
+            if names != self._competitor_names(record.get("competitors")):
+                # Retire the row's old entries (a scan of the entries,
+                # only when the list actually changed) and append the new
+                live = self.competitor_live.view()
+                live[self.competitor_row.view() == pos] = False
+                for name in names:
+                    self.competitor_row.append(pos)
+                    self.competitor_code.append(self.competitors.code(name))
+                    self.competitor_live.append(True)
+        self._cache.clear()
+
+    # ---------------- queries ----------------
+
+    def _cached(self, key, compute):
+        if key not in self._cache:
+            self._cache[key] = compute()
+        return self._cache[key]
+
+    def _derived(self):
+        """
+        Per-row value in the base currency (NaN if unknown), won and lost.
+        """
+        def compute():
+            base = FX_RATES.get(BASE_CURRENCY)
+            if base is None:
+                raise ValueError(f"No exchange rate for the base currency {BASE_CURRENCY}")
+            factors = np.array([FX_RATES.get(c, math.nan) / base for c in self.currencies.labels]
+                               or [math.nan])
+            won_stage = np.array([_stage_key(s) in WON_STAGES for s in self.stages.labels] or [False])
+            lost_stage = np.array([_stage_key(s) in LOST_STAGES for s in self.stages.labels] or [False])
+            stage = self.stage.view()
+            return (self.value.view() * factors[self.currency.view()],
+                    won_stage[stage], lost_stage[stage])
+        return self._cached("derived", compute)
+
+    def summary(self):
+        """
+        Totals over all deals, in the base currency where converted:
+        pipeline (open deals), won and lost value, win rate, and
+        per-currency totals in their own currency too.
+        """
+        def compute():
+            converted, won, lost = self._derived()
+            value = self.value.view()
+            priced = ~np.isnan(value)
+            known = ~np.isnan(converted)
+            amounts = np.where(known, converted, 0.0)
+            open_ = ~(won | lost)
+
+            n = len(self.currencies.labels)
+            codes = self.currency.view()
+            deals = np.bincount(codes, minlength=n)
+            native = np.bincount(codes, weights=np.where(priced, value, 0.0), minlength=n)
+            in_base = np.bincount(codes, weights=amounts, minlength=n)
+            by_currency = [
+                {"currency": self.currencies.labels[i], "deals": int(deals[i]),
+                 "value": round(float(native[i]), 2),
+                 "value_base": round(float(in_base[i]), 2) if FX_RATES.get(self.currencies.labels[i]) else None}
+                for i in np.argsort(-native, kind="stable") if deals[i]
+            ]
+
+            n_won, n_lost = int(won.sum()), int(lost.sum())
+            return {
+                "base_currency": BASE_CURRENCY,
+                "deals": len(self),
+                "open_deals": int(open_.sum()),
+                "pipeline_value": round(float(amounts[open_].sum()), 2),
+                "won_value": round(float(amounts[won].sum()), 2),
+                "lost_value": round(float(amounts[lost].sum()), 2),
+                "total_value": round(float(amounts.sum()), 2),
+                "won": n_won,
+                "lost": n_lost,
+                "win_rate": round(n_won / (n_won + n_lost), 4) if n_won + n_lost else None,
+                "unpriced": int((~priced).sum()),
+                "unconverted": int((priced & ~known).sum()),
+                "by_currency": by_currency,
+            }
+        return self._cached("summary", compute)
+
+    def group_by(self, by, limit=None, open_only=False):
+        """
+        [{by: label, "deals", "value", "won", "lost", "win_rate"}] for
+        the stage, company or competitor groups, largest value (in the
+        base currency) first. For competitors, a deal counts once for
+        every competitor named on it, and win_rate is the rate against
+        that competitor.
+        """
+        if by not in GROUPS:
+            raise ValueError(f"Unknown group {by!r}; expected one of {', '.join(GROUPS)}")
+
+        def compute():
+            converted, won, lost = self._derived()
+            if by == "competitor":
+                live = self.competitor_live.view()
+                rows = self.competitor_row.view()[live]
+                codes = self.competitor_code.view()[live]
+                labels = self.competitors.labels
+            else:
+                rows = None
+                codes = (self.stage if by == "stage" else self.company).view()
+                labels = (self.stages if by == "stage" else self.companies).labels
+
+            amounts = np.where(np.isnan(converted), 0.0, converted)
+            if rows is not None:
+                amounts, won, lost = amounts[rows], won[rows], lost[rows]
+            if open_only:
+                keep = ~(won | lost)
+                codes, amounts, won, lost = codes[keep], amounts[keep], won[keep], lost[keep]
+
+            n = len(labels)
+            deals = np.bincount(codes, minlength=n)
+            value = np.bincount(codes, weights=amounts, minlength=n)
+            n_won = np.bincount(codes, weights=won, minlength=n)
+            n_lost = np.bincount(codes, weights=lost, minlength=n)
+            order = [i for i in np.lexsort((-deals, -value)) if deals[i]]
+            return [
+                {by: labels[i], "deals": int(deals[i]), "value": round(float(value[i]), 2),
+                 "won": int(n_won[i]), "lost": int(n_lost[i]),
+                 "win_rate": round(float(n_won[i] / (n_won[i] + n_lost[i])), 4) if n_won[i] + n_lost[i] else None}
+                for i in order
+            ]
+        groups = self._cached(("group", by, open_only), compute)
+        return groups[:limit] if limit is not None else groups
+
+
+# ---------------- queries over a store ----------------
+
+def summary(store):
+    """
+    DealColumns.summary() for the store's deals, with the revision it
+    reflects.
+    """
+    with store.lock:
+        columns = store.deal_columns()
+        return dict(columns.summary(), revision=store.revision)
+
+
+def pipeline(store, by="stage", limit=None, open_only=False):
+    """
+    Deals grouped by stage, company or competitor (see DealColumns.group_by).
+    """
+    with store.lock:
+        columns = store.deal_columns()
+        groups = columns.group_by(by, limit, open_only)
+        return {"by": by, "base_currency": BASE_CURRENCY, "open_only": open_only,
+                "groups": groups, "revision": store.revision}
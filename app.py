@@ -1,11 +1,8 @@
-import gradio as gr
 import json
 
 # Import all backend CRM logic from crm.py
-from crm import (
-    load_companies, load_contacts, load_deals, load_meetings,
-    process_meeting, apply_actions
-)
+from crm import process_meeting, apply_actions
+from store import get_store
 
 
 # ============================================================
@@ -13,21 +10,15 @@ from crm import (
 # ============================================================
 def run_extraction(meeting_text, company_name, contact_name):
 
-    # Load CRM databases
-    CRM_COMPANIES = load_companies()
-    CRM_CONTACTS  = load_contacts()
-    CRM_DEALS     = load_deals()
-    CRM_MEETINGS  = load_meetings()
+    # CRM databases, served from memory and reloaded only if changed on disk
+    store = get_store()
 
     # Run extraction pipeline
     result = process_meeting(
         meeting_text,
         company_name,
         contact_name,
-        CRM_COMPANIES,
-        CRM_CONTACTS,
-        CRM_DEALS,
-        CRM_MEETINGS
+        store=store
     )
 
     return json.dumps(result, indent=2)
@@ -52,18 +43,14 @@ def run_apply(gpt_json_text):
         return "❌ No extraction JSON provided", ""
 
     # Apply CRM updates
-    temp_map = apply_actions(gpt_json)
-
-    updated_state = {
-        "companies": load_companies(),
-        "contacts":  load_contacts(),
-        "deals":     load_deals(),
-        "meetings":  load_meetings()
-    }
+    store = get_store()
+    applied = apply_actions(gpt_json, store=store)
 
     return (
-        temp_map,                # ID mapping
-        updated_state            # updated CRM database
+        {"mapping": applied["mapping"],           # ID mapping + unknown existing IDs
+         "unknown_ids": applied["unknown_ids"],
+         "conflicts": applied["conflicts"]},
+        dict(applied["changed"], revision=applied["revision"])  # records this apply touched
     )
 
 
@@ -72,39 +59,67 @@ def run_apply(gpt_json_text):
 # GRADIO UI
 # ============================================================
 
-with gr.Blocks(title="CRM Data Filler Agent") as demo:
+def build_demo():
+    """
+    The Gradio app; gradio is only imported here, so importing this
+    module for run_extraction/run_apply stays cheap.
+    """
+    import gradio as gr
 
-    gr.Markdown("""
-    # 💼 CRM Data Filler Agent  
-    Paste your meeting notes, and the AI will extract **Contacts**, **Companies**, **Deals**  
-    and automatically update your CRM JSON files.
-    """)
+    with gr.Blocks(title="CRM Data Filler Agent") as demo:
 
-    with gr.Row():
-        meeting_text = gr.Textbox(label="Meeting Summary", lines=20, placeholder="Paste meeting text here...")
-        with gr.Column():
-            company_name = gr.Textbox(label="Company Mentioned in Meeting")
-            contact_name = gr.Textbox(label="Primary Contact Name")
+        gr.Markdown("""
+        # 💼 CRM Data Filler Agent  
+        Paste your meeting notes, and the AI will extract **Contacts**, **Companies**, **Deals**  
+        and automatically update your CRM JSON files.
+        """)
 
-    btn_extract = gr.Button("🔍 Extract CRM Entities")
-    extraction_output = gr.JSON(label="Extracted CRM JSON")
+        with gr.Row():
+            meeting_text = gr.Textbox(label="Meeting Summary", lines=20, placeholder="Paste meeting text here...")
+            with gr.Column():
+                company_name = gr.Textbox(label="Company Mentioned in Meeting")
+                contact_name = gr.Textbox(label="Primary Contact Name")
 
-    btn_apply = gr.Button("💾 Apply to CRM (Update JSON Files)")
-    id_mapping_output = gr.JSON(label="Temp → Real ID Mapping")
-    updated_crm_output = gr.JSON(label="Updated CRM State")
+        btn_extract = gr.Button("🔍 Extract CRM Entities")
+        extraction_output = gr.JSON(label="Extracted CRM JSON")
 
-    # BUTTON EVENTS
-    btn_extract.click(
-        run_extraction,
-        inputs=[meeting_text, company_name, contact_name],
-        outputs=[extraction_output]
-    )
+        btn_apply = gr.Button("💾 Apply to CRM (Update JSON Files)")
+        id_mapping_output = gr.JSON(label="Temp → Real ID Mapping")
+        updated_crm_output = gr.JSON(label="Updated CRM Records")
 
-    btn_apply.click(
-        run_apply,
-        inputs=[extraction_output],
-        outputs=[id_mapping_output, updated_crm_output]
-    )
+        # BUTTON EVENTS
+        btn_extract.click(
+            run_extraction,
+            inputs=[meeting_text, company_name, contact_name],
+            outputs=[extraction_output]
+        )
+
+        btn_apply.click(
+            run_apply,
+            inputs=[extraction_output],
+            outputs=[id_mapping_output, updated_crm_output]
+        )
+
+    return demo
+
+
+_demo = None
+
+
+def __getattr__(name):
+    # `app.demo` (what `gradio app.py` reload mode looks up) is built on
+    # first access instead of at import
+    global _demo
+    if name == "demo":
+        if _demo is None:
+            _demo = build_demo()
+        return _demo
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def main():
+    build_demo().launch()
 
 
-demo.launch()
+if __name__ == "__main__":
+    main()
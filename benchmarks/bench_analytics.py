@@ -0,0 +1,175 @@
+"""
+Pipeline analytics at scale: Python loops vs. NumPy columns.
+
+    python benchmarks/bench_analytics.py --deals 1000000
+
+"before" answers each question the way the notebook did, with a loop
+over the list of deal dicts. "after" builds analytics.DealColumns once
+and answers with vectorized group-bys; "cached" asks again without any
+change in between. Last, a handful of deals is updated through
+apply_actions and the next query is timed against a full rebuild, to
+show the columns being patched instead of rebuilt.
+"""
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("OPENAI_API_KEY", "offline-benchmark")
+
+import analytics
+from crm import apply_actions
+from store import CRMStore
+
+STAGES = ["Lead", "Discovery", "Demo", "Proposal", "Negotiation", "ClosedWon", "ClosedLost"]
+CURRENCIES = ["USD", "EUR", "GBP", "INR", "AUD", None]
+COMPETITORS = ["Salesforce", "HubSpot", "Zoho", "Freshworks", "Pipedrive", "Marketo", "Dynamics"]
+
+
+class InMemoryStore(CRMStore):
+    def commit(self):
+        pass
+
+
+def make_deals(rng, n, companies):
+    return [{"deal_id": f"D-{3001 + i}", "company_name": f"Company {rng.randrange(companies)}",
+             "deal_name": f"Deal {i}",
+             "value": rng.randrange(1000, 2000000) if rng.random() > 0.05 else None,
+             "currency": rng.choice(CURRENCIES), "stage": rng.choice(STAGES),
+             "timeline": None, "next_steps": None,
+             "competitors": rng.sample(COMPETITORS, rng.randrange(3))}
+            for i in range(n)]
+
+
+# ---------------- the notebook way ----------------
+
+def _base_value(deal):
+    value = analytics._amount(deal.get("value"))
+    rate = analytics.FX_RATES.get(analytics._currency(deal.get("currency")))
+    if math.isnan(value) or rate is None:
+        return 0.0
+    return value * rate / analytics.FX_RATES[analytics.BASE_CURRENCY]
+
+
+def loop_group_by(deals, by):
+    groups = {}
+    for deal in deals:
+        if by == "competitor":
+            keys = analytics.DealColumns._competitor_names(deal.get("competitors"))
+        else:
+            keys = [deal.get("stage" if by == "stage" else "company_name")]
+        stage = analytics._stage_key(deal.get("stage"))
+        for key in keys:
+            g = groups.setdefault(key, {"deals": 0, "value": 0.0, "won": 0, "lost": 0})
+            g["deals"] += 1
+            g["value"] += _base_value(deal)
+            g["won"] += stage in analytics.WON_STAGES
+            g["lost"] += stage in analytics.LOST_STAGES
+    return groups
+
+
+def loop_summary(deals):
+    totals = {"pipeline": 0.0, "won": 0, "lost": 0}
+    for deal in deals:
+        stage = analytics._stage_key(deal.get("stage"))
+        if stage in analytics.WON_STAGES:
+            totals["won"] += 1
+        elif stage in analytics.LOST_STAGES:
+            totals["lost"] += 1
+        else:
+            totals["pipeline"] += _base_value(deal)
+    return totals
+
+
+# ---------------- runs ----------------
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def check(loop_groups, groups, by):
+    """
+    Same groups, counts and (to rounding) values from both ways.
+    """
+    if len(loop_groups) != len(groups):
+        return False
+    for g in groups:
+        expected = loop_groups[g[by]]
+        if (g["deals"], g["won"], g["lost"]) != (expected["deals"], expected["won"], expected["lost"]) \
+                or not math.isclose(g["value"], expected["value"], rel_tol=1e-9, abs_tol=0.01):
+            return False
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--deals", type=int, default=1000000)
+    parser.add_argument("--companies", type=int, default=50000)
+    parser.add_argument("--updates", type=int, default=20, help="deals changed by the incremental run")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    deals = make_deals(rng, args.deals, args.companies)
+    print(f"{args.deals:,} deals, {args.companies:,} companies\n")
+
+    print(f"{'query':<22} {'before':>10} {'after':>10} {'cached':>10}   speedup  same")
+    columns, build = timed(analytics.DealColumns, deals)
+    print(f"{'build columns':<22} {'':>10} {build * 1000:>8.0f}ms")
+
+    _, loop_time = timed(loop_summary, deals)
+    _, first = timed(columns.summary)
+    _, again = timed(columns.summary)
+    print(f"{'summary':<22} {loop_time * 1000:>8.0f}ms {first * 1000:>8.1f}ms {again * 1e6:>8.1f}us"
+          f"   {loop_time / first:>6.0f}x")
+
+    for by in analytics.GROUPS:
+        loop_groups, loop_time = timed(loop_group_by, deals, by)
+        groups, first = timed(columns.group_by, by)
+        _, again = timed(columns.group_by, by)
+        print(f"{'by ' + by:<22} {loop_time * 1000:>8.0f}ms {first * 1000:>8.1f}ms {again * 1e6:>8.1f}us"
+              f"   {loop_time / first:>6.0f}x  {'yes' if check(loop_groups, groups, by) else 'NO'}")
+
+    # Incremental: a few deals change through apply_actions
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "deals.json")
+        with open(path, "w") as f:
+            json.dump(deals, f)
+        del deals, columns
+        store = InMemoryStore({"deals": path, "companies": os.path.join(tmp, "companies.json"),
+                               "contacts": os.path.join(tmp, "contacts.json"),
+                               "meetings": os.path.join(tmp, "meetings.json")})
+        store.field_index("deals", "deal_id")
+        _, build = timed(store.deal_columns)
+        analytics.pipeline(store, "competitor")
+
+        payload = {"companies": [], "contacts": [], "actions": [], "deals": [
+            {"temp_id": f"d{i + 1}", "existing_id": f"D-{3001 + rng.randrange(args.deals)}",
+             "name": f"Updated {i}", "value": rng.randrange(1000, 2000000), "currency": "EUR",
+             "stage": "ClosedWon", "timeline": None, "next_steps": None, "competitors": ["HubSpot"]}
+            for i in range(args.updates)
+        ]}
+        _, apply_time = timed(lambda: apply_actions(payload, store=store))
+        _, patched = timed(analytics.pipeline, store, "competitor")
+        patched_groups = analytics.pipeline(store, "competitor")["groups"]
+        rebuilt_columns, rebuild = timed(analytics.DealColumns, store.deals)
+        rebuilt_groups, query = timed(rebuilt_columns.group_by, "competitor")
+        same = rebuilt_groups == patched_groups
+
+        print(f"\nincremental: {args.updates} deals updated by apply_actions ({apply_time * 1000:.0f}ms)")
+        print(f"  first build            {build * 1000:>8.0f}ms")
+        print(f"  next query, patched    {patched * 1000:>8.1f}ms")
+        print(f"  next query, rebuilt    {(rebuild + query) * 1000:>8.0f}ms   "
+              f"(same result: {'yes' if same else 'NO'})")
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
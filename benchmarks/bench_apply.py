@@ -0,0 +1,209 @@
+"""
+apply_actions throughput (entities/sec): table scans vs. store primary keys.
+
+    python benchmarks/bench_apply.py --size 100000 --payloads 20
+
+"before" replays the original apply_actions logic (next_id rescans and a
+full-list loop per update); "after" is crm.apply_actions on a CRMStore.
+Disk writes are left out of both so only the in-memory apply is timed.
+
+A second run writes to real JSON files: one apply_actions (and commit)
+per payload vs. a single apply_actions_bulk for all of them.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("OPENAI_API_KEY", "offline-benchmark")
+
+from crm import apply_actions, apply_actions_bulk
+from store import CRMStore, JsonStorage
+
+
+def next_id(prefix, existing_list, id_field):
+    # The id allocation apply_actions used before IdAllocator: a full rescan
+    nums = []
+    for item in existing_list:
+        if id_field in item:
+            try:
+                nums.append(int(item[id_field].split("-")[1]))
+            except:
+                pass
+    new_number = max(nums or [2000]) + 1
+    return f"{prefix}-{new_number}"
+
+
+class InMemoryStore(CRMStore):
+    def commit(self):
+        pass
+
+
+def make_data(size):
+    companies = [{"company_id": f"CO-{2001 + i}", "name": f"Company {i}",
+                  "industry": "SaaS", "size": "SMB", "location": "Berlin"}
+                 for i in range(size)]
+    contacts = [{"contact_id": f"C-{1001 + i}", "name": f"Person {i}",
+                 "job_title": "CTO", "email": None, "phone": None,
+                 "decision_power": "Unknown", "company_name": f"Company {i}"}
+                for i in range(size)]
+    deals = [{"deal_id": f"D-{3001 + i}", "company_name": f"Company {i}",
+              "deal_name": f"Deal {i}", "value": 1000, "currency": "USD",
+              "stage": "Discovery", "timeline": "Q1", "next_steps": "Call",
+              "competitors": []}
+             for i in range(size)]
+    return companies, contacts, deals
+
+
+def make_payload(rng, size, n_companies=10, n_contacts=25, n_deals=15):
+    def existing(prefix, base):
+        return None if rng.random() < 0.5 else f"{prefix}-{base + rng.randrange(size)}"
+
+    return {
+        "companies": [{"temp_id": f"co{i + 1}", "existing_id": existing("CO", 2001),
+                       "name": f"Co {i}", "industry": "SaaS", "size": "Mid",
+                       "location": "Pune"} for i in range(n_companies)],
+        "contacts": [{"temp_id": f"c{i + 1}", "existing_id": existing("C", 1001),
+                      "name": f"Contact {i}", "job_title": "CFO", "email": None,
+                      "phone": None, "decision_power": "yes"} for i in range(n_contacts)],
+        "deals": [{"temp_id": f"d{i + 1}", "existing_id": existing("D", 3001),
+                   "name": f"Deal {i}", "value": 5000, "currency": "EUR",
+                   "stage": "Proposal", "timeline": "Q2", "next_steps": "Demo",
+                   "competitors": ["HubSpot"]} for i in range(n_deals)],
+        "actions": []
+    }
+
+
+def legacy_apply(gpt_json, companies, contacts, deals):
+    """
+    The pre-store apply_actions, minus its load/save calls.
+    """
+    temp_map = {}
+    for co in gpt_json["companies"]:
+        if co["existing_id"] is None:
+            new_id = next_id("CO", companies, "company_id")
+            companies.append({"company_id": new_id, "name": co["name"],
+                              "industry": co["industry"], "size": co["size"],
+                              "location": co["location"]})
+            temp_map[co["temp_id"]] = new_id
+        else:
+            for c in companies:
+                if c["company_id"] == co["existing_id"]:
+                    c.update({"name": co["name"], "industry": co["industry"],
+                              "size": co["size"], "location": co["location"]})
+                    temp_map[co["temp_id"]] = co["existing_id"]
+    for ct in gpt_json["contacts"]:
+        if ct["existing_id"] is None:
+            new_id = next_id("C", contacts, "contact_id")
+            contacts.append({"contact_id": new_id, "name": ct["name"],
+                             "job_title": ct["job_title"], "email": ct["email"],
+                             "phone": ct["phone"], "decision_power": ct["decision_power"],
+                             "company_id": temp_map.get("co1")})
+            temp_map[ct["temp_id"]] = new_id
+        else:
+            for c in contacts:
+                if c["contact_id"] == ct["existing_id"]:
+                    c.update({"name": ct["name"], "job_title": ct["job_title"],
+                              "email": ct["email"], "phone": ct["phone"],
+                              "decision_power": ct["decision_power"]})
+                    temp_map[ct["temp_id"]] = ct["existing_id"]
+    for dl in gpt_json["deals"]:
+        if dl["existing_id"] is None:
+            new_id = next_id("D", deals, "deal_id")
+            deals.append({"deal_id": new_id, "company_name": gpt_json["companies"][0]["name"],
+                          "deal_name": dl["name"], "value": dl["value"],
+                          "currency": dl["currency"], "stage": dl["stage"],
+                          "timeline": dl["timeline"], "next_steps": dl["next_steps"],
+                          "competitors": dl["competitors"]})
+            temp_map[dl["temp_id"]] = new_id
+        else:
+            for d in deals:
+                if d["deal_id"] == dl["existing_id"]:
+                    d.update({"deal_name": dl["name"], "value": dl["value"],
+                              "currency": dl["currency"], "stage": dl["stage"],
+                              "timeline": dl["timeline"], "next_steps": dl["next_steps"],
+                              "competitors": dl["competitors"]})
+                    temp_map[dl["temp_id"]] = dl["existing_id"]
+    return temp_map
+
+
+def write_tables(tmp, size):
+    paths = {}
+    for name, records in zip(("companies", "contacts", "deals"), make_data(size)):
+        paths[name] = os.path.join(tmp, f"{name}.json")
+        with open(paths[name], "w") as f:
+            json.dump(records, f)
+    return paths
+
+
+def run_bulk(size, payloads):
+    """
+    Seconds for per-payload commits vs. one bulk commit, on disk.
+    """
+    timings = []
+    for bulk in (False, True):
+        with tempfile.TemporaryDirectory() as tmp:
+            store = CRMStore(storage=JsonStorage(write_tables(tmp, size)))
+            store.companies, store.contacts, store.deals
+            start = time.perf_counter()
+            if bulk:
+                apply_actions_bulk(payloads, store=store)
+            else:
+                for payload in payloads:
+                    apply_actions(payload, store=store)
+            timings.append(time.perf_counter() - start)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--size", type=int, default=100000,
+                        help="records per table")
+    parser.add_argument("--payloads", type=int, default=20)
+    parser.add_argument("--bulk-size", type=int, default=10000,
+                        help="records per table for the on-disk bulk run")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    payloads = [make_payload(rng, args.size) for _ in range(args.payloads)]
+    entities = sum(len(p["companies"]) + len(p["contacts"]) + len(p["deals"])
+                   for p in payloads)
+
+    companies, contacts, deals = make_data(args.size)
+    start = time.perf_counter()
+    for payload in payloads:
+        legacy_apply(payload, companies, contacts, deals)
+    before = time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = write_tables(tmp, args.size)
+
+        store = InMemoryStore(paths)
+        for name in paths:
+            store.field_index(name, {"companies": "company_id",
+                                     "contacts": "contact_id",
+                                     "deals": "deal_id"}[name])
+
+        start = time.perf_counter()
+        for payload in payloads:
+            apply_actions(payload, store=store)
+        after = time.perf_counter() - start
+
+    print(f"{args.size:,} records per table, {args.payloads} payloads, {entities} entities")
+    print(f"  before (scans)        {entities / before:>12,.0f} entities/s")
+    print(f"  after (primary keys)  {entities / after:>12,.0f} entities/s"
+          f"   ({before / after:.0f}x)")
+
+    per_call, bulk = run_bulk(args.bulk_size, payloads)
+    print(f"\n{args.bulk_size:,} records per table on disk, {args.payloads} payloads")
+    print(f"  one commit per payload  {per_call:>8.2f} s")
+    print(f"  apply_actions_bulk      {bulk:>8.2f} s   ({per_call / bulk:.0f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""
+Entity resolution over synthetic contacts: dedup.build_plan with one
+worker vs. a process pool.
+
+    python benchmarks/bench_dedup.py --contacts 1000000 --workers 1 8
+
+Builds companies and contacts with known duplicates (typos, missing or
+reformatted email/phone, near-duplicate company names), runs the
+planner and prints pairs/sec plus precision and recall of the merges
+against the known duplicates.
+"""
+import argparse
+import os
+import random
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import dedup
+
+SYLLABLES = ["an", "ba", "ri", "ko", "mel", "sha", "dev", "lu", "wei", "pat",
+             "ra", "jo", "kim", "tor", "na", "el", "sa", "mi", "ha", "zen",
+             "vik", "ol", "gre", "sun", "tam", "ber", "chi", "dou", "fa", "gu",
+             "hel", "ing", "ja", "kel", "lin", "mor", "nob", "ost", "per", "qui",
+             "rus", "sel", "tin", "ul", "ven", "wal", "xi", "yor", "zu", "ash"]
+SUFFIXES = ["Consulting", "Analytics", "Systems", "Labs", "AI", "Energy",
+            "Manufacturing", "Tech", "Group", "Partners"]
+
+
+def _word(rng, parts):
+    return "".join(rng.choice(SYLLABLES) for _ in range(parts)).capitalize()
+
+
+def typo(rng, name):
+    chars = list(name)
+    i = rng.randrange(1, len(chars))
+    op = rng.random()
+    if op < 0.33:
+        chars.pop(i)
+    elif op < 0.66:
+        chars.insert(i, rng.choice(string.ascii_lowercase))
+    else:
+        chars[i] = rng.choice(string.ascii_lowercase)
+    return "".join(chars)
+
+
+def make_data(rng, n_contacts, n_companies, dup_rate):
+    """
+    (companies, contacts, truth), truth mapping each record id to the
+    id of the entity it is a copy of.
+    """
+    companies, truth, names = [], {}, set()
+    for i in range(n_companies):
+        name = None
+        while name is None or name in names:
+            name = f"{_word(rng, rng.randint(2, 3))} {rng.choice(SUFFIXES)}"
+        names.add(name)
+        companies.append({"company_id": f"CO-{i}", "name": name, "industry": None,
+                          "size": None, "location": None})
+        truth[f"CO-{i}"] = f"CO-{i}"
+    distinct = companies[:]
+    for i in range(int(n_companies * dup_rate / 5)):
+        original = rng.choice(distinct)
+        copy_id = f"CO-{n_companies + i}"
+        companies.append({"company_id": copy_id, "name": original["name"] + rng.choice([" Inc", " Ltd", ""]),
+                          "industry": rng.choice(["SaaS", "Energy"]), "size": None, "location": None})
+        truth[copy_id] = truth[original["company_id"]]
+
+    contacts = []
+    originals = int(n_contacts / (1 + dup_rate))
+    for i in range(originals):
+        first, last = _word(rng, 2), _word(rng, rng.randint(2, 3))
+        company = rng.choice(distinct)
+        contacts.append({
+            "contact_id": f"C-{i}",
+            "name": f"{first} {last}",
+            "job_title": None,
+            "email": f"{first}.{last}{i}@example.com".lower() if rng.random() < 0.6 else None,
+            "phone": f"+1-{rng.randrange(10 ** 9, 10 ** 10)}" if rng.random() < 0.4 else None,
+            "decision_power": "Unknown",
+            "company_name": company["name"]
+        })
+        truth[f"C-{i}"] = f"C-{i}"
+    for i in range(originals, n_contacts):
+        original = contacts[rng.randrange(originals)]
+        roll = rng.random()
+        copy = dict(original, contact_id=f"C-{i}", job_title=rng.choice(["CTO", "CMO", None]))
+        if roll < 0.4:
+            copy["name"] = typo(rng, original["name"])
+            copy["email"] = None
+        elif roll < 0.7:
+            copy["email"] = (original["email"] or "").upper() or None
+            copy["phone"] = None
+        elif original["phone"]:
+            copy["phone"] = original["phone"].replace("+1-", "(1) ")
+        contacts.append(copy)
+        truth[f"C-{i}"] = original["contact_id"]
+    rng.shuffle(contacts)
+    return companies, contacts, truth
+
+
+def accuracy(clusters, records, id_field, truth):
+    """
+    (precision, recall) of the merged pairs (kept, merged) against truth.
+    """
+    merged = correct = 0
+    for cluster in clusters:
+        for other in cluster["merge"]:
+            merged += 1
+            correct += truth[other] == truth[cluster["keep"]]
+    ids = [r[id_field] for r in records]
+    expected = len(ids) - len({truth[i] for i in ids})
+    return (correct / merged if merged else 1.0), (correct / expected if expected else 1.0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--contacts", type=int, default=1000000)
+    parser.add_argument("--companies", type=int, default=50000)
+    parser.add_argument("--dup-rate", type=float, default=0.1, help="share of contacts that are copies")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, dedup.DEDUP_WORKERS])
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    start = time.perf_counter()
+    companies, contacts, truth = make_data(rng, args.contacts, args.companies, args.dup_rate)
+    print(f"{len(contacts):,} contacts, {len(companies):,} companies "
+          f"(generated in {time.perf_counter() - start:.1f}s)\n")
+
+    print(f"{'workers':>7}  {'dataset':<10}{'pairs':>12}{'seconds':>9}{'pairs/sec':>12}"
+          f"{'merged':>9}{'precision':>11}{'recall':>8}")
+    for workers in args.workers:
+        start = time.perf_counter()
+        plan = dedup.build_plan(companies, contacts, workers=workers)
+        total = time.perf_counter() - start
+        for name, records, id_field in (("companies", companies, "company_id"),
+                                        ("contacts", contacts, "contact_id")):
+            s = plan["stats"][name]
+            precision, recall = accuracy(plan[name], records, id_field, truth)
+            print(f"{workers:>7}  {name:<10}{s['pairs']:>12,}{s['seconds']:>9.2f}"
+                  f"{s['pairs_per_sec'] or 0:>12,}{s['merged']:>9,}{precision:>11.4f}{recall:>8.4f}")
+        print(f"{'':>7}  total {total:.1f}s\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""
+Resident memory of the CRM data: json.load dicts vs. compact records.
+
+    python benchmarks/bench_memory.py --records 1000000
+
+Writes synthetic datasets shaped like the bundled JSON files, then loads
+each one twice under tracemalloc: as the list of dicts JsonStorage
+parses (what the store used to hold) and through CRMStore, which keeps
+records.Record objects. Prints the memory held after each load, its
+peak, and the ratio.
+"""
+import argparse
+import gc
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from store import DATASETS, CRMStore, JsonStorage
+
+# Share of the records in each dataset
+SHARES = {"companies": 0.1, "contacts": 0.3, "deals": 0.3, "meetings": 0.3}
+
+FIRST = ["Liu", "Priya", "Rajesh", "Anna", "Tom", "Sara", "Kenji", "Maria", "Omar", "Elena",
+         "David", "Aisha", "Lukas", "Mei", "Carlos", "Fatima", "John", "Nina", "Ravi", "Olga"]
+LAST = ["Wei", "Shah", "Kumar", "Schmidt", "Brown", "Rossi", "Tanaka", "Garcia", "Haddad",
+        "Novak", "Smith", "Khan", "Weber", "Chen", "Lopez", "Ali", "Doe", "Petrov", "Iyer", "Ivanova"]
+WORDS = ["Mercury", "Nexora", "Blue", "Peak", "Orbit", "Quantum", "Green", "Silver", "Vertex",
+         "Nova", "Apex", "Cedar", "Delta", "Ember", "Falcon", "Harbor", "Iris", "Juniper"]
+SUFFIXES = ["Consulting", "Analytics", "Systems", "Labs", "AI", "Energy", "Manufacturing"]
+INDUSTRIES = ["SaaS", "Energy", "Manufacturing", "Consulting", "Healthcare", "Retail", "Finance"]
+SIZES = ["SMB", "Mid", "Enterprise"]
+LOCATIONS = ["Berlin, Germany", "Mumbai, India", "Bengaluru, India", "London, UK",
+             "Austin, USA", "Singapore", "Toronto, Canada", "Sydney, Australia"]
+TITLES = ["CTO", "CMO", "COO", "CEO", "VP Sales", "Engineering Manager", "Procurement Manager"]
+POWER = ["yes", "no", "maybe", "Unknown"]
+STAGES = ["Lead", "Discovery", "Demo", "Proposal", "Negotiation", "ClosedWon", "ClosedLost"]
+CURRENCIES = ["USD", "EUR", "INR", "GBP", None]
+TIMELINES = ["next quarter", "this quarter", "within 6 months", "Q3", None]
+NEXT_STEPS = ["Follow-up meeting", "Send proposal", "Schedule demo", "Share pricing", None]
+COMPETITORS = ["Salesforce", "HubSpot", "Zoho", "Freshworks", "Pipedrive"]
+NEEDS = ["automation and analytics across marketing and sales", "pipeline visibility",
+         "lead routing", "customer support workflows"]
+
+
+def make_data(rng, n):
+    counts = {name: int(n * share) for name, share in SHARES.items()}
+    names = []
+    for i in range(counts["companies"]):
+        names.append(f"{rng.choice(WORDS)} {rng.choice(WORDS)}{i} {rng.choice(SUFFIXES)}")
+    companies = [{"company_id": f"CO-{2001 + i}", "name": name, "industry": rng.choice(INDUSTRIES),
+                  "size": rng.choice(SIZES), "location": rng.choice(LOCATIONS)}
+                 for i, name in enumerate(names)]
+
+    people = []
+    contacts = []
+    for i in range(counts["contacts"]):
+        first, last = rng.choice(FIRST), rng.choice(LAST)
+        company = rng.choice(names)
+        people.append((f"{first} {last}", company))
+        contacts.append({"contact_id": f"C-{1001 + i}", "name": f"{first} {last}",
+                         "job_title": rng.choice(TITLES),
+                         "email": f"{first}.{last}{i}@example.com".lower() if rng.random() < 0.6 else None,
+                         "phone": f"+91-{rng.randrange(10 ** 9, 10 ** 10)}" if rng.random() < 0.4 else None,
+                         "decision_power": rng.choice(POWER), "company_name": company})
+
+    deals = [{"deal_id": f"D-{3001 + i}", "company_name": company,
+              "deal_name": f"{company} - {rng.choice(TITLES)} Opportunity",
+              "value": rng.randrange(1000, 500000) if rng.random() < 0.7 else None,
+              "currency": rng.choice(CURRENCIES), "stage": rng.choice(STAGES),
+              "timeline": rng.choice(TIMELINES), "next_steps": rng.choice(NEXT_STEPS),
+              "competitors": rng.sample(COMPETITORS, rng.randrange(3))}
+             for i, company in enumerate(rng.choice(names) for _ in range(counts["deals"]))]
+
+    meetings = []
+    for i in range(counts["meetings"]):
+        person, company = rng.choice(people)
+        meetings.append({
+            "meeting_id": f"M-{4001 + i}", "contact_name": person, "company_name": company,
+            "timestamp": f"2025-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}T12:00:00Z",
+            "summary": (f"Had a meeting with {person}, {rng.choice(TITLES)} at {company}. "
+                        f"They are a {rng.choice(INDUSTRIES)} company (~{rng.choice(SIZES)} size) "
+                        f"based in {rng.choice(LOCATIONS)}. They need a solution to improve "
+                        f"{rng.choice(NEEDS)}. They are evaluating {rng.choice(COMPETITORS)} as an "
+                        f"alternative. Next: {rng.choice(NEXT_STEPS[:-1])}."),
+            "outcome": f"Meeting recap generated for {company}",
+            "deal_linked": f"D-{3001 + rng.randrange(max(1, counts['deals']))}" if rng.random() < 0.5 else None,
+        })
+    return {"companies": companies, "contacts": contacts, "deals": deals, "meetings": meetings}
+
+
+def traced(load):
+    """
+    (result, bytes held after load, peak bytes during it).
+    """
+    gc.collect()
+    tracemalloc.start()
+    result = load()
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, current, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--records", type=int, default=1000000)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = {name: os.path.join(tmp, spec[0]) for name, spec in DATASETS.items()}
+        start = time.perf_counter()
+        data = make_data(rng, args.records)
+        for name, records in data.items():
+            with open(paths[name], "w") as f:
+                json.dump(records, f)
+        counts = {name: len(records) for name, records in data.items()}
+        del data
+        print(f"{sum(counts.values()):,} records (generated in {time.perf_counter() - start:.1f}s)\n")
+
+        print(f"{'dataset':<10}{'records':>10}{'dicts':>11}{'records':>11}{'ratio':>7}"
+              f"{'bytes/rec':>16}{'peak':>19}")
+        totals = [0, 0]
+        for name in DATASETS:
+            dicts, before, before_peak = traced(lambda: JsonStorage(paths).load(name))
+            del dicts
+            store = CRMStore(paths)
+            compact, after, after_peak = traced(lambda: store.records(name))
+            del compact
+            store.close()
+            totals[0] += before
+            totals[1] += after
+            n = counts[name]
+            print(f"{name:<10}{n:>10,}{before / 2 ** 20:>9.1f}MB{after / 2 ** 20:>9.1f}MB"
+                  f"{before / after:>6.1f}x{before // n:>8} ->{after // n:>5}"
+                  f"{before_peak / 2 ** 20:>9.0f} ->{after_peak / 2 ** 20:>5.0f}MB")
+        print(f"{'total':<10}{sum(counts.values()):>10,}{totals[0] / 2 ** 20:>9.1f}MB"
+              f"{totals[1] / 2 ** 20:>9.1f}MB{totals[0] / totals[1]:>6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Linear fuzzy scan vs. NameIndex for find_company / find_contacts.
+
+    python benchmarks/bench_name_index.py --sizes 1000 100000 1000000
+
+Builds synthetic contact/company names, runs the same typo'd queries
+through both paths, checks the results are identical and prints
+per-query latency.
+"""
+import argparse
+import os
+import random
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("OPENAI_API_KEY", "offline-benchmark")
+
+from crm import find_company, find_contacts
+from name_index import NameIndex
+
+SYLLABLES = ["an", "ba", "ri", "ko", "mel", "sha", "dev", "lu", "wei", "pat",
+             "ra", "jo", "kim", "tor", "na", "el", "sa", "mi", "ha", "zen",
+             "vik", "ol", "gre", "sun", "tam", "ber", "chi", "dou", "fa", "gu",
+             "hel", "ing", "ja", "kel", "lin", "mor", "nob", "ost", "per", "qui",
+             "rus", "sel", "tin", "ul", "ven", "wal", "xi", "yor", "zu", "ash"]
+SUFFIXES = ["Consulting", "Analytics", "Systems", "Labs", "AI", "Energy",
+            "Manufacturing", "Tech", "Group", "Partners"]
+
+
+def _word(rng, parts):
+    return "".join(rng.choice(SYLLABLES) for _ in range(parts)).capitalize()
+
+
+def person_name(rng):
+    return f"{_word(rng, 2)} {_word(rng, rng.randint(2, 3))}"
+
+
+def company_name(rng):
+    return f"{_word(rng, rng.randint(2, 3))} {rng.choice(SUFFIXES)}"
+
+
+def typo(rng, name):
+    chars = list(name)
+    i = rng.randrange(len(chars))
+    op = rng.random()
+    if op < 0.33:
+        chars.pop(i)
+    elif op < 0.66:
+        chars.insert(i, rng.choice(string.ascii_lowercase))
+    else:
+        chars[i] = rng.choice(string.ascii_lowercase)
+    return "".join(chars)
+
+
+def timed(fn, queries):
+    start = time.perf_counter()
+    results = [fn(q) for q in queries]
+    return results, (time.perf_counter() - start) / len(queries)
+
+
+def run(size, n_queries, seed):
+    rng = random.Random(seed)
+    companies = [{"company_id": f"CO-{i}", "name": company_name(rng)}
+                 for i in range(size)]
+    contacts = [{"contact_id": f"C-{i}", "name": person_name(rng)}
+                for i in range(size)]
+
+    co_queries = [typo(rng, rng.choice(companies)["name"]) for _ in range(n_queries)]
+    ct_queries = [typo(rng, rng.choice(contacts)["name"]) for _ in range(n_queries)]
+
+    start = time.perf_counter()
+    co_index = NameIndex(companies)
+    ct_index = NameIndex(contacts)
+    build = time.perf_counter() - start
+
+    rows = []
+    for label, linear, indexed, queries in [
+        ("find_company",
+         lambda q: find_company(companies, q),
+         lambda q: find_company(companies, q, co_index),
+         co_queries),
+        ("find_contacts",
+         lambda q: find_contacts(contacts, q),
+         lambda q: find_contacts(contacts, q, index=ct_index),
+         ct_queries),
+    ]:
+        expected, t_linear = timed(linear, queries)
+        got, t_index = timed(indexed, queries)
+        if got != expected:
+            raise SystemExit(f"{label}: index results differ at size {size}")
+        rows.append((label, t_linear, t_index))
+
+    print(f"\n{size:,} records  (index build {build:.2f}s for both tables)")
+    print(f"  {'lookup':<14}{'linear ms':>12}{'index ms':>12}{'speedup':>10}")
+    for label, t_linear, t_index in rows:
+        print(f"  {label:<14}{t_linear * 1e3:>12.2f}{t_index * 1e3:>12.2f}"
+              f"{t_linear / t_index:>9.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 100000, 1000000])
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        run(size, args.queries, args.seed)
+
+
+if __name__ == "__main__":
+    main()
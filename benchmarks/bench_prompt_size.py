@@ -0,0 +1,54 @@
+"""
+Prompt size: build_crm_prompt vs. the compact, token-budgeted builder.
+
+    python benchmarks/bench_prompt_size.py --budget 3000
+
+Replays every bundled meeting as a new meeting against the bundled CRM
+files, builds both prompts from the same context and compares token
+counts. --long repeats each transcript to show the budget at work.
+"""
+import argparse
+import os
+import statistics
+import sys
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+sys.path.insert(0, ROOT)
+os.environ.setdefault("OPENAI_API_KEY", "offline-benchmark")
+
+from crm import build_crm_prompt, get_crm_context
+from prompts import build_compact_prompt, count_tokens, tokenizer_name
+from store import CRMStore, DATASETS
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--budget", type=int, default=3000)
+    parser.add_argument("--long", type=int, default=1,
+                        help="repeat each transcript this many times")
+    args = parser.parse_args()
+
+    store = CRMStore({name: os.path.join(ROOT, spec[0]) for name, spec in DATASETS.items()})
+
+    before, after, trimmed = [], [], 0
+    for meeting in store.meetings:
+        notes = " ".join([meeting["summary"]] * args.long)
+        company, contacts, deals, meetings = get_crm_context(
+            meeting["company_name"], meeting["contact_name"], store=store)
+
+        before.append(count_tokens(build_crm_prompt(notes, contacts, company, deals, meetings)))
+        _, report = build_compact_prompt(notes, contacts, company, deals, meetings,
+                                         budget=args.budget)
+        after.append(report["tokens"])
+        trimmed += bool(report["trimmed"])
+
+    print(f"{len(before)} meetings, tokenizer {tokenizer_name()}, budget {args.budget}")
+    print(f"  {'builder':<10}{'mean':>8}{'max':>8}{'total':>10}")
+    for label, counts in (("current", before), ("compact", after)):
+        print(f"  {label:<10}{statistics.mean(counts):>8.0f}{max(counts):>8}{sum(counts):>10}")
+    print(f"  compact prompts are {1 - sum(after) / sum(before):.0%} smaller; "
+          f"{trimmed} needed trimming to fit the budget")
+
+
+if __name__ == "__main__":
+    main()
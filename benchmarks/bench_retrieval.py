@@ -0,0 +1,164 @@
+"""
+Context retrieval at scale: last three meetings by company vs. the
+relevance index (retrieval.py).
+
+    python benchmarks/bench_retrieval.py --meetings 1000000
+
+Builds meetings for many companies, each meeting about one topic and
+some filed under a spelling variant of the company name. Each query is
+a new meeting about one topic at one company; the meetings that count
+as relevant are that company's earlier meetings on the same topic.
+Prints build, query and incremental-add latency, and recall@k of the
+current heuristic (crm.find_previous_meetings: the last k with the
+exact company name) against crm.find_relevant.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("OPENAI_API_KEY", "offline-benchmark")
+
+import retrieval
+from crm import find_previous_meetings, find_relevant
+from store import FieldIndex
+
+TOPICS = {
+    "pricing": "pricing quote discount budget licence seats invoice annual contract renewal cost",
+    "security": "security sso audit compliance soc2 encryption pentest gdpr access review",
+    "integration": "integration api webhook salesforce sync connector mapping sandbox migration data",
+    "onboarding": "onboarding training rollout admin setup workshop adoption champions kickoff users",
+    "support": "support tickets escalation outage sla response incident bug fix priority",
+    "analytics": "analytics dashboard reporting metrics forecast pipeline export kpi cohort charts",
+    "procurement": "procurement legal redlines msa vendor approval purchase order signature terms",
+    "expansion": "expansion upsell new team region department additional module growth headcount",
+}
+FILLER = ("meeting call discussed team next week follow up shared deck notes agreed "
+          "asked timeline update review plan quarter").split()
+SYLLABLES = ["an", "ba", "ri", "ko", "mel", "sha", "dev", "lu", "wei", "pat",
+             "ra", "jo", "kim", "tor", "na", "el", "sa", "mi", "ha", "zen"]
+SUFFIXES = ["Consulting", "Analytics", "Systems", "Labs", "AI", "Energy", "Tech", "Group"]
+
+
+def company_names(rng, n):
+    names = set()
+    while len(names) < n:
+        word = "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))).capitalize()
+        names.add(f"{word} {rng.choice(SUFFIXES)}")
+    return sorted(names)
+
+
+def variant(rng, name):
+    return rng.choice([name + " Inc", name + " Ltd", name.replace(" ", "  ", 1), name.upper()])
+
+
+def summary(rng, company, topic):
+    words = rng.sample(TOPICS[topic].split(), 5) + rng.sample(FILLER, 6)
+    rng.shuffle(words)
+    return f"Had a meeting at {company}. " + " ".join(words) + "."
+
+
+def make_meetings(rng, n, companies, variant_rate):
+    """
+    Meetings in the order they were held, each with a "topic" the
+    benchmark scores against (not part of the indexed text).
+    """
+    topics = list(TOPICS)
+    meetings = []
+    for i in range(n):
+        name = rng.choice(companies)
+        filed = variant(rng, name) if rng.random() < variant_rate else name
+        topic = rng.choice(topics)
+        meetings.append({"meeting_id": f"M-{i}", "company_name": filed, "company": name,
+                         "topic": topic, "summary": summary(rng, name, topic),
+                         "outcome": None, "contact_name": None})
+    return meetings
+
+
+def make_queries(rng, meetings, n):
+    queries = []
+    for _ in range(n):
+        m = rng.choice(meetings)
+        queries.append((m["company"], m["topic"], summary(rng, m["company"], m["topic"])))
+    return queries
+
+
+def percentile(times, p):
+    times = sorted(times)
+    return times[min(len(times) - 1, int(len(times) * p))]
+
+
+def recall(picked, company, topic, relevant, k):
+    wanted = relevant.get((company, topic), 0)
+    if not wanted:
+        return None
+    hits = sum(m["company"] == company and m["topic"] == topic for m in picked)
+    return hits / min(k, wanted)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--meetings", type=int, default=1000000)
+    parser.add_argument("--companies", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--variant-rate", type=float, default=0.1,
+                        help="share of meetings filed under a spelling variant")
+    parser.add_argument("-k", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    start = time.perf_counter()
+    companies = company_names(rng, args.companies)
+    meetings = make_meetings(rng, args.meetings, companies, args.variant_rate)
+    queries = make_queries(rng, meetings, args.queries)
+    relevant = {}
+    for m in meetings:
+        relevant[(m["company"], m["topic"])] = relevant.get((m["company"], m["topic"]), 0) + 1
+    print(f"{len(meetings):,} meetings, {len(companies):,} companies, {len(queries):,} queries "
+          f"(generated in {time.perf_counter() - start:.1f}s)\n")
+
+    start = time.perf_counter()
+    field_index = FieldIndex(meetings, "company_name")
+    field_build = time.perf_counter() - start
+    start = time.perf_counter()
+    index = retrieval.RetrievalIndex(meetings, retrieval.TEXT_FIELDS["meetings"])
+    build = time.perf_counter() - start
+    print(f"build: company field index {field_build:.1f}s, retrieval index {build:.1f}s "
+          f"({index.vectors.nbytes / 2 ** 20:.0f} MiB of vectors, dim {index.dim})\n")
+
+    rows = []
+    for label, pick in (
+        ("last k, exact company", lambda c, q: find_previous_meetings(meetings, c, field_index)[-args.k:]),
+        ("relevant k, by company", lambda c, q: find_relevant(meetings, index, q, c, args.k)),
+        ("relevant k, all meetings", lambda c, q: find_relevant(meetings, index, q, None, args.k)),
+    ):
+        times, scores = [], []
+        # The full scan touches every row, so a sample of queries will do
+        sample = queries if "all" not in label else queries[:20]
+        for company, topic, text in sample:
+            start = time.perf_counter()
+            picked = pick(company, text)
+            times.append(time.perf_counter() - start)
+            score = recall(picked, company, topic, relevant, args.k)
+            if score is not None:
+                scores.append(score)
+        rows.append((label, percentile(times, 0.5), percentile(times, 0.95), sum(scores) / len(scores)))
+
+    print(f"{'picker':<26}{'p50':>10}{'p95':>10}{'recall@' + str(args.k):>11}")
+    for label, p50, p95, score in rows:
+        print(f"{label:<26}{p50 * 1000:>8.2f}ms{p95 * 1000:>8.2f}ms{score:>11.3f}")
+
+    # Incremental: new meetings extend the index instead of rebuilding it
+    added = make_meetings(rng, 1000, companies, args.variant_rate)
+    start = time.perf_counter()
+    for m in added:
+        index.add(m)
+    per_add = (time.perf_counter() - start) / len(added)
+    print(f"\nincremental add: {per_add * 1e6:.0f}us per meeting (full rebuild {build:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+CRM context lookups and applies: JSON files in memory vs. SQLite backend.
+
+    python benchmarks/bench_sqlite.py --size 1000000 --queries 50
+
+Loads the same synthetic tables into a JSON-backed store and into a
+SQLite database, then times get_crm_context and a small apply_actions
+batch on both. Context results are checked for equality. The first
+SQLite lookup builds its name index and is reported separately.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("OPENAI_API_KEY", "offline-benchmark")
+
+from bench_name_index import company_name, person_name, typo
+from crm import apply_actions, get_crm_context
+from sqlite_storage import SQLiteStorage
+from store import CRMStore, JsonStorage
+
+
+def make_data(rng, size):
+    companies = [{"company_id": f"CO-{2001 + i}", "name": company_name(rng),
+                  "industry": "SaaS", "size": "SMB", "location": "Berlin"}
+                 for i in range(size)]
+    contacts = [{"contact_id": f"C-{1001 + i}", "name": person_name(rng),
+                 "job_title": "CTO", "email": None, "phone": None,
+                 "decision_power": "Unknown",
+                 "company_name": companies[rng.randrange(size)]["name"]}
+                for i in range(size)]
+    deals = [{"deal_id": f"D-{3001 + i}",
+              "company_name": companies[rng.randrange(size)]["name"],
+              "deal_name": f"Deal {i}", "value": 1000, "currency": "USD",
+              "stage": "Discovery", "timeline": "Q1", "next_steps": "Call",
+              "competitors": []}
+             for i in range(size // 10)]
+    meetings = [{"meeting_id": f"M-{i + 1}",
+                 "company_name": companies[rng.randrange(size)]["name"],
+                 "summary": "Intro call", "deal_linked": None}
+                for i in range(size // 10)]
+    return {"companies": companies, "contacts": contacts,
+            "deals": deals, "meetings": meetings}
+
+
+def make_payload(i):
+    return {
+        "companies": [{"temp_id": "co1", "existing_id": None, "name": f"Bench Co {i}",
+                       "industry": "SaaS", "size": "Mid", "location": "Pune"}],
+        "contacts": [{"temp_id": "c1", "existing_id": None, "name": f"Bench Person {i}",
+                      "job_title": "CFO", "email": None, "phone": None,
+                      "decision_power": "yes"}],
+        "deals": [{"temp_id": "d1", "existing_id": None, "name": f"Bench Deal {i}",
+                   "value": 5000, "currency": "EUR", "stage": "Proposal",
+                   "timeline": "Q2", "next_steps": "Demo", "competitors": []}],
+        "actions": []
+    }
+
+
+def timed(fn, items):
+    start = time.perf_counter()
+    results = [fn(item) for item in items]
+    return results, (time.perf_counter() - start) / len(items)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--size", type=int, default=1000000,
+                        help="companies and contacts (deals/meetings get a tenth)")
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--applies", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    data = make_data(rng, args.size)
+    queries = [(typo(rng, rng.choice(data["companies"])["name"]),
+                typo(rng, rng.choice(data["contacts"])["name"]))
+               for _ in range(args.queries)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = {}
+        for name, records in data.items():
+            paths[name] = os.path.join(tmp, f"{name}.json")
+            with open(paths[name], "w") as f:
+                json.dump(records, f)
+        del data
+
+        start = time.perf_counter()
+        storage = SQLiteStorage(os.path.join(tmp, "crm.sqlite3"), json_paths=paths)
+        migrate = time.perf_counter() - start
+
+        json_store = CRMStore(storage=JsonStorage(paths))
+        sqlite_store = CRMStore(storage=storage)
+
+        rows = []
+        for label, store in (("json", json_store), ("sqlite", sqlite_store)):
+            start = time.perf_counter()
+            first = get_crm_context(*queries[0], store=store)
+            warmup = time.perf_counter() - start
+            results, lookup = timed(lambda q: get_crm_context(*q, store=store), queries)
+            rows.append((label, warmup, lookup, [first] + results))
+
+        if rows[0][3] != rows[1][3]:
+            raise SystemExit("get_crm_context results differ between backends")
+
+        applies = []
+        for label, store in (("json", json_store), ("sqlite", sqlite_store)):
+            _, per_apply = timed(lambda i: apply_actions(make_payload(i), store=store),
+                                 range(args.applies))
+            applies.append((label, per_apply))
+
+        storage.close()
+
+    print(f"{args.size:,} companies/contacts  (SQLite migration {migrate:.1f}s)")
+    print(f"  {'backend':<10}{'first lookup s':>16}{'lookup ms':>12}{'apply ms':>12}")
+    for (label, warmup, lookup, _), (_, per_apply) in zip(rows, applies):
+        print(f"  {label:<10}{warmup:>16.2f}{lookup * 1e3:>12.2f}{per_apply * 1e3:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Startup time: import cost of each module, from `python -X importtime`.
+
+    python benchmarks/bench_startup.py --repeat 5 --check
+    python benchmarks/bench_startup.py --save startup.json
+    python benchmarks/bench_startup.py --baseline startup.json
+
+Imports every module in a fresh interpreter (so nothing is cached in
+the process), takes the median cumulative import time over --repeat
+runs and lists the slowest imports pulled in along the way. --check
+fails if a module is over its budget (the data layer must stay well
+under 50 ms); --baseline fails if a module got more than --tolerance
+slower than in a file written earlier with --save.
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+MODULES = ["store", "schema", "chunking", "prompts", "llm", "llm_cache", "crm", "server"]
+
+# ms; modules without a budget are only reported
+BUDGETS = {"store": 50, "schema": 50, "chunking": 50, "prompts": 50, "llm": 100, "crm": 150}
+
+# import time: self [us] | cumulative | imported package
+LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def import_times(module):
+    """
+    [(imported package, cumulative µs, nesting depth)] for one fresh import
+    of module, in the order -X importtime reports them (children first).
+    """
+    env = dict(os.environ, OPENAI_API_KEY=os.environ.get("OPENAI_API_KEY", "offline-benchmark"))
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                          cwd=ROOT, env=env, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{proc.stderr.strip().splitlines()[-1]}")
+    return [(m.group(4), int(m.group(2)), len(m.group(3)) // 2)
+            for m in map(LINE.match, proc.stderr.splitlines()) if m]
+
+
+def _own_imports(times, module):
+    """
+    Cumulative µs of module, and its direct imports slowest first (not
+    what the interpreter imported at startup, which is reported too).
+    """
+    for i in range(len(times) - 1, -1, -1):
+        name, total, depth = times[i]
+        if name == module and depth == 0:
+            break
+    else:
+        raise RuntimeError(f"import {module} not in the -X importtime output")
+    deps = []
+    for name, us, d in reversed(times[:i]):
+        if d == 0:
+            break
+        if d == 1:
+            deps.append((us / 1000, name))
+    return total, sorted(deps, reverse=True)
+
+
+def measure(module, repeat):
+    runs = [_own_imports(import_times(module), module) for _ in range(repeat)]
+    total = statistics.median(us for us, _ in runs) / 1000
+    return total, runs[-1][1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("modules", nargs="*", default=MODULES)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=5, help="slowest imports listed per module")
+    parser.add_argument("--check", action="store_true", help="fail if a module is over its budget")
+    parser.add_argument("--save", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="compare with a JSON file written by --save")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="allowed slowdown against the baseline (default 0.2 = 20%%)")
+    args = parser.parse_args()
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    results, problems = {}, []
+    print(f"{'module':<12} {'import ms':>10} {'budget':>8} {'baseline':>9}   slowest imports")
+    for module in args.modules:
+        try:
+            total, deps = measure(module, args.repeat)
+        except RuntimeError as e:
+            print(f"{module:<12} {'-':>10}   {e}")
+            problems.append(f"{module} does not import")
+            continue
+        results[module] = round(total, 2)
+        budget = BUDGETS.get(module)
+        before = baseline.get(module)
+        slowest = ", ".join(f"{name} {ms:.1f}" for ms, name in deps[:args.top])
+        print(f"{module:<12} {total:>10.1f} {budget or '-':>8} "
+              f"{f'{before:.1f}' if before else '-':>9}   {slowest}")
+
+        if args.check and budget and total > budget:
+            problems.append(f"{module} takes {total:.1f} ms, budget {budget} ms")
+        if before and total > before * (1 + args.tolerance):
+            problems.append(f"{module} takes {total:.1f} ms, {total / before - 1:.0%} over the baseline {before:.1f} ms")
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"saved to {args.save}")
+
+    if problems:
+        print("FAILED: " + "; ".join(problems))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Local stand-in for the OpenAI Responses API, for load tests.
+
+    python benchmarks/fake_llm_server.py --port 8100 --latency 2.0
+
+Answers POST /v1/responses (stream=true) with the event sequence the
+OpenAI SDK expects, holding the connection open for --latency seconds
+(spread over the text deltas) and returning a fixed CRM extraction.
+Point the app at it with OPENAI_BASE_URL=http://127.0.0.1:8100/v1.
+--error-rate makes that share of requests fail with 429.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from llm import SAMPLE_EXTRACTION
+
+EXTRACTION = SAMPLE_EXTRACTION
+
+
+def _response(response_id, model, status, text=None):
+    output = []
+    if text is not None:
+        output.append({
+            "id": "msg_" + response_id, "type": "message", "role": "assistant",
+            "status": "completed",
+            "content": [{"type": "output_text", "text": text, "annotations": []}]
+        })
+    return {
+        "id": response_id, "object": "response", "created_at": int(time.time()),
+        "model": model, "status": status, "output": output,
+        "parallel_tool_calls": True, "tool_choice": "auto", "tools": [],
+        "temperature": 0.0, "top_p": 1.0, "error": None,
+        "incomplete_details": None, "instructions": None, "metadata": {},
+    }
+
+
+def create_app(latency=1.0, chunks=20, error_rate=0.0, text=None):
+    app = FastAPI(title="Fake LLM")
+    app.state.requests = 0
+    text = text if text is not None else json.dumps(EXTRACTION)
+
+    async def events(model):
+        response_id = f"resp_{app.state.requests}"
+        item_id = "msg_" + response_id
+        seq = iter(range(1_000_000))
+
+        def sse(event):
+            event["sequence_number"] = next(seq)
+            return f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+        yield sse({"type": "response.created",
+                   "response": _response(response_id, model, "in_progress")})
+        yield sse({"type": "response.output_item.added", "output_index": 0,
+                   "item": {"id": item_id, "type": "message", "role": "assistant",
+                            "status": "in_progress", "content": []}})
+        yield sse({"type": "response.content_part.added", "output_index": 0,
+                   "content_index": 0, "item_id": item_id,
+                   "part": {"type": "output_text", "text": "", "annotations": []}})
+
+        size = max(1, -(-len(text) // chunks))
+        pieces = [text[i:i + size] for i in range(0, len(text), size)]
+        for piece in pieces:
+            await asyncio.sleep(latency / len(pieces))
+            yield sse({"type": "response.output_text.delta", "output_index": 0,
+                       "content_index": 0, "item_id": item_id, "delta": piece,
+                       "logprobs": []})
+
+        yield sse({"type": "response.output_text.done", "output_index": 0,
+                   "content_index": 0, "item_id": item_id, "text": text,
+                   "logprobs": []})
+        yield sse({"type": "response.completed",
+                   "response": _response(response_id, model, "completed", text)})
+
+    @app.post("/v1/responses")
+    async def responses(request: Request):
+        body = await request.json()
+        app.state.requests += 1
+        if random.random() < error_rate:
+            return JSONResponse(
+                {"error": {"message": "Rate limit reached", "type": "requests",
+                           "code": "rate_limit_exceeded"}},
+                status_code=429, headers={"retry-after-ms": "200"}
+            )
+        return StreamingResponse(events(body.get("model", "fake")),
+                                 media_type="text/event-stream")
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--latency", type=float, default=1.0,
+                        help="seconds per streamed response")
+    parser.add_argument("--chunks", type=int, default=20,
+                        help="text deltas per response")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="share of requests answered with 429")
+    args = parser.parse_args()
+
+    app = create_app(args.latency, args.chunks, args.error_rate)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""
+Concurrent /extract load test against a fake LLM.
+
+    python benchmarks/load_test.py --requests 500 --concurrency 200 --latency 2.0
+
+Starts benchmarks/fake_llm_server.py and the API (server:app) as
+subprocesses, points the API at the fake via OPENAI_BASE_URL, fires
+concurrent /extract requests and reports throughput and latency. A
+/crm-state probe runs alongside to show whether the event loop stays
+responsive while completions are in flight.
+
+With --mock the fake server is skipped and the API runs on the mock LLM
+provider (CRM_LLM_PROVIDER=mock) with the same latency, so the test
+needs no network and no second process.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+
+def start(args, env=None, cwd=ROOT):
+    return subprocess.Popen([sys.executable] + args, cwd=cwd, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+async def wait_up(url, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                await client.get(url)
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.2)
+    raise SystemExit(f"{url} did not come up")
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+async def run(api, n_requests, concurrency):
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=api, limits=limits, timeout=300) as client:
+        gate = asyncio.Semaphore(concurrency)
+        latencies, errors = [], 0
+        done = asyncio.Event()
+
+        async def one(i):
+            nonlocal errors
+            async with gate:
+                start = time.perf_counter()
+                r = await client.post("/extract", json={
+                    "meeting_text": f"Call #{i} with Priya from Nimbus Analytics about a pilot.",
+                    "company_name": "Nimbus Analytics",
+                    "contact_name": "Priya Shah"
+                })
+                if r.status_code == 200:
+                    latencies.append(time.perf_counter() - start)
+                else:
+                    errors += 1
+
+        async def probe():
+            # Separate connection so the probe never queues behind the load
+            samples = []
+            async with httpx.AsyncClient(base_url=api, timeout=300) as side:
+                while not done.is_set():
+                    start = time.perf_counter()
+                    await side.get("/crm-state")
+                    samples.append(time.perf_counter() - start)
+                    await asyncio.sleep(0.1)
+            return samples
+
+        probe_task = asyncio.create_task(probe())
+        start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(n_requests)))
+        elapsed = time.perf_counter() - start
+        done.set()
+        probes = await probe_task
+
+    return latencies, errors, elapsed, probes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=2.0,
+                        help="fake LLM seconds per completion")
+    parser.add_argument("--llm-port", type=int, default=8100)
+    parser.add_argument("--api-port", type=int, default=8200)
+    parser.add_argument("--mock", action="store_true",
+                        help="use the mock LLM provider instead of the fake server")
+    args = parser.parse_args()
+
+    env = dict(os.environ, OPENAI_API_KEY=os.getenv("OPENAI_API_KEY", "load-test"))
+    llm = None
+    if args.mock:
+        env.update(CRM_LLM_PROVIDER="mock", CRM_MOCK_LATENCY=str(args.latency))
+    else:
+        llm = start([os.path.join("benchmarks", "fake_llm_server.py"),
+                     "--port", str(args.llm_port), "--latency", str(args.latency)])
+        env["OPENAI_BASE_URL"] = f"http://127.0.0.1:{args.llm_port}/v1"
+    api = start(["-m", "uvicorn", "server:app", "--port", str(args.api_port),
+                 "--log-level", "warning"], env=env)
+    api_url = f"http://127.0.0.1:{args.api_port}"
+
+    try:
+        if llm is not None:
+            asyncio.run(wait_up(f"http://127.0.0.1:{args.llm_port}/docs"))
+        asyncio.run(wait_up(api_url + "/crm-state"))
+        latencies, errors, elapsed, probes = asyncio.run(
+            run(api_url, args.requests, args.concurrency))
+    finally:
+        for proc in (api, llm):
+            if proc is not None:
+                proc.terminate()
+                proc.wait()
+
+    print(f"{args.requests} requests, concurrency {args.concurrency}, "
+          f"{'mock' if args.mock else 'fake'} LLM latency {args.latency:.1f}s")
+    print(f"  throughput      {len(latencies) / elapsed:8.1f} req/s   ({errors} errors)")
+    if latencies:
+        print(f"  latency p50     {percentile(latencies, 0.50):8.2f} s")
+        print(f"  latency p95     {percentile(latencies, 0.95):8.2f} s")
+    if probes:
+        print(f"  /crm-state p95  {percentile(probes, 0.95) * 1e3:8.1f} ms under load "
+              f"({len(probes)} probes, max {max(probes) * 1e3:.1f} ms)")
+
+
+if __name__ == "__main__":
+    main()
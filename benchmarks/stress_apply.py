@@ -0,0 +1,160 @@
+"""
+Stress test for concurrent apply_actions across processes and threads.
+
+    python benchmarks/stress_apply.py --processes 4 --threads 16 --applies 4000
+
+Every worker process opens its own CRMStore over the same files, like
+uvicorn workers would, and fires applies from a thread pool. Each apply
+creates one uniquely named contact and adds 1 to a shared counter deal
+using the version it read (optimistic concurrency: on a conflict it
+reads again and retries). At the end the data is reloaded and checked:
+every contact exists exactly once, no id was issued twice, and the
+counter equals the number of applies, i.e. no update was lost.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+os.environ.setdefault("OPENAI_API_KEY", "offline-benchmark")
+
+from store import DATASETS, CRMStore, JsonStorage
+
+COUNTER = "D-STRESS"
+
+
+def open_store(storage, data_dir):
+    paths = {name: os.path.join(data_dir, spec[0]) for name, spec in DATASETS.items()}
+    if storage == "journal":
+        from journal import JournalStorage
+        return CRMStore(storage=JournalStorage(
+            os.path.join(data_dir, "crm_snapshot.jsonl"),
+            os.path.join(data_dir, "crm_journal.jsonl"),
+            json_paths=paths, compact_bytes=256 * 1024))
+    if storage == "sqlite":
+        from sqlite_storage import SQLiteStorage
+        return CRMStore(storage=SQLiteStorage(os.path.join(data_dir, "crm.sqlite3"), json_paths=paths))
+    return CRMStore(storage=JsonStorage(paths))
+
+
+def contact(name):
+    return {"temp_id": "c1", "existing_id": None, "name": name, "job_title": "Tester",
+            "email": None, "phone": None, "decision_power": "no"}
+
+
+def payload(contacts, counter):
+    return {
+        "companies": [],
+        "contacts": contacts,
+        "deals": [{"temp_id": "d1", "existing_id": COUNTER, "version": counter.get("version", 0),
+                   "name": counter["deal_name"], "value": counter["value"] + 1,
+                   "currency": counter["currency"], "stage": counter["stage"],
+                   "timeline": counter["timeline"], "next_steps": counter["next_steps"],
+                   "competitors": counter["competitors"]}],
+        "actions": [],
+    }
+
+
+def worker(args):
+    storage, data_dir, worker_id, applies, threads = args
+    from crm import apply_actions
+
+    store = open_store(storage, data_dir)
+    conflicts = []
+
+    def one(n):
+        contacts = [contact(f"Stress {worker_id}-{n}")]
+        while True:
+            # Read outside the write, as a client would
+            with store.lock:
+                counter = dict(store.get("deals", COUNTER))
+            result = apply_actions(payload(contacts, counter), store=store)
+            if not result["conflicts"]:
+                return
+            # The contact went in anyway; only the counter is retried
+            contacts = []
+            conflicts.append(n)
+
+    with ThreadPoolExecutor(threads) as pool:
+        list(pool.map(one, range(applies)))
+    stats = dict(store.write_stats, conflicts=len(conflicts))
+    store.close()
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--applies", type=int, default=4000, help="total, split across processes")
+    parser.add_argument("--storage", choices=["json", "journal", "sqlite"], default="json")
+    args = parser.parse_args()
+
+    data_dir = tempfile.mkdtemp(prefix="crm-stress-")
+    try:
+        for name, (file_name, _, _) in DATASETS.items():
+            shutil.copy(os.path.join(ROOT, file_name), data_dir)
+        deals_path = os.path.join(data_dir, DATASETS["deals"][0])
+        with open(deals_path) as f:
+            deals = json.load(f)
+        deals.append({"deal_id": COUNTER, "company_name": None, "deal_name": "Stress counter",
+                      "value": 0, "currency": "USD", "stage": None, "timeline": None,
+                      "next_steps": None, "competitors": []})
+        with open(deals_path, "w") as f:
+            json.dump(deals, f, indent=2)
+        with open(os.path.join(data_dir, DATASETS["contacts"][0])) as f:
+            contacts_before = len(json.load(f))
+
+        shares = [args.applies // args.processes + (i < args.applies % args.processes)
+                  for i in range(args.processes)]
+        jobs = [(args.storage, data_dir, i, share, args.threads) for i, share in enumerate(shares)]
+
+        start = time.perf_counter()
+        with multiprocessing.get_context("spawn").Pool(args.processes) as pool:
+            stats = pool.map(worker, jobs)
+        elapsed = time.perf_counter() - start
+
+        store = open_store(args.storage, data_dir)
+        contacts = store.contacts
+        ids = [c["contact_id"] for c in contacts]
+        names = [c["name"] for c in contacts if c["name"].startswith("Stress ")]
+        expected = {f"Stress {w}-{n}" for w, share in enumerate(shares) for n in range(share)}
+        counter = store.get("deals", COUNTER)
+
+        writes = sum(s["writes"] for s in stats)
+        commits = sum(s["commits"] for s in stats)
+        print(f"storage {args.storage}: {args.processes} processes x {args.threads} threads, "
+              f"{args.applies} applies in {elapsed:.2f}s ({args.applies / elapsed:,.0f} applies/s)")
+        print(f"  group commit   {writes} writes in {commits} commits "
+              f"({writes / max(commits, 1):.1f} per commit)")
+        print(f"  conflicts      {sum(s['conflicts'] for s in stats)} retried")
+
+        problems = []
+        if len(ids) != len(set(ids)):
+            problems.append(f"{len(ids) - len(set(ids))} duplicate contact ids")
+        if len(names) != len(set(names)):
+            problems.append(f"{len(names) - len(set(names))} contacts created twice")
+        if set(names) != expected:
+            problems.append(f"{len(expected - set(names))} contacts lost")
+        if len(contacts) != contacts_before + len(expected):
+            problems.append(f"{len(contacts)} contacts, expected {contacts_before + len(expected)}")
+        if counter["value"] != args.applies:
+            problems.append(f"counter is {counter['value']}, expected {args.applies} "
+                            f"({args.applies - counter['value']} lost updates)")
+        store.close()
+
+        print("  check          " + ("OK" if not problems else "FAILED: " + "; ".join(problems)))
+        sys.exit(1 if problems else 0)
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+import os
+import re
+
+# Transcripts longer than this (characters) are extracted in chunks.
+# The default leaves room for the CRM context inside the prompt budget.
+CHUNK_THRESHOLD = int(os.getenv("CRM_CHUNK_THRESHOLD", 8000))
+CHUNK_CHARS = int(os.getenv("CRM_CHUNK_CHARS", 4000))
+CHUNK_WORKERS = int(os.getenv("CRM_CHUNK_WORKERS", 4))
+
+# "Ravi (CIO):", "Anita:" or "Dr. K. Rao (Head of IT): text…" at the start of a line
+SPEAKER = re.compile(r"^[ \t]*[A-Z][\w.' -]{0,40}(?:\([^()\n]{1,40}\))?[ \t]*:", re.MULTILINE)
+
+# temp_id prefix per entity list, as in the extraction schema
+ENTITIES = {"contacts": "c", "companies": "co", "deals": "d"}
+ACTION_ENTITY = {"company": "companies", "contact": "contacts", "deal": "deals"}
+
+
+# ---------------- splitting ----------------
+
+def speaker_turns(text):
+    """
+    Split a transcript into speaker turns; falls back to paragraphs if
+    no "Speaker:" lines are found.
+    """
+    starts = [m.start() for m in SPEAKER.finditer(text)]
+    if not starts:
+        return [p for p in re.split(r"\n\s*\n", text) if p.strip()]
+    if starts[0] > 0 and text[:starts[0]].strip():
+        starts.insert(0, 0)
+    ends = starts[1:] + [len(text)]
+    return [text[s:e].strip() for s, e in zip(starts, ends) if text[s:e].strip()]
+
+
+def _split_long(turn, size):
+    """
+    Cut a turn longer than size at sentence ends (or hard, if it has none).
+    """
+    pieces, current = [], ""
+    for sentence in re.split(r"(?<=[.!?”\"])\s+", turn):
+        while len(sentence) > size:
+            if current:
+                pieces.append(current)
+                current = ""
+            pieces.append(sentence[:size])
+            sentence = sentence[size:]
+        if current and len(current) + 1 + len(sentence) > size:
+            pieces.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}" if current else sentence
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def split_transcript(text, chunk_chars=None, overlap_turns=1):
+    """
+    Speaker-aware chunks of at most ~chunk_chars characters.
+
+    Chunks never split a turn unless the turn alone is too long, and
+    each chunk starts with the last overlap_turns turns of the one
+    before, so a name introduced at a chunk boundary is seen by both.
+    """
+    size = chunk_chars or CHUNK_CHARS
+    turns = []
+    for turn in speaker_turns(text):
+        turns.extend(_split_long(turn, size) if len(turn) > size else [turn])
+
+    chunks, current = [], []
+    for turn in turns:
+        if current and sum(len(t) + 2 for t in current) + len(turn) > size:
+            chunks.append(current)
+            carried = current[-overlap_turns:] if overlap_turns else []
+            # Only carry context that still leaves room for new turns
+            while carried and sum(len(t) + 2 for t in carried) + len(turn) > size:
+                carried = carried[1:]
+            current = list(carried)
+        current.append(turn)
+    if current:
+        chunks.append(current)
+    return ["\n\n".join(chunk) for chunk in chunks]
+
+
+# ---------------- merging ----------------
+
+def _norm(name):
+    return " ".join(str(name or "").lower().split())
+
+
+def _empty(value):
+    return value is None or value == "" or value == [] or \
+        (isinstance(value, str) and value.strip().lower() == "unknown")
+
+
+def merge_extractions(results):
+    """
+    Combine per-chunk extractions into one, deterministically.
+
+    Entities are the same if they share an existing_id, or else a
+    normalized name. They are numbered again (co1, c1, d1, ...) in
+    order of first appearance across chunks, so co1 is still the first
+    company mentioned. Fields take the first non-empty value; lists of
+    competitors are unioned. Actions are re-pointed at the new temp_ids
+    and de-duplicated by (entity, operation, target).
+    """
+    merged = {name: [] for name in ENTITIES}
+    merged["actions"] = []
+    by_key = {name: {} for name in ENTITIES}
+    remaps = []
+
+    for result in results:
+        remap = {name: {} for name in ENTITIES}
+        for name, prefix in ENTITIES.items():
+            for item in result.get(name) or []:
+                if not isinstance(item, dict):
+                    continue
+                key = ("id", item["existing_id"]) if item.get("existing_id") else ("name", _norm(item.get("name")))
+                target = by_key[name].get(key)
+                if target is None:
+                    target = dict(item, temp_id=f"{prefix}{len(merged[name]) + 1}")
+                    merged[name].append(target)
+                    by_key[name][key] = target
+                else:
+                    for field, value in item.items():
+                        if field == "temp_id":
+                            continue
+                        if field == "competitors" and isinstance(value, list) and isinstance(target.get(field), list):
+                            target[field] = target[field] + [c for c in value if c not in target[field]]
+                        elif _empty(target.get(field)) and not _empty(value):
+                            target[field] = value
+                if item.get("temp_id") is not None:
+                    remap[name][item["temp_id"]] = target["temp_id"]
+        remaps.append(remap)
+
+    seen = set()
+    for result, remap in zip(results, remaps):
+        for action in result.get("actions") or []:
+            if not isinstance(action, dict):
+                continue
+            name = ACTION_ENTITY.get(str(action.get("entity", "")).lower())
+            target = action.get("target_temp_id")
+            if name is not None:
+                target = remap[name].get(target, target)
+            key = (action.get("entity"), action.get("operation"), target)
+            if key in seen:
+                continue
+            seen.add(key)
+            merged["actions"].append(dict(action, target_temp_id=target))
+
+    reports = [result.get("meta") for result in results]
+    if any(reports):
+        merged["meta"] = {"ok": all((r or {}).get("ok", True) for r in reports), "chunks": reports}
+    return merged
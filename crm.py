@@ -1,56 +1,35 @@
+import asyncio
+import contextvars
 import json
 import os
+import random
 import time
-from json_repair import repair_json
-from rapidfuzz import fuzz
-from openai import OpenAI
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import aclosing, closing
+from chunking import CHUNK_THRESHOLD, CHUNK_WORKERS, merge_extractions, split_transcript
+from llm import LLM_DEADLINE, DeadlineExceeded, get_provider
+from llm_cache import cache_key, get_cache
+from metrics import (
+    JSON_REPAIRS, LLM_CALLS, LLM_FIRST_TOKEN_SECONDS, LLM_INPUT_BYTES, LLM_OUTPUT_BYTES,
+    LLM_RETRIES, PROMPT_TOKENS, record, span
+)
+from schema import StreamCheck, validate_extraction
+from stream_parser import ENTITY_LISTS
+from prompts import MAX_OUTPUT_TOKENS, SCHEMA as SCHEMA_TEXT, build_compact_prompt, transcript_fits
+from records import plain
+from store import (
+    CRMStore, VersionConflict, normalize_records, load_json, save_json,
+    load_companies, load_contacts, load_deals, load_meetings
+)
+
+EMPTY_UPDATE = {"contacts": [], "companies": [], "deals": [], "actions": []}
+
+# Pick past deals and meetings by relevance to the new meeting (retrieval.py)
+# rather than the last three; needs a store to hold the index (the SQLite
+# backend ranks each company's rows per query instead)
+RETRIEVAL = os.getenv("CRM_RETRIEVAL", "1") == "1"
+RETRIEVAL_K = int(os.getenv("CRM_RETRIEVAL_K", 3))
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-
-def normalize_records(records, id_field):
-    """
-    Converts dict-of-dicts → list-of-dicts.
-    Leaves list-of-dicts unchanged.
-    """
-    if isinstance(records, dict):
-        fixed = []
-        for key, val in records.items():
-            if id_field not in val:
-                # Generate ID from key if missing
-                val[id_field] = key
-            fixed.append(val)
-        return fixed
-
-    if isinstance(records, list):
-        return records
-
-    return []
-
-def load_json(path):
-    if not os.path.exists(path):
-        return []
-    with open(path, "r") as f:
-        return json.load(f)
-
-def save_json(path, data):
-    with open(path, "w") as f:
-        json.dump(data, f, indent=2)
-
-def load_companies(path="existing_companies.json"):
-    data = load_json(path)
-    return normalize_records(data, "company_id")
-
-def load_contacts(path="existing_contacts.json"):
-    data = load_json(path)
-    return normalize_records(data, "contact_id")
-
-def load_deals(path="previous_deals.json"):
-    data = load_json(path)
-    return normalize_records(data, "deal_id")
-
-def load_meetings(path="previous_meetings.json"):
-    data = load_json(path)
-    return normalize_records(data, "meeting_id")
 def extract_json(raw_text: str):
     if not raw_text:
         return {}
@@ -68,50 +47,275 @@ def extract_json(raw_text: str):
         candidate = raw_text
 
     try:
+        from json_repair import repair_json
         fixed = repair_json(candidate)
-        return json.loads(fixed)
+        data = json.loads(fixed)
+        JSON_REPAIRS.inc(outcome="ok")
+        return data
     except:
+        JSON_REPAIRS.inc(outcome="failed")
         print("JSON extraction failed.")
         return {}
-def generate_crm_update(prompt_text: str) -> str:
+def _crm_request(prompt_text):
     system_msg = (
         "You are an enterprise CRM assistant. "
         "Return ONLY a valid JSON object. No explanation. No markdown."
     )
-
-    response_text = ""
-
-    with client.responses.stream(
-        model="gpt-5.1",
+    return dict(
+        model=get_provider().model,
         input=[
             {"role": "system", "content": system_msg},
             {"role": "user", "content": prompt_text}
         ],
         temperature=0.0,
-        max_output_tokens=20000
-    ) as stream:
+        max_output_tokens=MAX_OUTPUT_TOKENS
+    )
+def _timed_stream(deltas, prompt_text):
+    """
+    Pass an LLM stream through, recording time to first token, total
+    stream time and bytes in and out (see metrics.py).
+    """
+    start = time.perf_counter()
+    first, received = True, 0
+    try:
+        for delta in deltas:
+            if first:
+                record("llm_first_token", time.perf_counter() - start, LLM_FIRST_TOKEN_SECONDS)
+                first = False
+            received += len(delta.encode("utf-8"))
+            yield delta
+    finally:
+        deltas.close()
+        record("llm", time.perf_counter() - start)
+        LLM_INPUT_BYTES.inc(len(prompt_text.encode("utf-8")))
+        LLM_OUTPUT_BYTES.inc(received)
+def generate_crm_update(prompt_text: str) -> str:
+    parts = []
 
-        for event in stream:
-            if event.type == "response.output_text.delta":
-                response_text += event.delta
+    with closing(_timed_stream(get_provider().stream(_crm_request(prompt_text), LLM_DEADLINE),
+                               prompt_text)) as deltas:
+        for delta in deltas:
+            parts.append(delta)
 
-    return response_text
+    return "".join(parts)
 def generate_with_retries(prompt_text, retries=3):
-    for attempt in range(1, retries+1):
-        print(f"[CRM] Attempt {attempt}")
-        raw = generate_crm_update(prompt_text)
-        data = extract_json(raw)
+    # Same prompt + model + parameters -> same extraction, served from cache
+    report = {"cached": True, "attempts": []}
+    data = get_cache().get_or_call(
+        cache_key(_crm_request(prompt_text)),
+        lambda: _run_sync(_retry_plan(prompt_text, retries, report))
+    )
+    return _with_report(data, report)
 
-        if isinstance(data, dict) and "actions" in data:
-            print("[CRM] Success")
-            return data
 
-        print("[CRM] Invalid JSON, retrying…")
-        time.sleep(1)
+# ---------------- validated retries ----------------
 
-    return {"contacts": [], "companies": [], "deals": [], "actions": []}
-def find_company(companies, company_name):
+def _with_report(data, report):
+    """
+    The extraction plus a "meta" report of how it was obtained:
+      {"ok", "cached", "attempts": [{"attempt", "kind", "seconds",
+       "outcome", "issues"}], "failure": [reasons] when not ok}
+    An exhausted run returns the empty extraction with ok=False.
+    """
+    report["ok"] = data is not None
+    if data is None:
+        data = dict(EMPTY_UPDATE)
+        last = report["attempts"][-1] if report["attempts"] else {}
+        report["failure"] = last.get("issues") or [last.get("outcome", "no attempts")]
+    else:
+        data = dict(data)
+    data["meta"] = report
+    return data
+def _backoff(attempt, base=0.5):
+    # Jittered exponential: ~0.5s, ~1s, ~2s, …
+    return base * 2 ** (attempt - 1) * random.uniform(0.5, 1.5)
+def _describe(issues, limit=10):
+    return [f"{i['path']}: {i['reason']}" for i in issues[:limit]]
+def _repair_prompt(data, issues):
+    sections = sorted({i["section"] for i in issues if i["section"]})
+    broken = {name: data.get(name) for name in sections}
+    temp_ids = {
+        name: [item.get("temp_id") for item in data.get(name) or [] if isinstance(item, dict)]
+        for name in ("contacts", "companies", "deals") if name not in sections
+    }
+    return (
+        "Your CRM extraction JSON has schema errors. Fix ONLY these sections and return "
+        f"a JSON object with exactly the keys {', '.join(sections)}.\n\n"
+        "ERRORS:\n" + "\n".join(f"- {line}" for line in _describe(issues, 30)) + "\n\n"
+        "SECTIONS TO FIX:\n" + json.dumps(broken, separators=(",", ":")) + "\n\n"
+        "TEMP_IDS OF THE OTHER SECTIONS (unchanged):\n" + json.dumps(temp_ids) + "\n\n"
+        "JSON SCHEMA:\n" + SCHEMA_TEXT
+    ), sections
+def _retry_plan(prompt_text, retries, report):
+    """
+    The retry algorithm, shared by the sync and async paths. A generator:
+    yields ("call", prompt) and gets back (text, doomed reason), or
+    ("sleep", seconds); returns the valid extraction or None.
+
+    Each model call counts against `retries`. A stream that is doomed
+    early is cut off and regenerated with the reason as feedback; a
+    complete answer with schema errors gets one targeted repair of just
+    the broken sections before any full regeneration.
+    """
+    report["cached"] = False
+    prompt = prompt_text
+    calls = 0
+    while calls < retries:
+        calls += 1
+        print(f"[CRM] Attempt {calls}")
+        start = time.perf_counter()
+        text, doomed = yield ("call", prompt)
+        step = {"attempt": calls, "kind": "generate",
+                "seconds": round(time.perf_counter() - start, 3)}
+        report["attempts"].append(step)
+
+        if doomed:
+            step.update(outcome="aborted", issues=[doomed])
+            LLM_CALLS.inc(kind="generate", outcome="aborted")
+            print(f"[CRM] Aborted early: {doomed}")
+            feedback = [doomed]
+        else:
+            with span("parse"):
+                data = extract_json(text)
+                issues = validate_extraction(data)
+            if not issues:
+                step["outcome"] = "ok"
+                LLM_CALLS.inc(kind="generate", outcome="ok")
+                print("[CRM] Success")
+                return data
+            step.update(outcome="invalid", issues=_describe(issues))
+            LLM_CALLS.inc(kind="generate", outcome="invalid")
+            feedback = step["issues"]
+
+            if isinstance(data, dict) and data and calls < retries \
+                    and all(i["section"] for i in issues):
+                calls += 1
+                LLM_RETRIES.inc(reason="repair")
+                print(f"[CRM] Repairing {len(issues)} schema errors")
+                repair, sections = _repair_prompt(data, issues)
+                start = time.perf_counter()
+                text, _ = yield ("call", repair)
+                with span("parse"):
+                    fixed = extract_json(text)
+                    merged = dict(data)
+                    if isinstance(fixed, dict):
+                        merged.update({k: fixed[k] for k in sections if k in fixed})
+                    issues = validate_extraction(merged)
+                step = {"attempt": calls, "kind": "repair",
+                        "seconds": round(time.perf_counter() - start, 3),
+                        "outcome": "ok" if not issues else "invalid"}
+                if issues:
+                    step["issues"] = _describe(issues)
+                report["attempts"].append(step)
+                LLM_CALLS.inc(kind="repair", outcome=step["outcome"])
+                if not issues:
+                    print("[CRM] Repaired")
+                    return merged
+                feedback = step["issues"]
+
+        if calls < retries:
+            LLM_RETRIES.inc(reason="aborted" if doomed else "invalid")
+            print("[CRM] Invalid output, retrying…")
+            yield ("sleep", _backoff(calls))
+            prompt = (prompt_text + "\n\nYOUR PREVIOUS ANSWER WAS REJECTED:\n"
+                      + "\n".join(f"- {line}" for line in feedback)
+                      + "\nReturn ONLY the JSON object.")
+    return None
+def _stream_checked(prompt_text):
+    check = StreamCheck()
+    try:
+        with closing(_timed_stream(get_provider().stream(_crm_request(prompt_text), LLM_DEADLINE),
+                                   prompt_text)) as deltas:
+            for delta in deltas:
+                check.feed(delta)
+                if check.doomed:
+                    break
+    except DeadlineExceeded as e:
+        # Too slow counts as a doomed attempt: regenerate
+        return check.text(), str(e)
+    return check.text(), check.doomed
+def _run_sync(plan):
+    try:
+        step = next(plan)
+        while True:
+            if step[0] == "sleep":
+                time.sleep(step[1])
+                step = plan.send(None)
+            else:
+                step = plan.send(_stream_checked(step[1]))
+    except StopIteration as done:
+        return done.value
+
+# ---------------- async pipeline (server) ----------------
+
+async def _timed_astream(deltas, prompt_text):
+    start = time.perf_counter()
+    first, received = True, 0
+    try:
+        async for delta in deltas:
+            if first:
+                record("llm_first_token", time.perf_counter() - start, LLM_FIRST_TOKEN_SECONDS)
+                first = False
+            received += len(delta.encode("utf-8"))
+            yield delta
+    finally:
+        await deltas.aclose()
+        record("llm", time.perf_counter() - start)
+        LLM_INPUT_BYTES.inc(len(prompt_text.encode("utf-8")))
+        LLM_OUTPUT_BYTES.inc(received)
+async def generate_crm_update_async(prompt_text: str) -> str:
+    parts = []
+
+    async with aclosing(_timed_astream(get_provider().astream(_crm_request(prompt_text), LLM_DEADLINE),
+                                       prompt_text)) as deltas:
+        async for delta in deltas:
+            parts.append(delta)
+
+    return "".join(parts)
+async def generate_with_retries_async(prompt_text, retries=3):
+    report = {"cached": True, "attempts": []}
+    data = await get_cache().aget_or_call(
+        cache_key(_crm_request(prompt_text)),
+        lambda: _run_async(_retry_plan(prompt_text, retries, report))
+    )
+    return _with_report(data, report)
+async def _stream_checked_async(prompt_text):
+    check = StreamCheck()
+    try:
+        async with aclosing(_timed_astream(get_provider().astream(_crm_request(prompt_text), LLM_DEADLINE),
+                                           prompt_text)) as deltas:
+            async for delta in deltas:
+                check.feed(delta)
+                if check.doomed:
+                    break
+    except DeadlineExceeded as e:
+        return check.text(), str(e)
+    return check.text(), check.doomed
+async def _run_async(plan, reply=None):
+    # reply: the answer to the plan's first call, when the caller made it
+    try:
+        step = next(plan) if reply is None else plan.send(reply)
+        while True:
+            if step[0] == "sleep":
+                await asyncio.sleep(step[1])
+                step = plan.send(None)
+            else:
+                step = plan.send(await _stream_checked_async(step[1]))
+    except StopIteration as done:
+        return done.value
+def find_company(companies, company_name, index=None):
     target = company_name.lower().strip()
+
+    if index is not None:
+        matches = index.match(target, 80)
+        if not matches:
+            return None
+        # Highest score wins; ties go to the earliest record, as below
+        pos, _ = max(matches, key=lambda m: (m[1], -m[0]))
+        return index.records[pos]
+
+    from rapidfuzz import fuzz
+
     best = None
     best_score = 0
 
@@ -122,40 +326,113 @@ def find_company(companies, company_name):
             best = comp
 
     return best if best_score >= 80 else None
-def find_contacts(contacts, contact_name, company_id=None):
+def find_contacts(contacts, contact_name, company_id=None, index=None,
+                  company_name=None, company_positions=None):
     target = contact_name.lower()
     results = []
 
-    for c in contacts:
-        if company_id and c.get("company_id") == company_id:
-            results.append(c)
-        if fuzz.token_set_ratio(target, c["name"].lower()) > 80:
-            results.append(c)
+    # Contacts point at their company by name (bundled data) or by id
+    # (created by apply_actions); either one puts them in the company branch.
+    def at_company(c):
+        return ((company_id and c.get("company_id") == company_id) or
+                (company_name and c.get("company_name") == company_name))
+
+    if index is not None:
+        positions = {pos for pos, score in index.match(target, 80) if score > 80}
+        if company_positions is not None:
+            positions.update(company_positions)
+        elif company_id or company_name:
+            positions.update(pos for pos, c in enumerate(contacts) if at_company(c))
+        results = [index.records[pos] for pos in sorted(positions)]
+    else:
+        from rapidfuzz import fuzz
+        for c in contacts:
+            if at_company(c):
+                results.append(c)
+            if fuzz.token_set_ratio(target, c["name"].lower()) > 80:
+                results.append(c)
 
     unique = {c["contact_id"]: c for c in results}.values()
     return list(unique)[:3]
 
-def find_recent_deals(existing_deals, company_name):
+def find_recent_deals(existing_deals, company_name, index=None):
+    if index is not None:
+        return [existing_deals[pos] for pos in index.get(company_name)[-3:]]
     deals = [d for d in existing_deals if d.get("company_name") == company_name]
     return deals[-3:]
-def find_previous_meetings(existing_meetings, company_name):
+def find_previous_meetings(existing_meetings, company_name, index=None):
+    if index is not None:
+        return [existing_meetings[pos] for pos in index.get(company_name)[-3:]]
     meets = [m for m in existing_meetings if m.get("company_name") == company_name]
     return meets[-3:]
+def find_relevant(records, index, query, company_name, k=RETRIEVAL_K):
+    """
+    The k records filed under company_name (or a close spelling of it)
+    most similar to query. Least relevant first, as the finders above
+    are oldest first, so prompt trimming drops the least relevant.
+    """
+    hits = index.search(query, k, company_name)
+    return [records[pos] for pos, _ in reversed(hits)]
 def get_crm_context(meeting_company_name,
                     meeting_contact_name,
-                    CRM_COMPANIES,
-                    CRM_CONTACTS,
-                    CRM_DEALS,
-                    CRM_MEETINGS):
-
-    company = find_company(CRM_COMPANIES, meeting_company_name)
+                    CRM_COMPANIES=None,
+                    CRM_CONTACTS=None,
+                    CRM_DEALS=None,
+                    CRM_MEETINGS=None,
+                    store=None,
+                    meeting_text=None):
+
+    # A database backend answers with indexed queries, without loading tables
+    if store is not None and hasattr(store.storage, "crm_context"):
+        if not (RETRIEVAL and meeting_text):
+            return store.storage.crm_context(meeting_company_name, meeting_contact_name)
+        with span("retrieval"):
+            return store.storage.crm_context(meeting_company_name, meeting_contact_name,
+                                             query=f"{meeting_text} {meeting_contact_name or ''}",
+                                             k=RETRIEVAL_K)
+
+    # Retrieval positions refer to the store's own deals and meetings
+    retrieve = (RETRIEVAL and store is not None and bool(meeting_text)
+                and CRM_DEALS is None and CRM_MEETINGS is None)
+
+    if store is not None:
+        CRM_COMPANIES = store.companies if CRM_COMPANIES is None else CRM_COMPANIES
+        CRM_CONTACTS = store.contacts if CRM_CONTACTS is None else CRM_CONTACTS
+        CRM_DEALS = store.deals if CRM_DEALS is None else CRM_DEALS
+        CRM_MEETINGS = store.meetings if CRM_MEETINGS is None else CRM_MEETINGS
+
+    # With a store, lookups go through its cached indexes instead of scans
+    company_index = store.name_index("companies") if store else None
+    contact_index = store.name_index("contacts") if store else None
+
+    company = find_company(CRM_COMPANIES, meeting_company_name, company_index)
     company_name = company.get("name") if company else None
+    company_id = company.get("company_id") if company else None
+
+    company_positions = None
+    if store and company:
+        company_positions = []
+        if company_id:
+            company_positions += store.field_index("contacts", "company_id").get(company_id)
+        if company_name:
+            company_positions += store.field_index("contacts", "company_name").get(company_name)
+
+    contacts = find_contacts(CRM_CONTACTS, meeting_contact_name, company_id,
+                             contact_index, company_name, company_positions)
 
-    contacts = find_contacts(CRM_CONTACTS, meeting_contact_name,
-                             company.get("company_id") if company else None)
+    if retrieve:
+        with span("retrieval"):
+            query = f"{meeting_text} {meeting_contact_name or ''}"
+            group = company_name or meeting_company_name
+            deals = find_relevant(CRM_DEALS, store.retrieval_index("deals"), query, group)
+            meetings = find_relevant(CRM_MEETINGS, store.retrieval_index("meetings"), query, group)
+        return company, contacts, deals, meetings
 
-    deals = find_recent_deals(CRM_DEALS, company_name) if company_name else []
-    meetings = find_previous_meetings(CRM_MEETINGS, company_name) if company_name else []
+    deal_index = store.field_index("deals", "company_name") if store else None
+    meeting_index = store.field_index("meetings", "company_name") if store else None
+
+    deals = find_recent_deals(CRM_DEALS, company_name, deal_index) if company_name else []
+    meetings = find_previous_meetings(CRM_MEETINGS, company_name, meeting_index) if company_name else []
 
     return company, contacts, deals, meetings
 def build_crm_prompt(
@@ -170,16 +447,16 @@ You are an intelligent CRM extraction assistant.
 Return ONLY valid JSON. No explanations.
 
 EXISTING CONTACTS:
-{json.dumps(existing_contacts, indent=2)}
+{json.dumps(existing_contacts, indent=2, default=plain)}
 
 EXISTING COMPANY:
-{json.dumps(existing_company, indent=2)}
+{json.dumps(existing_company, indent=2, default=plain)}
 
 PREVIOUS DEALS:
-{json.dumps(previous_deals, indent=2)}
+{json.dumps(previous_deals, indent=2, default=plain)}
 
 PREVIOUS MEETINGS:
-{json.dumps(previous_meetings, indent=2)}
+{json.dumps(previous_meetings, indent=2, default=plain)}
 
 NEW MEETING:
 {meeting_notes}
@@ -200,25 +477,59 @@ JSON SCHEMA:
     "target_temp_id":"c1/co1/d1","reason":"string"}}]
 }}
 """
+def build_prompt(
+    meeting_notes,
+    existing_contacts,
+    existing_company,
+    previous_deals,
+    previous_meetings
+):
+    """
+    Prompt the pipeline sends: build_crm_prompt's content, compact and
+    trimmed to the token budget (see prompts.py).
+    """
+    with span("prompt"):
+        prompt, report = build_compact_prompt(
+            meeting_notes,
+            existing_contacts,
+            existing_company,
+            previous_deals,
+            previous_meetings
+        )
+    PROMPT_TOKENS.inc(report["tokens"])
+    print(f"[CRM] Prompt {report['tokens']}/{report['budget']} tokens"
+          + (f" (trimmed: {', '.join(report['trimmed'])})" if report["trimmed"] else "")
+          + (" (over budget)" if report["over_budget"] else ""))
+    return prompt
+def _long_transcript(meeting_summary):
+    # Long in characters, or too many tokens for the prompt budget on its own
+    return len(meeting_summary) > CHUNK_THRESHOLD or not transcript_fits(meeting_summary)
 def process_meeting(
     meeting_summary,
     meeting_company_name,
     meeting_contact_name,
-    CRM_COMPANIES,
-    CRM_CONTACTS,
-    CRM_DEALS,
-    CRM_MEETINGS
+    CRM_COMPANIES=None,
+    CRM_CONTACTS=None,
+    CRM_DEALS=None,
+    CRM_MEETINGS=None,
+    store=None
 ):
-    company, contacts, deals, meetings = get_crm_context(
-        meeting_company_name,
-        meeting_contact_name,
-        CRM_COMPANIES,
-        CRM_CONTACTS,
-        CRM_DEALS,
-        CRM_MEETINGS
-    )
-
-    prompt = build_crm_prompt(
+    with span("context"):
+        company, contacts, deals, meetings = get_crm_context(
+            meeting_company_name,
+            meeting_contact_name,
+            CRM_COMPANIES,
+            CRM_CONTACTS,
+            CRM_DEALS,
+            CRM_MEETINGS,
+            store=store,
+            meeting_text=meeting_summary
+        )
+
+    if _long_transcript(meeting_summary):
+        return _process_chunks(meeting_summary, contacts, company, deals, meetings)
+
+    prompt = build_prompt(
         meeting_summary,
         contacts,
         company,
@@ -227,32 +538,357 @@ def process_meeting(
     )
 
     return generate_with_retries(prompt)
-def next_id(prefix, existing_list, id_field):
-    nums = []
-    for item in existing_list:
-        if id_field in item:
+def _chunk_prompts(meeting_summary, contacts, company, deals, meetings):
+    chunks = split_transcript(meeting_summary)
+    print(f"[CRM] Long transcript: {len(meeting_summary)} chars in {len(chunks)} chunks")
+    return [
+        build_prompt(f"(Part {i} of {len(chunks)} of one meeting)\n{chunk}",
+                     contacts, company, deals, meetings)
+        for i, chunk in enumerate(chunks, start=1)
+    ]
+def _process_chunks(meeting_summary, contacts, company, deals, meetings):
+    """
+    Long-input mode: extract each transcript chunk concurrently, then
+    merge the partial results (see chunking.merge_extractions).
+    """
+    prompts = _chunk_prompts(meeting_summary, contacts, company, deals, meetings)
+    with ThreadPoolExecutor(max_workers=max(1, min(CHUNK_WORKERS, len(prompts)))) as pool:
+        # Each chunk runs in a copy of our context, so its timings count for this request
+        futures = [pool.submit(contextvars.copy_context().run, generate_with_retries, prompt)
+                   for prompt in prompts]
+        results = [future.result() for future in futures]
+    return merge_extractions(results)
+def _meeting_prompts(meeting_summary, meeting_company_name, meeting_contact_name, store):
+    with span("context"):
+        company, contacts, deals, meetings = get_crm_context(
+            meeting_company_name,
+            meeting_contact_name,
+            store=store,
+            meeting_text=meeting_summary
+        )
+    if _long_transcript(meeting_summary):
+        return _chunk_prompts(meeting_summary, contacts, company, deals, meetings)
+    return [build_prompt(meeting_summary, contacts, company, deals, meetings)]
+async def _extract_prompts_async(prompts):
+    if len(prompts) == 1:
+        return await generate_with_retries_async(prompts[0])
+
+    gate = asyncio.Semaphore(max(1, CHUNK_WORKERS))
+
+    async def extract(prompt):
+        async with gate:
+            return await generate_with_retries_async(prompt)
+
+    return merge_extractions(await asyncio.gather(*(extract(p) for p in prompts)))
+async def process_meeting_async(
+    meeting_summary,
+    meeting_company_name,
+    meeting_contact_name,
+    store
+):
+    """
+    process_meeting() for the event loop: the fuzzy matching and any
+    file reads run in a worker thread, the LLM call is awaited.
+    """
+    prompts = await asyncio.to_thread(
+        _meeting_prompts, meeting_summary, meeting_company_name, meeting_contact_name, store
+    )
+    return await _extract_prompts_async(prompts)
+def _entities(data):
+    for name in ENTITY_LISTS:
+        for entity in data.get(name) or []:
+            yield ("entity", name, entity)
+async def stream_meeting_async(
+    meeting_summary,
+    meeting_company_name,
+    meeting_contact_name,
+    store
+):
+    """
+    process_meeting_async() that reports entities as soon as the model
+    has written them out. Yields ("entity", list name, dict) events and
+    finally ("done", extraction); the final extraction is authoritative
+    (a retry or a chunk merge may differ from what was streamed).
+    """
+    prompts = await asyncio.to_thread(
+        _meeting_prompts, meeting_summary, meeting_company_name, meeting_contact_name, store
+    )
+    cache = get_cache()
+    key = cache_key(_crm_request(prompts[0]))
+    cached = await asyncio.to_thread(cache.get, key) if len(prompts) == 1 else None
+
+    if len(prompts) > 1 or cached is not None:
+        # Chunked or already known: nothing to follow token by token
+        if cached is not None:
+            data = _with_report(cached, {"cached": True, "attempts": []})
+        else:
+            data = await _extract_prompts_async(prompts)
+        for event in _entities(data):
+            yield event
+        yield ("done", data)
+        return
+
+    # The streamed answer is the retry plan's first call: a rejected one
+    # gets the same targeted repair or regeneration as any other attempt
+    report = {"cached": True, "attempts": []}
+    plan = _retry_plan(prompts[0], 3, report)
+    next(plan)
+    check = StreamCheck()
+    try:
+        async with aclosing(_timed_astream(get_provider().astream(_crm_request(prompts[0]), LLM_DEADLINE),
+                                           prompts[0])) as deltas:
+            async for delta in deltas:
+                for name, entity in check.feed(delta):
+                    yield ("entity", name, entity)
+                if check.doomed:
+                    break
+    except DeadlineExceeded as e:
+        check.doomed = str(e)
+
+    data = await _run_async(plan, (check.text(), check.doomed))
+    if data is not None:
+        await asyncio.to_thread(cache.put, key, data)
+    yield ("done", _with_report(data, report))
+
+
+# ---------------- batch extraction ----------------
+
+# Errors worth waiting out; anything else fails the item straight away
+def _transient_errors():
+    # Evaluated in an except clause: a failed import here would replace the
+    # error being handled, so without openai (the mock provider) nothing is
+    # transient
+    try:
+        from openai import APIConnectionError, APITimeoutError, InternalServerError, RateLimitError
+    except ImportError:
+        return ()
+    return (RateLimitError, APIConnectionError, APITimeoutError, InternalServerError)
+
+
+def _retry_after(error, default):
+    response = getattr(error, "response", None)
+    if response is None:
+        return default
+    try:
+        if "retry-after-ms" in response.headers:
+            return float(response.headers["retry-after-ms"]) / 1000
+        return float(response.headers.get("retry-after", default))
+    except ValueError:
+        return default
+async def generate_with_backoff_async(prompt_text, retries=5, base_delay=1.0):
+    """
+    generate_with_retries_async(), retried on rate limits and transient
+    API errors with jittered exponential backoff (or the server's
+    retry-after).
+    """
+    for attempt in range(retries + 1):
+        try:
+            return await generate_with_retries_async(prompt_text)
+        except _transient_errors() as e:
+            if attempt == retries:
+                raise
+            delay = _retry_after(e, base_delay * 2 ** attempt)
+            LLM_RETRIES.inc(reason="transient")
+            print(f"[CRM] {type(e).__name__}, backing off {delay:.1f}s")
+            await asyncio.sleep(delay * random.uniform(1.0, 1.5))
+def _batch_prompts(items, store):
+    """
+    Prompts for every item, built under one store lock so the whole
+    batch sees the same CRM state. Items naming the same company and
+    contact share one context lookup.
+    """
+    contexts = {}
+    prompts = []
+    with store.lock:
+        for meeting_summary, company_name, contact_name in items:
             try:
-                nums.append(int(item[id_field].split("-")[1]))
-            except:
-                pass
-    new_number = max(nums or [2000]) + 1
-    return f"{prefix}-{new_number}"
+                if not (meeting_summary or "").strip():
+                    raise ValueError("Meeting summary is empty")
+                # With retrieval the context also depends on the meeting text
+                key = (company_name, contact_name, meeting_summary if RETRIEVAL else None)
+                if key not in contexts:
+                    with span("context"):
+                        contexts[key] = get_crm_context(company_name, contact_name, store=store,
+                                                        meeting_text=meeting_summary)
+                company, contacts, deals, meetings = contexts[key]
+                if _long_transcript(meeting_summary):
+                    prompts.append(_chunk_prompts(meeting_summary, contacts, company, deals, meetings))
+                else:
+                    prompts.append(build_prompt(meeting_summary, contacts, company, deals, meetings))
+            except Exception as e:
+                prompts.append(e)
+    return prompts
+async def process_meetings_batch(items, store, concurrency=8, retries=5):
+    """
+    Extract many meetings concurrently.
+
+    items are (meeting_text, company_name, contact_name) tuples. Yields
+    one dict per item as soon as it finishes, in completion order:
+      {"index": i, "ok": True, "extracted": {...}, "seconds": t}
+      {"index": i, "ok": False, "error": "...", "seconds": t}
+    A failing item never stops the rest of the batch.
+    """
+    items = [tuple(item) for item in items]
+    prompts = await asyncio.to_thread(_batch_prompts, items, store)
+    gate = asyncio.Semaphore(max(1, concurrency))
+
+    async def run(index, prompt):
+        start = time.perf_counter()
+        try:
+            if isinstance(prompt, Exception):
+                raise prompt
+            async def extract(text):
+                async with gate:
+                    return await generate_with_backoff_async(text, retries)
+
+            if isinstance(prompt, list):
+                # Long transcript: its chunks share the batch's concurrency limit
+                extracted = merge_extractions(await asyncio.gather(*(extract(p) for p in prompt)))
+            else:
+                extracted = await extract(prompt)
+            result = {"index": index, "ok": True, "extracted": extracted}
+        except Exception as e:
+            result = {"index": index, "ok": False, "error": f"{type(e).__name__}: {e}"}
+        result["seconds"] = round(time.perf_counter() - start, 3)
+        return result
+
+    tasks = [asyncio.create_task(run(i, prompt)) for i, prompt in enumerate(prompts)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        # Consumer went away (e.g. client disconnected): stop the rest
+        for task in tasks:
+            task.cancel()
 def apply_actions(gpt_json,
                   companies_path="existing_companies.json",
                   contacts_path="existing_contacts.json",
-                  deals_path="previous_deals.json"):
+                  deals_path="previous_deals.json",
+                  store=None):
+    """
+    Apply an extraction to the CRM.
+
+    Returns {"mapping": {temp_id: real_id}, "unknown_ids": [...],
+    "conflicts": [...], "changed": {dataset: [records]}, "revision": n},
+    where unknown_ids lists the updates whose existing_id is not in the
+    CRM, conflicts the updates whose "version" (the record version the
+    client read, optional) is no longer current, changed holds only the
+    records added or updated and revision is the store revision that
+    includes them.
+
+    Concurrent calls on the same store are committed together (see
+    CRMStore.write). The lookups run over the store's in-memory tables
+    with every backend; SQLite only narrows what the commit writes.
+    """
+    # A store opened here is closed here, so its file lock isn't leaked
+    own_store = store is None
+    if own_store:
+        store = CRMStore({
+            "companies": companies_path,
+            "contacts": contacts_path,
+            "deals": deals_path
+        })
+
+    def apply(store):
+        changed = {}
+        applied = _apply_actions(gpt_json, store, changed)
+        return dict(applied, changed={name: [dict(r) for r in records.values()]
+                                      for name, records in changed.items()})
 
-    companies = load_companies(companies_path)
-    contacts  = load_contacts(contacts_path)
-    deals     = load_deals(deals_path)
+    try:
+        with span("apply"):
+            applied, revision = store.write(apply)
+    finally:
+        if own_store:
+            store.close()
+    return dict(applied, revision=revision)
+
+def apply_actions_bulk(payloads,
+                       companies_path="existing_companies.json",
+                       contacts_path="existing_contacts.json",
+                       deals_path="previous_deals.json",
+                       store=None):
+    """
+    Apply many extractions against one in-memory snapshot with a single
+    commit. temp_ids are resolved per payload, as in apply_actions.
+
+    Payloads failing the extraction schema are skipped and reported;
+    the rest are applied. Returns
+      {"results": [{"index", "ok", "mapping", "unknown_ids"} or
+                   {"index", "ok": False, "errors"}],
+       "changed": {"companies": [...], "contacts": [...], "deals": [...]},
+       "revision": n}
+    where "changed" holds only the records added or updated.
+    """
+    # A store opened here is closed here, so its file lock isn't leaked
+    own_store = store is None
+    if own_store:
+        store = CRMStore({
+            "companies": companies_path,
+            "contacts": contacts_path,
+            "deals": deals_path
+        })
+
+    def apply(store):
+        results = []
+        changed = {}
+        for index, gpt_json in enumerate(payloads):
+            issues = validate_extraction(gpt_json)
+            if issues:
+                results.append({"index": index, "ok": False,
+                                "errors": [f"{i['path']}: {i['reason']}" for i in issues]})
+                continue
+            applied = _apply_actions(gpt_json, store, changed)
+            results.append(dict(applied, index=index, ok=True))
+
+        # Copies taken inside the transaction, before anyone else writes
+        changed = {name: [dict(r) for r in records.values()] for name, records in changed.items()}
+        return {"results": results, "changed": changed}
 
+    try:
+        with span("apply"):
+            applied, revision = store.write(apply)
+    finally:
+        if own_store:
+            store.close()
+    return dict(applied, revision=revision)
+
+def _apply_actions(gpt_json, store, changed=None):
     temp_map = {}
+    unknown_ids = []
+    conflicts = []
+    changed = {} if changed is None else changed
+
+    def note(name, record):
+        changed.setdefault(name, {})[id(record)] = record
+
+    def update(name, entity, item, fields):
+        try:
+            record = store.update(name, item["existing_id"], fields, item.get("version"))
+        except VersionConflict as e:
+            conflicts.append({
+                "entity": entity,
+                "temp_id": item["temp_id"],
+                "existing_id": item["existing_id"],
+                "expected_version": e.expected,
+                "current_version": e.actual
+            })
+            return
+        if record is None:
+            unknown_ids.append({
+                "entity": entity,
+                "temp_id": item["temp_id"],
+                "existing_id": item["existing_id"]
+            })
+        else:
+            note(name, record)
+            temp_map[item["temp_id"]] = item["existing_id"]
 
     # ---------- COMPANIES ----------
     for co in gpt_json["companies"]:
         temp = co["temp_id"]
         if co["existing_id"] is None:
-            new_id = next_id("CO", companies, "company_id")
+            new_id = store.new_id("companies")
             new_co = {
                 "company_id": new_id,
                 "name": co["name"],
@@ -260,24 +896,21 @@ def apply_actions(gpt_json,
                 "size": co["size"],
                 "location": co["location"]
             }
-            companies.append(new_co)
+            note("companies", store.add("companies", new_co))
             temp_map[temp] = new_id
         else:
-            for c in companies:
-                if c["company_id"] == co["existing_id"]:
-                    c.update({
-                        "name": co["name"],
-                        "industry": co["industry"],
-                        "size": co["size"],
-                        "location": co["location"]
-                    })
-                    temp_map[temp] = co["existing_id"]
+            update("companies", "company", co, {
+                "name": co["name"],
+                "industry": co["industry"],
+                "size": co["size"],
+                "location": co["location"]
+            })
 
     # ---------- CONTACTS ----------
     for ct in gpt_json["contacts"]:
         temp = ct["temp_id"]
         if ct["existing_id"] is None:
-            new_id = next_id("C", contacts, "contact_id")
+            new_id = store.new_id("contacts")
             new_contact = {
                 "contact_id": new_id,
                 "name": ct["name"],
@@ -285,27 +918,25 @@ def apply_actions(gpt_json,
                 "email": ct["email"],
                 "phone": ct["phone"],
                 "decision_power": ct["decision_power"],
-                "company_id": temp_map.get("co1")
+                "company_id": temp_map.get("co1"),
+                "company_name": gpt_json["companies"][0]["name"] if gpt_json["companies"] else None
             }
-            contacts.append(new_contact)
+            note("contacts", store.add("contacts", new_contact))
             temp_map[temp] = new_id
         else:
-            for c in contacts:
-                if c["contact_id"] == ct["existing_id"]:
-                    c.update({
-                        "name": ct["name"],
-                        "job_title": ct["job_title"],
-                        "email": ct["email"],
-                        "phone": ct["phone"],
-                        "decision_power": ct["decision_power"]
-                    })
-                    temp_map[temp] = ct["existing_id"]
+            update("contacts", "contact", ct, {
+                "name": ct["name"],
+                "job_title": ct["job_title"],
+                "email": ct["email"],
+                "phone": ct["phone"],
+                "decision_power": ct["decision_power"]
+            })
 
     # ---------- DEALS ----------
     for dl in gpt_json["deals"]:
         temp = dl["temp_id"]
         if dl["existing_id"] is None:
-            new_id = next_id("D", deals, "deal_id")
+            new_id = store.new_id("deals")
             new_deal = {
                 "deal_id": new_id,
                 "company_name": gpt_json["companies"][0]["name"],
@@ -317,28 +948,21 @@ def apply_actions(gpt_json,
                 "next_steps": dl["next_steps"],
                 "competitors": dl["competitors"]
             }
-            deals.append(new_deal)
+            note("deals", store.add("deals", new_deal))
             temp_map[temp] = new_id
         else:
-            for d in deals:
-                if d["deal_id"] == dl["existing_id"]:
-                    d.update({
-                        "deal_name": dl["name"],
-                        "value": dl["value"],
-                        "currency": dl["currency"],
-                        "stage": dl["stage"],
-                        "timeline": dl["timeline"],
-                        "next_steps": dl["next_steps"],
-                        "competitors": dl["competitors"]
-                    })
-                    temp_map[temp] = dl["existing_id"]
-
-    # SAVE FIXED BACK
-    save_json(companies_path, companies)
-    save_json(contacts_path, contacts)
-    save_json(deals_path, deals)
-
-    return temp_map
+            update("deals", "deal", dl, {
+                "deal_name": dl["name"],
+                "value": dl["value"],
+                "currency": dl["currency"],
+                "stage": dl["stage"],
+                "timeline": dl["timeline"],
+                "next_steps": dl["next_steps"],
+                "competitors": dl["competitors"]
+            })
+
+    # Saved back by store.transaction() on return
+    return {"mapping": temp_map, "unknown_ids": unknown_ids, "conflicts": conflicts}
 if __name__ == "__main__":
     CRM_COMPANIES = load_companies("existing_companies.json")
     CRM_CONTACTS  = load_contacts("existing_contacts.json")
@@ -473,6 +1097,9 @@ Anita (CFO):
     print("GPT RESULT:")
     print(json.dumps(result, indent=2))
 
-    temp_map = apply_actions(result)
+    applied = apply_actions(result)
     print("TEMP → REAL ID MAP:")
-    print(temp_map)
+    print(applied["mapping"])
+    if applied["unknown_ids"]:
+        print("UNKNOWN EXISTING IDS:")
+        print(applied["unknown_ids"])
@@ -0,0 +1,423 @@
+"""
+Offline entity resolution for the CRM: find duplicate companies and
+contacts, write a merge plan, and optionally apply it.
+
+    python dedup.py plan [--plan merge_plan.json] [--apply]
+    python dedup.py apply [--plan merge_plan.json]
+
+Records are blocked by normalized keys (email, phone, name, company),
+only pairs sharing a block are scored, with rapidfuzz, in a process
+pool, and matches are clustered with union-find.
+"""
+import json
+import os
+import re
+import time
+from collections import defaultdict, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from rapidfuzz import fuzz
+
+from store import DATASETS
+
+DEDUP_WORKERS = int(os.getenv("CRM_DEDUP_WORKERS", 0)) or os.cpu_count() or 1
+NAME_CUTOFF = 90        # rapidfuzz score two names need to count as the same
+COMPANY_CUTOFF = 95     # stricter: a company merge rewrites every reference to it
+MAX_BLOCK = 500         # larger blocks (e.g. a very common name) are skipped
+TASK_PAIRS = 50000      # pairs per task handed to a worker
+PARALLEL_PAIRS = 200000  # below this, scoring inline beats starting a pool
+
+LEGAL_SUFFIXES = {"inc", "ltd", "llc", "llp", "gmbh", "corp", "corporation",
+                  "co", "company", "pvt", "private", "limited", "plc", "ag", "sa"}
+EMPTY = (None, "")
+
+_Row = namedtuple("_Row", "name email phone company keys")
+
+
+# -------------------------------------------------------
+# Normalization and blocking keys
+# -------------------------------------------------------
+
+def normalize_name(name):
+    return " ".join(re.findall(r"[a-z0-9]+", str(name or "").lower()))
+
+
+def company_key(name):
+    # "A.I." -> "ai": runs of single letters are one acronym
+    tokens = re.sub(r"\b(\w) (?=\w\b)", r"\1", normalize_name(name)).split()
+    return " ".join(t for t in tokens if t not in LEGAL_SUFFIXES) or " ".join(tokens)
+
+
+def email_key(email):
+    email = str(email or "").strip().lower()
+    return email if "@" in email else None
+
+
+def phone_key(phone):
+    digits = re.sub(r"\D", "", str(phone or ""))
+    return digits[-10:] if len(digits) >= 7 else None
+
+
+def _company_row(record):
+    name = company_key(record.get("name"))
+    if not name:
+        return _Row(name, None, None, None, frozenset())
+    # Generic words ("consulting", "systems") would make huge blocks, so
+    # only the leading token and prefix catch typos
+    keys = {("name", name), ("prefix", name[:5]), ("first", name.split()[0])}
+    return _Row(name, None, None, None, frozenset(keys))
+
+
+def _contact_row(record, company, any_company):
+    name = normalize_name(record.get("name"))
+    email = email_key(record.get("email"))
+    phone = phone_key(record.get("phone"))
+    keys = set()
+    if email:
+        keys.add(("email", email))
+    if phone:
+        keys.add(("phone", phone))
+    if name:
+        # Typos leave the other name tokens to meet on at the same company
+        if company and not any_company:
+            keys.update(("company", company, t) for t in name.split())
+        else:
+            keys.add(("name", " ".join(sorted(name.split()))))
+    return _Row(name, email, phone, company, frozenset(keys))
+
+
+# -------------------------------------------------------
+# Pair scoring (runs in the worker processes)
+# -------------------------------------------------------
+
+_rows = None
+_kind = None
+_cutoff = NAME_CUTOFF
+_any_company = False
+
+
+def _init(rows, kind, cutoff, any_company):
+    global _rows, _kind, _cutoff, _any_company
+    _rows, _kind, _cutoff, _any_company = rows, kind, cutoff, any_company
+
+
+def _match_companies(a, b):
+    # Only the words the names don't share count: "Douchi Analytics" and
+    # "Douxi Analytics" are close overall but differ in all that matters
+    a_tokens, b_tokens = a.name.split(), b.name.split()
+    a_rest = " ".join(t for t in a_tokens if t not in b_tokens)
+    b_rest = " ".join(t for t in b_tokens if t not in a_tokens)
+    if not a_rest and not b_rest:
+        return 100
+    return fuzz.ratio(a_rest, b_rest, score_cutoff=max(_cutoff, COMPANY_CUTOFF)) or None
+
+
+def _match_contacts(a, b):
+    if a.email and a.email == b.email:
+        return 100
+    # Conflicting identifiers mean two people sharing a name
+    if (a.email and b.email) or (a.phone and b.phone and a.phone != b.phone):
+        return None
+    if not _any_company and a.company and b.company and a.company != b.company:
+        return None
+    return fuzz.token_sort_ratio(a.name, b.name, score_cutoff=_cutoff) or None
+
+
+def _score_blocks(blocks):
+    """
+    (pairs scored, [(i, j, score)] for the matching pairs) over a batch
+    of (block key, positions). A pair sharing several blocks is scored
+    only in the one with the smallest key.
+    """
+    rows = _rows
+    match = _match_companies if _kind == "companies" else _match_contacts
+    scored, matches = 0, []
+    for key, members in blocks:
+        for x, i in enumerate(members):
+            a = rows[i]
+            for j in members[x + 1:]:
+                b = rows[j]
+                if min(a.keys & b.keys) != key:
+                    continue
+                scored += 1
+                score = match(a, b)
+                if score is not None:
+                    matches.append((i, j, score))
+    return scored, matches
+
+
+# -------------------------------------------------------
+# Planning
+# -------------------------------------------------------
+
+def _blocks(rows):
+    members = defaultdict(list)
+    for pos, row in enumerate(rows):
+        for key in row.keys:
+            members[key].append(pos)
+    blocks, skipped = [], 0
+    for key, positions in members.items():
+        if len(positions) > MAX_BLOCK:
+            skipped += 1
+        elif len(positions) > 1:
+            blocks.append((key, positions))
+    return blocks, skipped
+
+
+def _tasks(blocks):
+    task, size = [], 0
+    for block in blocks:
+        task.append(block)
+        size += len(block[1]) * (len(block[1]) - 1) // 2
+        if size >= TASK_PAIRS:
+            yield task
+            task, size = [], 0
+    if task:
+        yield task
+
+
+def _clusters(n, matches):
+    parent = list(range(n))
+
+    def find(x):
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for i, j, _ in matches:
+        ri, rj = find(i), find(j)
+        if ri != rj:
+            parent[max(ri, rj)] = min(ri, rj)
+
+    score = defaultdict(lambda: 100.0)
+    for i, _, s in matches:
+        root = find(i)
+        score[root] = min(score[root], s)
+    groups = defaultdict(list)
+    for pos in range(n):
+        groups[find(pos)].append(pos)
+    return [(positions, score[root]) for root, positions in groups.items() if len(positions) > 1]
+
+
+def _filled(record):
+    return sum(1 for k, v in record.items() if k != "version" and v not in EMPTY)
+
+
+def _resolve(kind, records, rows, workers, cutoff, any_company):
+    """
+    Merge clusters for one dataset, plus stats.
+    """
+    id_field = DATASETS[kind][1]
+    start = time.perf_counter()
+    blocks, skipped = _blocks(rows)
+    n_pairs = sum(len(p) * (len(p) - 1) // 2 for _, p in blocks)
+
+    scoring = time.perf_counter()
+    scored, matches = 0, []
+    if workers > 1 and n_pairs >= PARALLEL_PAIRS:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init,
+                                 initargs=(rows, kind, cutoff, any_company)) as pool:
+            for n, found in pool.map(_score_blocks, _tasks(blocks)):
+                scored += n
+                matches.extend(found)
+    else:
+        workers = 1
+        _init(rows, kind, cutoff, any_company)
+        scored, matches = _score_blocks(blocks)
+    scoring = time.perf_counter() - scoring
+
+    clusters = []
+    for positions, score in _clusters(len(rows), matches):
+        # Keep the fullest record (the oldest on a tie), fill its gaps from the rest
+        keep = max(positions, key=lambda pos: (_filled(records[pos]), -pos))
+        fill = {}
+        for pos in positions:
+            for field, value in records[pos].items():
+                if field != "version" and records[keep].get(field) in EMPTY and value not in EMPTY:
+                    fill.setdefault(field, value)
+        clusters.append({
+            "keep": records[keep].get(id_field),
+            "merge": [records[pos].get(id_field) for pos in positions if pos != keep],
+            "score": round(score, 1),
+            "fill": fill
+        })
+
+    seconds = time.perf_counter() - start
+    stats = {
+        "records": len(records),
+        "blocks": len(blocks),
+        "skipped_blocks": skipped,
+        "pairs": scored,
+        "matches": len(matches),
+        "clusters": len(clusters),
+        "merged": sum(len(c["merge"]) for c in clusters),
+        "workers": workers,
+        "seconds": round(seconds, 3),
+        "scoring_seconds": round(scoring, 3),
+        "pairs_per_sec": round(scored / scoring) if scoring else None
+    }
+    return clusters, stats
+
+
+def build_plan(companies, contacts, workers=None, cutoff=NAME_CUTOFF, any_company=False):
+    """
+    Merge plan for the given company and contact records:
+
+      {"companies": [{"keep": id, "merge": [ids], "score", "fill": {field: value}}],
+       "contacts": [...],
+       "stats": {"companies": {...}, "contacts": {...}}}
+
+    Companies are resolved first; contacts of merged companies then
+    count as being at the same company. Contacts at different companies
+    are only merged on the same email, unless any_company is set.
+    """
+    workers = workers or DEDUP_WORKERS
+    company_rows = [_company_row(c) for c in companies]
+    company_clusters, company_stats = _resolve(
+        "companies", companies, company_rows, workers, cutoff, any_company)
+
+    names = {c.get("company_id"): row.name for c, row in zip(companies, company_rows)}
+    canonical = {}
+    for cluster in company_clusters:
+        for dropped in cluster["merge"]:
+            canonical[names.get(dropped)] = names.get(cluster["keep"])
+
+    contact_rows = []
+    for c in contacts:
+        company = names.get(c.get("company_id")) or company_key(c.get("company_name"))
+        contact_rows.append(_contact_row(c, canonical.get(company, company), any_company))
+    contact_clusters, contact_stats = _resolve(
+        "contacts", contacts, contact_rows, workers, cutoff, any_company)
+
+    return {
+        "companies": company_clusters,
+        "contacts": contact_clusters,
+        "stats": {"companies": company_stats, "contacts": contact_stats}
+    }
+
+
+# -------------------------------------------------------
+# Applying a plan
+# -------------------------------------------------------
+
+def _bump(record):
+    record["version"] = record.get("version", 0) + 1
+
+
+def _merge(store, name, clusters):
+    """
+    Fold each cluster into its kept record and drop the rest. Returns
+    {dropped id: (dropped record, kept record)}.
+    """
+    id_field = DATASETS[name][1]
+    records = store.records(name)
+    by_id = {r.get(id_field): r for r in records}
+    dropped = {}
+    for cluster in clusters:
+        keep = by_id.get(cluster["keep"])
+        others = [by_id[i] for i in cluster["merge"] if i in by_id and i not in dropped]
+        if keep is None or keep.get(id_field) in dropped or not others:
+            continue    # the data moved on since the plan was made
+        for field, value in cluster["fill"].items():
+            if keep.get(field) in EMPTY:
+                keep[field] = value
+        _bump(keep)
+        for record in others:
+            dropped[record.get(id_field)] = (record, keep)
+
+    if dropped:
+        records[:] = [r for r in records if r.get(id_field) not in dropped]
+        store.touch(name)
+    return dropped
+
+
+def _rewrite(store, name, rewrite):
+    changed = 0
+    for record in store.records(name):
+        if rewrite(record):
+            _bump(record)
+            changed += 1
+    if changed:
+        store.touch(name)
+    return changed
+
+
+def apply_plan(plan, store):
+    """
+    Apply a merge plan in one transaction: merged records are folded
+    into the kept ones and removed, and the company_id/company_name and
+    meeting contact_name references to them are pointed at the kept
+    records. Clusters whose records no longer exist are skipped.
+    Returns counts of merged and rewritten records.
+    """
+    with store.transaction():
+        companies = _merge(store, "companies", plan.get("companies", []))
+        contacts = _merge(store, "contacts", plan.get("contacts", []))
+
+        # Rewritten after both merges, so kept records' filled-in fields
+        # are remapped too; all keys are the values as they were before
+        ids = {i: keep["company_id"] for i, (_, keep) in companies.items()}
+        names = {old.get("name"): keep.get("name") for old, keep in companies.values()
+                 if old.get("name") not in EMPTY and old.get("name") != keep.get("name")}
+        people = {(old.get("name"), old.get("company_name")): keep.get("name")
+                  for old, keep in contacts.values() if old.get("name") != keep.get("name")}
+
+        def references(record):
+            new = {}
+            person = people.get((record.get("contact_name"), record.get("company_name")))
+            if person is not None:
+                new["contact_name"] = person
+            if record.get("company_id") in ids:
+                new["company_id"] = ids[record["company_id"]]
+            if record.get("company_name") in names:
+                new["company_name"] = names[record["company_name"]]
+            record.update(new)
+            return bool(new)
+
+        rewritten = {name: _rewrite(store, name, references)
+                     for name in ("contacts", "deals", "meetings")}
+
+    return {"merged": {"companies": len(companies), "contacts": len(contacts)},
+            "rewritten": rewritten}
+
+
+def _report(stats):
+    for name, s in stats.items():
+        rate = f"{s['pairs_per_sec']:,}" if s["pairs_per_sec"] is not None else "-"
+        print(f"{name:<10} {s['records']:>9,} records  {s['blocks']:>8,} blocks "
+              f"({s['skipped_blocks']} skipped)  {s['pairs']:>10,} pairs  "
+              f"{s['clusters']:>7,} clusters  {s['merged']:>7,} merged  "
+              f"{s['seconds']:.2f}s  {rate} pairs/sec  ({s['workers']} workers)")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from store import get_store
+
+    parser = argparse.ArgumentParser(description="Find and merge duplicate CRM companies and contacts.")
+    parser.add_argument("command", choices=["plan", "apply"],
+                        help="write a merge plan (and apply it with --apply), or apply a saved one")
+    parser.add_argument("--plan", default="merge_plan.json", help="plan file to write or read")
+    parser.add_argument("--apply", action="store_true", help="apply the plan right away")
+    parser.add_argument("--workers", type=int, default=DEDUP_WORKERS)
+    parser.add_argument("--cutoff", type=float, default=NAME_CUTOFF)
+    parser.add_argument("--any-company", action="store_true",
+                        help="also merge same-named contacts at different companies")
+    args = parser.parse_args()
+
+    store = get_store()
+    if args.command == "plan":
+        plan = build_plan(store.companies, store.contacts, args.workers, args.cutoff, args.any_company)
+        with open(args.plan, "w") as f:
+            json.dump(plan, f, indent=2)
+        _report(plan["stats"])
+        print(f"Merge plan written to {args.plan}")
+    else:
+        with open(args.plan) as f:
+            plan = json.load(f)
+
+    if args.command == "apply" or args.apply:
+        print(json.dumps(apply_plan(plan, store)))
+    store.close()
@@ -0,0 +1,447 @@
+import asyncio
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+from metrics import Histogram
+
+JOB_WAIT_SECONDS = Histogram("crm_job_wait_seconds", "Time jobs spent queued before a worker took them",
+                             buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800))
+JOB_RUN_SECONDS = Histogram("crm_job_run_seconds", "Time jobs took once started, by outcome", ["status"],
+                            buckets=(0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300))
+
+JOBS_DB = os.getenv("CRM_JOBS_DB", "crm_jobs.sqlite3")
+
+PENDING = ("queued", "running")
+FINISHED = ("done", "failed", "cancelled")
+
+# Columns a job is read with (see JobQueue._job)
+COLUMNS = "seq, id, status, priority, payload, result, error, created, started, finished"
+
+
+class QueueFull(Exception):
+    """
+    The queue already holds max_queued jobs waiting for a worker.
+    """
+
+
+class JobQueue:
+    """
+    Persistent priority queue of extraction jobs with a bounded pool of
+    asyncio workers.
+
+    Jobs live in a SQLite table, so queued jobs survive a restart.
+    Workers take the highest priority first, oldest first within a
+    priority, and run run(payload) -> result for each. Finished jobs
+    keep their result for `ttl` seconds.
+
+    Claims are single SQLite transactions, so several processes may
+    share the file; workers are woken by submit() in this process and
+    otherwise look for new jobs every `poll` seconds. A running job
+    records its owner (host, pid and a token for this queue) and a
+    heartbeat the owner renews every lease / 3 seconds. It goes back to
+    the queue only once its owner is gone: the heartbeat is more than
+    `lease` seconds old, the owner is a process on this host that no
+    longer exists, or the owner is this queue restarting.
+    """
+
+    def __init__(self, path, run, workers=4, max_queued=1000, ttl=7 * 24 * 3600, poll=1.0, lease=60.0):
+        self.path = path
+        self.run = run
+        self.workers = workers
+        self.max_queued = max_queued
+        self.ttl = ttl
+        self.poll = poll
+        self.lease = lease
+        self.host = socket.gethostname()
+        self.owner = f"{self.host}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "seq INTEGER PRIMARY KEY AUTOINCREMENT, id TEXT UNIQUE NOT NULL, "
+            "status TEXT NOT NULL, priority INTEGER NOT NULL, payload TEXT NOT NULL, "
+            "result TEXT, error TEXT, created REAL NOT NULL, started REAL, finished REAL, "
+            "owner TEXT, heartbeat REAL)"
+        )
+        # Files written before jobs had owners
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        for column, kind in (("owner", "TEXT"), ("heartbeat", "REAL")):
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {kind}")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_queue ON jobs (status, priority DESC, seq)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_started ON jobs (started)")
+        self._tasks = []
+        self._running = {}          # job id -> asyncio Task running it
+        self._cancelling = set()
+        self._waiters = {}          # job id -> Events of the calls waiting for it to finish
+        self._wakeup = None
+        self._last_purge = 0.0
+
+    # ---------------- SQLite (called in worker threads) ----------------
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def _write(self, fn):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(self._conn)
+                self._conn.execute("COMMIT")
+                return result
+            except:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    @staticmethod
+    def _job(row, with_result=True):
+        seq, job_id, status, priority, payload, result, error, created, started, finished = row
+        job = {
+            "job_id": job_id,
+            "status": status,
+            "priority": priority,
+            "created": created,
+            "started": started,
+            "finished": finished,
+            "wait_seconds": round((started or finished or time.time()) - created, 3),
+        }
+        if with_result:
+            job["request"] = json.loads(payload)
+            if result is not None:
+                job["result"] = json.loads(result)
+            if error is not None:
+                job["error"] = error
+        return job
+
+    def _insert(self, payload, priority):
+        def insert(conn):
+            queued = conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+            if queued >= self.max_queued:
+                raise QueueFull(f"{queued} jobs already queued")
+            job_id = uuid.uuid4().hex
+            conn.execute(
+                "INSERT INTO jobs (id, status, priority, payload, created) VALUES (?, 'queued', ?, ?, ?)",
+                (job_id, priority, json.dumps(payload), time.time())
+            )
+            return conn.execute(f"SELECT {COLUMNS} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._job(self._write(insert))
+
+    def _claim(self):
+        def claim(conn):
+            row = conn.execute(
+                "SELECT seq, id, payload, created FROM jobs WHERE status = 'queued' "
+                "ORDER BY priority DESC, seq LIMIT 1"
+            ).fetchone()
+            if row is None:
+                return None
+            now = time.time()
+            conn.execute("UPDATE jobs SET status = 'running', started = ?, owner = ?, heartbeat = ? "
+                         "WHERE seq = ?", (now, self.owner, now, row[0]))
+            return row[1], json.loads(row[2]), now - row[3]
+        return self._write(claim)
+
+    def _finish(self, job_id, status, result=None, error=None):
+        # Only while still ours: a job requeued after a lost heartbeat
+        # may be running elsewhere by now
+        self._execute(
+            "UPDATE jobs SET status = ?, result = ?, error = ?, finished = ? "
+            "WHERE id = ? AND status = 'running' AND owner = ?",
+            (status, None if result is None else json.dumps(result), error, time.time(), job_id, self.owner)
+        )
+
+    def _cancel(self, job_id):
+        def cancel(conn):
+            # A job running in another process is only marked: its
+            # _finish() then finds it no longer running and drops the result
+            conn.execute("UPDATE jobs SET status = 'cancelled', finished = ? "
+                         "WHERE id = ? AND status IN ('queued', 'running')", (time.time(), job_id))
+            return conn.execute(f"SELECT {COLUMNS} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        row = self._write(cancel)
+        return self._job(row) if row else None
+
+    def _heartbeat(self):
+        self._execute("UPDATE jobs SET heartbeat = ? WHERE status = 'running' AND owner = ?",
+                      (time.time(), self.owner))
+
+    def _abandoned(self, owner, heartbeat, now, restarting):
+        if owner == self.owner:
+            # Ours: left behind by stop() if no worker is running yet
+            return restarting
+        if owner is None or heartbeat is None or heartbeat < now - self.lease:
+            return True
+        host, pid, _ = owner.rsplit(":", 2)
+        return host == self.host and not _alive(int(pid))
+
+    def _recover(self, restarting=False):
+        """
+        Requeue running jobs whose owner is gone; returns how many.
+        """
+        def recover(conn):
+            now = time.time()
+            lost = [(job_id, owner) for job_id, owner, heartbeat in conn.execute(
+                "SELECT id, owner, heartbeat FROM jobs WHERE status = 'running'")
+                if self._abandoned(owner, heartbeat, now, restarting)]
+            for job_id, owner in lost:
+                conn.execute("UPDATE jobs SET status = 'queued', started = NULL, owner = NULL, "
+                             "heartbeat = NULL WHERE id = ? AND status = 'running' AND owner IS ?",
+                             (job_id, owner))
+            return len(lost)
+        return self._write(recover)
+
+    def _purge(self):
+        self._last_purge = time.time()
+        self._execute("DELETE FROM jobs WHERE finished < ? AND status IN ('done', 'failed', 'cancelled')",
+                      (self._last_purge - self.ttl,))
+
+    def _get(self, job_id, with_result=True):
+        rows = self._execute(f"SELECT {COLUMNS} FROM jobs WHERE id = ?", (job_id,))
+        return self._job(rows[0], with_result) if rows else None
+
+    def _list(self, status, limit):
+        if status:
+            rows = self._execute(f"SELECT {COLUMNS} FROM jobs WHERE status = ? ORDER BY seq DESC LIMIT ?",
+                                 (status, limit))
+        else:
+            rows = self._execute(f"SELECT {COLUMNS} FROM jobs ORDER BY seq DESC LIMIT ?", (limit,))
+        return [self._job(row, with_result=False) for row in rows]
+
+    def counts(self):
+        """
+        {status: number of jobs}, read directly (for metrics scrapes).
+        """
+        counts = dict(self._execute("SELECT status, COUNT(*) FROM jobs GROUP BY status"))
+        return {status: counts.get(status, 0) for status in PENDING + FINISHED}
+
+    def _stats(self, window=1000):
+        now = time.time()
+        counts = self.counts()
+        oldest = self._execute("SELECT MIN(created) FROM jobs WHERE status = 'queued'")[0][0]
+        waits = sorted(w for (w,) in self._execute(
+            "SELECT started - created FROM jobs WHERE started IS NOT NULL ORDER BY started DESC LIMIT ?",
+            (window,)))
+
+        def pct(p):
+            return round(waits[min(len(waits) - 1, int(p * len(waits)))], 3) if waits else None
+
+        return {
+            "depth": counts["queued"],
+            "running": counts["running"],
+            "counts": counts,
+            "workers": self.workers,
+            "max_queued": self.max_queued,
+            "oldest_queued_seconds": round(now - oldest, 3) if oldest is not None else None,
+            # Over the last `window` jobs to start
+            "wait_seconds": {
+                "jobs": len(waits),
+                "mean": round(sum(waits) / len(waits), 3) if waits else None,
+                "p50": pct(0.5),
+                "p95": pct(0.95),
+                "max": round(waits[-1], 3) if waits else None,
+            },
+        }
+
+    # ---------------- workers ----------------
+
+    async def start(self):
+        """
+        Start the workers on the running event loop (once).
+        """
+        if self._wakeup is not None:
+            return
+        self._wakeup = asyncio.Event()
+        await asyncio.to_thread(self._recover, True)
+        await asyncio.to_thread(self._purge)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(max(1, self.workers))]
+        self._tasks.append(asyncio.create_task(self._keepalive()))
+
+    async def stop(self):
+        """
+        Stop the workers; jobs they were running are picked up again on
+        the next start(), or by another process once their lease runs out.
+        """
+        tasks, self._tasks = self._tasks, []
+        self._wakeup = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    async def _keepalive(self):
+        # Renews this queue's heartbeat, and requeues jobs whose owner died
+        while True:
+            await asyncio.sleep(self.lease / 3)
+            await asyncio.to_thread(self._heartbeat)
+            if await asyncio.to_thread(self._recover) and self._wakeup is not None:
+                self._wakeup.set()
+
+    async def _worker(self):
+        wakeup = self._wakeup
+        while True:
+            # Cleared first: a submit() landing during the claim keeps it set
+            wakeup.clear()
+            claimed = await asyncio.to_thread(self._claim)
+            if claimed is None:
+                try:
+                    await asyncio.wait_for(wakeup.wait(), self.poll)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            job_id, payload, waited = claimed
+            JOB_WAIT_SECONDS.observe(waited)
+            task = self._running[job_id] = asyncio.create_task(self.run(payload))
+            start = time.perf_counter()
+            try:
+                result = await task
+            except asyncio.CancelledError:
+                if job_id not in self._cancelling:
+                    raise   # stop(): leave it running, to be requeued
+                status, result, error = "cancelled", None, None
+            except Exception as e:
+                status, result, error = "failed", None, f"{type(e).__name__}: {e}"
+            else:
+                status, error = "done", None
+            finally:
+                self._running.pop(job_id, None)
+                self._cancelling.discard(job_id)
+
+            JOB_RUN_SECONDS.observe(time.perf_counter() - start, status=status)
+            await asyncio.to_thread(self._finish, job_id, status, result, error)
+            self._notify(job_id)
+            if time.time() - self._last_purge > 3600:
+                await asyncio.to_thread(self._purge)
+
+    def _watch(self, job_id):
+        event = asyncio.Event()
+        self._waiters.setdefault(job_id, set()).add(event)
+        return event
+
+    def _unwatch(self, job_id, event):
+        events = self._waiters.get(job_id)
+        if events is not None:
+            events.discard(event)
+            if not events:
+                del self._waiters[job_id]
+
+    def _notify(self, job_id):
+        for event in self._waiters.pop(job_id, ()):
+            event.set()
+
+    # ---------------- API ----------------
+
+    async def submit(self, payload, priority=0):
+        """
+        Queue a job; returns it (status "queued"). Raises QueueFull when
+        max_queued jobs are already waiting.
+        """
+        job = await asyncio.to_thread(self._insert, payload, priority)
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return job
+
+    async def get(self, job_id, wait=0):
+        """
+        The job, or None if unknown. With wait > 0, long-polls: returns
+        as soon as the job is finished, or after `wait` seconds.
+
+        A job finished in this process wakes the call at once; one
+        finished by another process is seen on the next read of its row,
+        every `poll` seconds.
+        """
+        if wait <= 0:
+            return await asyncio.to_thread(self._get, job_id)
+
+        deadline = time.monotonic() + wait
+        # Registered before reading, so a finish in between still wakes us
+        event = self._watch(job_id)
+        try:
+            while True:
+                job = await asyncio.to_thread(self._get, job_id)
+                remaining = deadline - time.monotonic()
+                if job is None or job["status"] in FINISHED or remaining <= 0:
+                    return job
+                try:
+                    await asyncio.wait_for(event.wait(), min(self.poll, remaining))
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self._unwatch(job_id, event)
+
+    async def cancel(self, job_id):
+        """
+        Cancel a queued or running job. Returns the job (finished jobs
+        are returned unchanged), or None if unknown.
+        """
+        task = self._running.get(job_id)
+        if task is None:
+            job = await asyncio.to_thread(self._cancel, job_id)
+            if job is not None and job["status"] == "cancelled":
+                self._notify(job_id)
+            return job
+
+        # Running here: the worker records the cancellation
+        event = self._watch(job_id)
+        self._cancelling.add(job_id)
+        task.cancel()
+        try:
+            await event.wait()
+        finally:
+            self._unwatch(job_id, event)
+        return await asyncio.to_thread(self._get, job_id)
+
+    async def list(self, status=None, limit=50):
+        return await asyncio.to_thread(self._list, status, limit)
+
+    async def stats(self):
+        return await asyncio.to_thread(self._stats)
+
+
+def _alive(pid):
+    if os.name != "posix":
+        return True     # os.kill(pid, 0) is not a probe on Windows; the heartbeat decides
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True     # someone else's process
+    return True
+
+
+_default_queue = None
+_default_queue_lock = threading.Lock()
+
+
+def get_job_queue(run):
+    """
+    Process-wide job queue running run(payload) for each job.
+
+    CRM_JOBS_DB          SQLite file holding the queue (default crm_jobs.sqlite3)
+    CRM_JOB_WORKERS      jobs run at once (default 4)
+    CRM_JOB_MAX_QUEUED   queued jobs before submit() refuses (default 1000)
+    CRM_JOB_TTL          seconds finished jobs keep their result (default 7 days)
+    CRM_JOB_LEASE        seconds without a heartbeat before another process
+                         requeues a running job (default 60)
+    """
+    global _default_queue
+    with _default_queue_lock:
+        if _default_queue is None:
+            _default_queue = JobQueue(
+                JOBS_DB,
+                run,
+                workers=int(os.getenv("CRM_JOB_WORKERS", 4)),
+                max_queued=int(os.getenv("CRM_JOB_MAX_QUEUED", 1000)),
+                ttl=float(os.getenv("CRM_JOB_TTL", 7 * 24 * 3600)),
+                lease=float(os.getenv("CRM_JOB_LEASE", 60))
+            )
+        return _default_queue
@@ -0,0 +1,394 @@
+import atexit
+import json
+import os
+import threading
+
+from locks import FileLock
+from records import plain
+from store import DATASETS, CRMStore, _file_stamp, load_json, normalize_records, save_json
+
+
+def _dumps(obj):
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False, default=plain)
+
+
+def _fsync_dir(path):
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _drop_torn_tail(path):
+    """
+    Cut a torn last line (a write a crash cut short) off the file at
+    path. Nothing after it was committed, and a line appended to it
+    would be lost with it: replay stops at the first bad line.
+    """
+    try:
+        f = open(path, "r+b")
+    except FileNotFoundError:
+        return
+    with f:
+        end = f.seek(0, os.SEEK_END)
+        if not end:
+            return
+        f.seek(end - 1)
+        if f.read(1) == b"\n":
+            return
+        keep, pos = 0, end
+        while pos > 0:
+            start = max(0, pos - 65536)
+            f.seek(start)
+            newline = f.read(pos - start).rfind(b"\n")
+            if newline >= 0:
+                keep = start + newline + 1
+                break
+            pos = start
+        f.truncate(keep)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+class JournalStorage:
+    """
+    Append-only storage backend for CRMStore.
+
+    Every commit is appended to the journal as one compact JSON line
+    holding the added/updated records, so a torn last line loses at most
+    that commit. Loads replay the journal over the latest snapshot. Once
+    the journal passes compact_bytes, the store hands over a copy of its
+    state and a background thread writes a new snapshot (temp file +
+    rename) and drops the folded journal.
+
+    Files (defaults):
+      crm_snapshot.jsonl               one line per dataset
+      crm_journal.jsonl                commits since the snapshot
+      crm_journal.jsonl.compacting     journal being folded in
+
+    Until the first snapshot exists the legacy JSON files serve as one,
+    so an existing CRM is picked up as-is; import_json()/export_json()
+    move data between the two formats explicitly.
+
+    Journal writes are fsynced in batches every sync_interval seconds by a
+    background thread (0 = fsync on every commit). A torn last line left
+    by a crash is cut off before anything is appended after it.
+
+    Several processes may share the files: writers take turns through
+    write_lock(), a commit reopens the journal if another process rotated
+    it, and a background snapshot is only installed if nobody folded more
+    into the compacting journal meanwhile.
+    """
+
+    def __init__(self, snapshot_path="crm_snapshot.jsonl",
+                 journal_path="crm_journal.jsonl",
+                 json_paths=None,
+                 compact_bytes=8 * 1024 * 1024,
+                 sync_interval=0.05):
+        json_paths = dict(json_paths or {})
+        self.snapshot_path = snapshot_path
+        self.journal_path = journal_path
+        self.compacting_path = journal_path + ".compacting"
+        self.json_paths = {name: json_paths.get(name, spec[0]) for name, spec in DATASETS.items()}
+        self.compact_bytes = compact_bytes
+        self.sync_interval = sync_interval
+
+        self._lock = threading.RLock()
+        self.lock_path = journal_path + ".lock"
+        self._write_lock = FileLock(self.lock_path)
+        with self._write_lock:
+            _drop_torn_tail(journal_path)
+        self._journal = open(journal_path, "a", encoding="utf-8")
+        self._unsynced = False
+        self._closed = threading.Event()
+        self._compaction = None
+        self._compacting_stamp = None   # compacting journal as we rotated it
+        self._generation = 0
+        self._known = self._files_stamp()
+
+        if sync_interval > 0:
+            threading.Thread(target=self._sync_loop, daemon=True).start()
+        atexit.register(self.close)
+
+    # ---------------- change detection ----------------
+
+    def _files_stamp(self):
+        paths = [self.snapshot_path, self.compacting_path, self.journal_path]
+        if not os.path.exists(self.snapshot_path):
+            paths += self.json_paths.values()
+        return tuple(_file_stamp(path) for path in paths)
+
+    def _own_write(self):
+        self._known = self._files_stamp()
+
+    def stamp(self, name):
+        # Own writes refresh self._known, so only outside changes (another
+        # process, a hand edit) move the generation and trigger a reload.
+        with self._lock:
+            current = self._files_stamp()
+            if current != self._known:
+                self._known = current
+                self._generation += 1
+            return self._generation
+
+    # ---------------- reads ----------------
+
+    def _snapshot_records(self, name):
+        if not os.path.exists(self.snapshot_path):
+            return normalize_records(load_json(self.json_paths[name]), DATASETS[name][1])
+
+        prefix = _dumps({"ds": name})[:-1] + ","
+        with open(self.snapshot_path, "r", encoding="utf-8") as f:
+            for line in f:
+                # Only parse the line for this dataset
+                if line.startswith(prefix):
+                    return json.loads(line)["records"]
+        return []
+
+    def _entries(self, path):
+        if not os.path.exists(path):
+            return
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    # Torn write from a crash; nothing after it was committed
+                    return
+
+    def load(self, name):
+        id_field = DATASETS[name][1]
+        with self._lock:
+            self._journal.flush()
+            records = self._snapshot_records(name)
+            positions = {r.get(id_field): pos for pos, r in enumerate(records)}
+
+            for path in (self.compacting_path, self.journal_path):
+                for entry in self._entries(path):
+                    for op in entry["ops"]:
+                        if op["ds"] != name:
+                            continue
+                        if "all" in op:
+                            records = op["all"]
+                            positions = {r.get(id_field): pos for pos, r in enumerate(records)}
+                            continue
+                        # Upserts by primary key, so replaying twice is harmless
+                        for record in op["put"]:
+                            pos = positions.get(record.get(id_field))
+                            if pos is None:
+                                positions[record.get(id_field)] = len(records)
+                                records.append(record)
+                            else:
+                                records[pos] = record
+            return records
+
+    # ---------------- writes ----------------
+
+    def commit(self, changes):
+        ops = []
+        for name, records, changed in changes:
+            if changed is None:
+                ops.append({"ds": name, "all": records})
+            else:
+                ops.append({"ds": name, "put": changed})
+        line = _dumps({"ops": ops}) + "\n"
+
+        with self._lock:
+            # Under the write lock (see write_lock()): nobody else is
+            # appending, so an unterminated line is a crashed writer's
+            self._reopen_if_moved()
+            _drop_torn_tail(self.journal_path)
+            self._journal.write(line)
+            self._journal.flush()
+            if self.sync_interval > 0:
+                self._unsynced = True
+            else:
+                os.fsync(self._journal.fileno())
+            self._own_write()
+
+    def _reopen_if_moved(self):
+        """
+        Follow a rotation done by another process: our handle would still
+        point at the file now named .compacting.
+        """
+        try:
+            moved = os.stat(self.journal_path).st_ino != os.fstat(self._journal.fileno()).st_ino
+        except FileNotFoundError:
+            moved = True
+        if moved:
+            self._journal.flush()
+            os.fsync(self._journal.fileno())
+            self._journal.close()
+            self._unsynced = False
+            self._journal = open(self.journal_path, "a", encoding="utf-8")
+
+    def write_lock(self):
+        return self._write_lock
+
+    def _sync_loop(self):
+        while not self._closed.wait(self.sync_interval):
+            with self._lock:
+                if self._unsynced and not self._journal.closed:
+                    os.fsync(self._journal.fileno())
+                    self._unsynced = False
+
+    # ---------------- compaction ----------------
+
+    def wants_compaction(self):
+        with self._lock:
+            if self._compaction is not None and self._compaction.is_alive():
+                return False
+            return os.fstat(self._journal.fileno()).st_size >= self.compact_bytes
+
+    def _rotate(self):
+        """
+        Move the live journal aside so new commits start a fresh one.
+        """
+        self._reopen_if_moved()
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+        self._journal.close()
+        self._unsynced = False
+        _drop_torn_tail(self.journal_path)
+
+        if os.path.exists(self.compacting_path):
+            _drop_torn_tail(self.compacting_path)
+            # A previous compaction never finished; keep folding into it
+            with open(self.journal_path, "r", encoding="utf-8") as src, \
+                    open(self.compacting_path, "a", encoding="utf-8") as dst:
+                for line in src:
+                    dst.write(line)
+                dst.flush()
+                os.fsync(dst.fileno())
+            os.remove(self.journal_path)
+        else:
+            os.replace(self.journal_path, self.compacting_path)
+
+        self._journal = open(self.journal_path, "a", encoding="utf-8")
+        _fsync_dir(self.journal_path)
+        self._compacting_stamp = _file_stamp(self.compacting_path)
+
+    def _write_snapshot(self, state):
+        tmp_path = self.snapshot_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for name in DATASETS:
+                f.write(_dumps({"ds": name, "records": state.get(name, [])}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+        with self._lock:
+            if _file_stamp(self.compacting_path) != self._compacting_stamp:
+                # Another process folded newer commits in; its snapshot wins
+                os.remove(tmp_path)
+                return
+            os.replace(tmp_path, self.snapshot_path)
+            _fsync_dir(self.snapshot_path)
+            if os.path.exists(self.compacting_path):
+                os.remove(self.compacting_path)
+            self._own_write()
+
+    def _write_snapshot_locked(self, state):
+        # Own handle on the lock file: the store's transaction may hold
+        # write_lock() in another thread of this process
+        lock = FileLock(self.lock_path)
+        try:
+            with lock:
+                self._write_snapshot(state)
+        finally:
+            lock.close()
+
+    def compact(self, state, background=True):
+        """
+        Fold everything journaled so far into a new snapshot of `state`,
+        which must already include every committed change.
+        """
+        with self._lock:
+            if self._compaction is not None and self._compaction.is_alive():
+                return
+            self._rotate()
+            self._own_write()
+            if not background:
+                self._write_snapshot(state)
+                return
+            self._compaction = threading.Thread(
+                target=self._write_snapshot_locked, args=(state,), daemon=True
+            )
+            self._compaction.start()
+
+    # ---------------- import / export ----------------
+
+    def export_json(self, paths=None):
+        """
+        Write the current state out as the legacy pretty-printed JSON files.
+        """
+        paths = dict(paths or self.json_paths)
+        with self._lock:
+            for name in DATASETS:
+                if name in paths:
+                    save_json(paths[name], self.load(name))
+            self._own_write()
+
+    def import_json(self, paths=None):
+        """
+        Replace the datasets named in `paths` with those legacy JSON
+        files; the other datasets keep their current records.
+        """
+        paths = dict(paths or self.json_paths)
+        state = {
+            name: normalize_records(load_json(paths[name]), DATASETS[name][1])
+            for name in DATASETS if name in paths
+        }
+        self.wait()
+        with self._lock:
+            # The snapshot holds every dataset, so carry the others over
+            for name in DATASETS:
+                if name not in state:
+                    state[name] = self.load(name)
+            self.compact(state, background=False)
+            # Not a change a store made itself: make it reload
+            self._generation += 1
+
+    def wait(self):
+        """
+        Block until a running compaction has finished.
+        """
+        compaction = self._compaction
+        if compaction is not None:
+            compaction.join()
+
+    def close(self):
+        if self._closed.is_set():
+            return
+        self.wait()
+        with self._lock:
+            self._closed.set()
+            self._journal.flush()
+            os.fsync(self._journal.fileno())
+            self._journal.close()
+            self._write_lock.close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Manage the CRM journal storage.")
+    parser.add_argument("command", choices=["import", "export", "compact"],
+                        help="import/export the legacy JSON files, or compact now")
+    args = parser.parse_args()
+
+    storage = JournalStorage()
+    if args.command == "import":
+        storage.import_json()
+    elif args.command == "export":
+        storage.export_json()
+    else:
+        store = CRMStore(storage=storage)
+        store.compact()
+        storage.wait()
+    storage.close()
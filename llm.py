@@ -0,0 +1,332 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+import weakref
+
+# Model of the extraction requests; part of the request, so of the cache key
+LLM_MODEL = os.getenv("CRM_LLM_MODEL", "gpt-5.1")
+# Seconds one extraction call may take, streaming included (0 = no limit)
+LLM_DEADLINE = float(os.getenv("CRM_LLM_DEADLINE", 120)) or None
+
+
+class DeadlineExceeded(TimeoutError):
+    """
+    An LLM call did not finish within its deadline.
+    """
+
+
+def replay_key(request):
+    """
+    Key of a request for recorded responses: everything but the model,
+    so recordings made against one model replay under the mock.
+    """
+    blob = json.dumps({k: v for k, v in request.items() if k != "model"},
+                      sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+def _deadline(timeout):
+    return None if timeout is None else time.monotonic() + timeout
+
+
+def _check(deadline, timeout):
+    if deadline is not None and time.monotonic() > deadline:
+        raise DeadlineExceeded(f"no complete answer within {timeout:g}s")
+
+
+# ---------------- OpenAI over a pooled HTTP client ----------------
+
+class OpenAIProvider:
+    """
+    Streams Responses API completions through one pooled HTTP client per
+    process (and one async client per event loop), so connections are
+    kept alive and reused across calls.
+
+    A provider offers:
+      model                          model name put in requests
+      stream(request, timeout)       iterator of text deltas
+      astream(request, timeout)      async iterator of text deltas
+      close()
+
+    timeout is a deadline for the whole call in seconds; past it the
+    stream is dropped and DeadlineExceeded raised. Each read also waits
+    at most read_timeout. http2 needs the h2 package; without it the
+    client stays on HTTP/1.1.
+    """
+
+    def __init__(self, model=LLM_MODEL, api_key=None, base_url=None,
+                 max_connections=100, max_keepalive=20, keepalive_expiry=30.0,
+                 connect_timeout=5.0, read_timeout=60.0, http2=False):
+        self.model = model
+        self.api_key = api_key or os.getenv("OPENAI_API_KEY")
+        self.base_url = base_url or os.getenv("OPENAI_BASE_URL")
+        self.max_connections = max_connections
+        self.max_keepalive = max_keepalive
+        self.keepalive_expiry = keepalive_expiry
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.http2 = http2
+        self._client = None
+        self._async_clients = weakref.WeakKeyDictionary()   # event loop -> client
+        self._lock = threading.Lock()
+
+    def _http_options(self):
+        import openai
+
+        # The SDK's own HTTP types (httpx), so the versions always match
+        limits = type(openai.DEFAULT_CONNECTION_LIMITS)(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive,
+            keepalive_expiry=self.keepalive_expiry
+        )
+        timeout = openai.Timeout(self.read_timeout, connect=self.connect_timeout)
+        http2 = self.http2
+        if http2:
+            try:
+                import h2  # noqa: F401
+            except ImportError:
+                print("[LLM] http2 requested but h2 is not installed; using HTTP/1.1")
+                http2 = False
+        return dict(limits=limits, timeout=timeout, http2=http2)
+
+    def _sync_client(self):
+        with self._lock:
+            if self._client is None:
+                import openai
+                self._client = openai.OpenAI(
+                    api_key=self.api_key, base_url=self.base_url,
+                    http_client=openai.DefaultHttpxClient(**self._http_options())
+                )
+            return self._client
+
+    def _async_client(self):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            client = self._async_clients.get(loop)
+            if client is None:
+                import openai
+                client = self._async_clients[loop] = openai.AsyncOpenAI(
+                    api_key=self.api_key, base_url=self.base_url,
+                    http_client=openai.DefaultAsyncHttpxClient(**self._http_options())
+                )
+            return client
+
+    def _options(self, timeout):
+        # Per-read cap: never wait past the call's deadline for one read
+        if timeout is None:
+            return {}
+        return {"timeout": min(self.read_timeout, max(timeout, 0.001))}
+
+    def stream(self, request, timeout=None):
+        deadline = _deadline(timeout)
+        client = self._sync_client()
+        with client.responses.stream(**request, **self._options(timeout)) as events:
+            for event in events:
+                _check(deadline, timeout)
+                if event.type == "response.output_text.delta":
+                    yield event.delta
+
+    async def astream(self, request, timeout=None):
+        deadline = _deadline(timeout)
+        client = self._async_client()
+        async with client.responses.stream(**request, **self._options(timeout)) as events:
+            async for event in events:
+                _check(deadline, timeout)
+                if event.type == "response.output_text.delta":
+                    yield event.delta
+
+    def close(self):
+        with self._lock:
+            if self._client is not None:
+                self._client.close()
+                self._client = None
+
+
+# ---------------- local mock ----------------
+
+SAMPLE_EXTRACTION = {
+    "contacts": [{"temp_id": "c1", "existing_id": None, "name": "Priya Shah",
+                  "job_title": "CTO", "email": None, "phone": None,
+                  "decision_power": "High"}],
+    "companies": [{"temp_id": "co1", "existing_id": None, "name": "Nimbus Analytics",
+                   "industry": "SaaS", "size": "Mid", "location": "Pune"}],
+    "deals": [{"temp_id": "d1", "existing_id": None, "name": "Nimbus pilot",
+               "value": 25000, "currency": "USD", "stage": "Discovery",
+               "timeline": "Q3", "next_steps": "Send proposal",
+               "competitors": ["HubSpot"]}],
+    "actions": [{"entity": "contact", "operation": "create",
+                 "target_temp_id": "c1", "reason": "New contact"}]
+}
+
+
+def load_recordings(path):
+    """
+    {replay key: text} from a JSONL file of {"key", "text"} lines.
+    """
+    recordings = {}
+    if path and os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                recordings[entry["key"]] = entry["text"]
+    return recordings
+
+
+class MockProvider:
+    """
+    Offline provider replaying recorded responses, for tests and load
+    tests without network access.
+
+    A request recorded earlier (see RecordingProvider) gets its recorded
+    text; any other request gets one of the recordings picked by its
+    key, or SAMPLE_EXTRACTION if there are none, so the same request
+    always gets the same answer. The text is streamed in `chunks` deltas
+    spread over `latency` seconds.
+    """
+
+    model = "mock"
+
+    def __init__(self, recordings=None, latency=0.0, chunks=20):
+        self.recordings = dict(recordings or {})
+        self.latency = latency
+        self.chunks = max(1, chunks)
+        self._fallback = sorted(self.recordings)
+        self.calls = 0
+
+    def text(self, request):
+        key = replay_key(request)
+        if key in self.recordings:
+            return self.recordings[key]
+        if self._fallback:
+            return self.recordings[self._fallback[int(key, 16) % len(self._fallback)]]
+        return json.dumps(SAMPLE_EXTRACTION)
+
+    def _pieces(self, request):
+        self.calls += 1
+        text = self.text(request)
+        size = max(1, -(-len(text) // self.chunks))
+        return [text[i:i + size] for i in range(0, len(text), size)] or [""]
+
+    def stream(self, request, timeout=None):
+        deadline = _deadline(timeout)
+        pieces = self._pieces(request)
+        for piece in pieces:
+            time.sleep(self.latency / len(pieces))
+            _check(deadline, timeout)
+            yield piece
+
+    async def astream(self, request, timeout=None):
+        deadline = _deadline(timeout)
+        pieces = self._pieces(request)
+        for piece in pieces:
+            await asyncio.sleep(self.latency / len(pieces))
+            _check(deadline, timeout)
+            yield piece
+
+    def close(self):
+        pass
+
+
+class RecordingProvider:
+    """
+    Wraps a provider and appends every complete response to a JSONL
+    file that MockProvider can replay.
+    """
+
+    def __init__(self, inner, path):
+        self.inner = inner
+        self.model = inner.model
+        self.path = path
+        self._lock = threading.Lock()
+
+    def _record(self, request, parts):
+        line = json.dumps({"key": replay_key(request), "text": "".join(parts)}, ensure_ascii=False)
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+    def stream(self, request, timeout=None):
+        parts = []
+        for delta in self.inner.stream(request, timeout):
+            parts.append(delta)
+            yield delta
+        self._record(request, parts)
+
+    async def astream(self, request, timeout=None):
+        parts = []
+        async for delta in self.inner.astream(request, timeout):
+            parts.append(delta)
+            yield delta
+        self._record(request, parts)
+
+    def close(self):
+        self.inner.close()
+
+
+# ---------------- process-wide provider ----------------
+
+_default_provider = None
+_default_provider_lock = threading.Lock()
+
+
+def _env_float(name, default):
+    return float(os.getenv(name, default))
+
+
+def get_provider():
+    """
+    Process-wide LLM provider.
+
+    CRM_LLM_PROVIDER          openai (default) or mock
+    CRM_LLM_MODEL             model name (default gpt-5.1)
+    CRM_LLM_MAX_CONNECTIONS   pool size (default 100)
+    CRM_LLM_MAX_KEEPALIVE     idle connections kept open (default 20)
+    CRM_LLM_KEEPALIVE_EXPIRY  seconds an idle connection is kept (default 30)
+    CRM_LLM_CONNECT_TIMEOUT   seconds (default 5)
+    CRM_LLM_READ_TIMEOUT      seconds per read (default 60)
+    CRM_LLM_HTTP2             1 to use HTTP/2 (needs h2)
+    CRM_LLM_RECORD            JSONL file to record responses to
+    CRM_MOCK_RESPONSES        JSONL recordings for the mock
+    CRM_MOCK_LATENCY          seconds per mock response (default 0)
+    CRM_MOCK_CHUNKS           deltas per mock response (default 20)
+    """
+    global _default_provider
+    with _default_provider_lock:
+        if _default_provider is None:
+            kind = os.getenv("CRM_LLM_PROVIDER", "openai")
+            if kind == "mock":
+                provider = MockProvider(
+                    load_recordings(os.getenv("CRM_MOCK_RESPONSES")),
+                    latency=_env_float("CRM_MOCK_LATENCY", 0),
+                    chunks=int(os.getenv("CRM_MOCK_CHUNKS", 20))
+                )
+            elif kind == "openai":
+                provider = OpenAIProvider(
+                    max_connections=int(os.getenv("CRM_LLM_MAX_CONNECTIONS", 100)),
+                    max_keepalive=int(os.getenv("CRM_LLM_MAX_KEEPALIVE", 20)),
+                    keepalive_expiry=_env_float("CRM_LLM_KEEPALIVE_EXPIRY", 30),
+                    connect_timeout=_env_float("CRM_LLM_CONNECT_TIMEOUT", 5),
+                    read_timeout=_env_float("CRM_LLM_READ_TIMEOUT", 60),
+                    http2=os.getenv("CRM_LLM_HTTP2", "0") == "1"
+                )
+            else:
+                raise ValueError(f"Unknown CRM_LLM_PROVIDER: {kind}")
+            if os.getenv("CRM_LLM_RECORD"):
+                provider = RecordingProvider(provider, os.getenv("CRM_LLM_RECORD"))
+            _default_provider = provider
+        return _default_provider
+
+
+def set_provider(provider):
+    """
+    Replace the process-wide provider (tests, benchmarks); returns the old one.
+    """
+    global _default_provider
+    with _default_provider_lock:
+        old, _default_provider = _default_provider, provider
+        return old
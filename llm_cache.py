@@ -0,0 +1,286 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+
+def cache_key(request):
+    """
+    Content address of an LLM request: hash of the model, parameters and
+    the full prompt, so any change to the CRM context is a new key.
+    """
+    blob = json.dumps(request, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+class DiskTier:
+    """
+    SQLite table of key -> JSON value with a TTL and a total size cap.
+    Over the cap, least recently used entries are evicted first.
+    """
+
+    def __init__(self, path, ttl=24 * 3600, max_bytes=64 * 1024 * 1024):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        import sqlite3
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+            "created REAL NOT NULL, accessed REAL NOT NULL, size INTEGER NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_accessed ON llm_cache (accessed)")
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if now - row[1] > self.ttl:
+                self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                return None
+            self._conn.execute("UPDATE llm_cache SET accessed = ? WHERE key = ?", (now, key))
+            return row[0]
+
+    def put(self, key, value):
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO llm_cache VALUES (?, ?, ?, ?, ?)",
+                    (key, value, now, now, len(value))
+                )
+                self._conn.execute("DELETE FROM llm_cache WHERE created < ?", (now - self.ttl,))
+                total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM llm_cache").fetchone()[0]
+                if total > self.max_bytes:
+                    # Walk from the least recently used until back under the cap
+                    doomed = []
+                    for old_key, size in self._conn.execute(
+                            "SELECT key, size FROM llm_cache ORDER BY accessed"):
+                        if total <= self.max_bytes:
+                            break
+                        doomed.append((old_key,))
+                        total -= size
+                    self._conn.executemany("DELETE FROM llm_cache WHERE key = ?", doomed)
+                self._conn.execute("COMMIT")
+            except:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_cache")
+
+
+class ExtractionCache:
+    """
+    Two-tier cache for LLM extraction results.
+
+    Values are JSON-serialisable results stored as text, so every hit
+    hands out a fresh copy. The in-memory LRU keeps max_entries results;
+    the optional DiskTier keeps them across restarts. Concurrent calls
+    for the same key wait on the first one instead of calling the model
+    again. A None result (e.g. retries exhausted) is never cached.
+    """
+
+    def __init__(self, max_entries=256, disk=None):
+        self.max_entries = max_entries
+        self.disk = disk
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._inflight = {}             # key -> concurrent Future (threads)
+        self._async_inflight = {}       # (loop id, key) -> asyncio Future
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "coalesced": 0}
+
+    # ---------------- tiers ----------------
+
+    def _memory_get(self, key):
+        with self._lock:
+            value = self._memory.get(key)
+            if value is not None:
+                self._memory.move_to_end(key)
+                self.stats["memory_hits"] += 1
+            return value
+
+    def _disk_get(self, key):
+        if self.disk is None:
+            return None
+        value = self.disk.get(key)
+        if value is not None:
+            with self._lock:
+                self.stats["disk_hits"] += 1
+            self._remember(key, value)
+        return value
+
+    def _remember(self, key, value):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._memory[key] = value
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def _store(self, key, result):
+        if result is None:
+            return
+        value = json.dumps(result)
+        self._remember(key, value)
+        if self.disk is not None:
+            self.disk.put(key, value)
+
+    # ---------------- lookups ----------------
+
+    def get(self, key):
+        """
+        Cached result for key or None. Reads the disk tier, so call it
+        from a worker thread in async code if one is configured.
+        """
+        value = self._memory_get(key) or self._disk_get(key)
+        if value is None:
+            with self._lock:
+                self.stats["misses"] += 1
+            return None
+        return json.loads(value)
+
+    def put(self, key, result):
+        self._store(key, result)
+
+    def get_or_call(self, key, call):
+        """
+        Cached result for key, else call() once even if several threads
+        ask at the same time.
+        """
+        value = self._memory_get(key) or self._disk_get(key)
+        if value is not None:
+            return json.loads(value)
+
+        with self._lock:
+            waiting = self._inflight.get(key)
+            if waiting is None:
+                owner = self._inflight[key] = Future()
+                self.stats["misses"] += 1
+            else:
+                self.stats["coalesced"] += 1
+        if waiting is not None:
+            result = waiting.result()
+            return None if result is None else json.loads(json.dumps(result))
+
+        try:
+            result = call()
+            self._store(key, result)
+            owner.set_result(result)
+            return result
+        except BaseException as e:
+            owner.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+
+    async def aget_or_call(self, key, call):
+        """
+        get_or_call() for coroutines; call is a no-argument coroutine
+        function. The disk tier is read in a worker thread.
+        """
+        value = self._memory_get(key)
+        if value is None and self.disk is not None:
+            value = await asyncio.to_thread(self._disk_get, key)
+        if value is not None:
+            return json.loads(value)
+
+        loop = asyncio.get_running_loop()
+        slot = (id(loop), key)
+        with self._lock:
+            waiting = self._async_inflight.get(slot)
+            if waiting is None:
+                owner = self._async_inflight[slot] = loop.create_future()
+                self.stats["misses"] += 1
+            else:
+                self.stats["coalesced"] += 1
+        if waiting is not None:
+            # asyncio.wait doesn't cancel `waiting` if this task is cancelled
+            await asyncio.wait([waiting])
+            if waiting.cancelled():
+                # The call we were sharing was abandoned; make our own
+                return await self.aget_or_call(key, call)
+            result = waiting.result()
+            return None if result is None else json.loads(json.dumps(result))
+
+        try:
+            result = await call()
+            if self.disk is not None:
+                await asyncio.to_thread(self._store, key, result)
+            else:
+                self._store(key, result)
+            owner.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            owner.cancel()
+            raise
+        except BaseException as e:
+            owner.set_exception(e)
+            # Nobody may be waiting; don't warn about an unretrieved error
+            owner.exception()
+            raise
+        finally:
+            with self._lock:
+                del self._async_inflight[slot]
+
+    # ---------------- housekeeping ----------------
+
+    def info(self):
+        with self._lock:
+            info = dict(self.stats, memory_entries=len(self._memory))
+        lookups = info["memory_hits"] + info["disk_hits"] + info["misses"]
+        info["hit_rate"] = round((info["memory_hits"] + info["disk_hits"]) / lookups, 3) if lookups else 0.0
+        if self.disk is not None:
+            info["disk_entries"] = len(self.disk)
+        return info
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """
+    Process-wide extraction cache.
+
+    CRM_CACHE_SIZE   in-memory entries (default 256, 0 disables the tier)
+    CRM_CACHE_DB     SQLite file for the on-disk tier (unset = memory only)
+    CRM_CACHE_TTL    on-disk lifetime in seconds (default 86400)
+    CRM_CACHE_MAX_MB on-disk size cap (default 64)
+    """
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            disk = None
+            if os.getenv("CRM_CACHE_DB"):
+                disk = DiskTier(
+                    os.getenv("CRM_CACHE_DB"),
+                    ttl=float(os.getenv("CRM_CACHE_TTL", 24 * 3600)),
+                    max_bytes=int(float(os.getenv("CRM_CACHE_MAX_MB", 64)) * 1024 * 1024)
+                )
+            _default_cache = ExtractionCache(int(os.getenv("CRM_CACHE_SIZE", 256)), disk)
+        return _default_cache
@@ -0,0 +1,84 @@
+import os
+import time
+
+try:
+    import fcntl
+except ImportError:         # Windows
+    fcntl = None
+    import msvcrt
+
+
+class FileLock:
+    """
+    Exclusive lock shared by every process that opens the same path, so
+    several server workers can take turns writing the CRM files.
+
+    The lock file also holds a write counter. Whoever holds the lock
+    reads it on entry (`seq`) and bumps it after writing, which tells the
+    next holder whether anyone else wrote in between, independent of
+    file timestamps and their resolution.
+
+    Not reentrant; CRMStore takes it once per outermost transaction.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.seq = None
+        self._fd = None
+
+    def _open(self):
+        if self._fd is None:
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        return self._fd
+
+    def _read_seq(self):
+        os.lseek(self._fd, 0, os.SEEK_SET)
+        text = os.read(self._fd, 32).decode("ascii", "ignore").strip()
+        return int(text) if text.isdigit() else 0
+
+    def peek(self):
+        """
+        Current write counter, without taking the lock.
+        """
+        try:
+            with open(self.path, "rb") as f:
+                text = f.read(32).decode("ascii", "ignore").strip()
+        except FileNotFoundError:
+            return 0
+        return int(text) if text.isdigit() else 0
+
+    def __enter__(self):
+        fd = self._open()
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        else:
+            os.lseek(fd, 0, os.SEEK_SET)
+            while True:
+                try:
+                    msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+                    break
+                except OSError:
+                    time.sleep(0.005)
+        self.seq = self._read_seq()
+        return self
+
+    def bump(self):
+        """
+        Record a write; call while holding the lock.
+        """
+        self.seq += 1
+        os.lseek(self._fd, 0, os.SEEK_SET)
+        os.write(self._fd, f"{self.seq:<20d}".encode("ascii"))
+
+    def __exit__(self, exc_type, exc, tb):
+        if fcntl is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        else:
+            os.lseek(self._fd, 0, os.SEEK_SET)
+            msvcrt.locking(self._fd, msvcrt.LK_UNLCK, 1)
+        return False
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
@@ -0,0 +1,245 @@
+import contextvars
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Seconds; from index lookups (sub-ms) to whole LLM calls (minutes)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+# 1 = send every response's stage breakdown in a Server-Timing header
+# (otherwise only when the request asks with "X-CRM-Timing: 1")
+SERVER_TIMING = os.getenv("CRM_SERVER_TIMING", "0") == "1"
+
+
+# ---------------- metrics (Prometheus text format) ----------------
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=""):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Registry:
+    """
+    The process's metrics, rendered for a Prometheus scrape.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines += metric.samples()
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+class Counter:
+    """
+    Monotonic count, optionally split by labels:
+        CALLS = Counter("crm_llm_calls_total", "LLM calls", ["kind"])
+        CALLS.inc(kind="repair")
+    """
+
+    kind = "counter"
+
+    def __init__(self, name, help, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def _key(self, labels):
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{_labels(self.labelnames, key)} {_number(v)}" for key, v in values]
+
+
+class Histogram:
+    """
+    Distribution of observed values over fixed buckets (cumulative
+    counts per upper bound, plus sum and count, as Prometheus expects).
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS, registry=REGISTRY):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}       # labels -> [per-bucket counts (last = +Inf), sum]
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[n]) for n in self.labelnames)
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][i] += 1
+            entry[1] += value
+
+    def samples(self):
+        with self._lock:
+            values = sorted((key, list(counts), total) for key, (counts, total) in self._values.items())
+        lines = []
+        for key, counts, total in values:
+            running = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                running += count
+                le = f'le="{bound}"' if bound == "+Inf" else f'le="{bound:g}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {running}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {total!r}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {running}")
+        return lines
+
+
+class CallbackMetric:
+    """
+    Values read at scrape time from fn(), which returns
+    {label values tuple: value}; for state kept elsewhere (cache stats).
+    """
+
+    def __init__(self, name, help, kind, labelnames, fn, registry=REGISTRY):
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.labelnames = tuple(labelnames)
+        self.fn = fn
+        registry.register(self)
+
+    def samples(self):
+        return [f"{self.name}{_labels(self.labelnames, key)} {_number(v)}"
+                for key, v in sorted(self.fn().items())]
+
+
+# ---------------- pipeline metrics ----------------
+
+STAGE_SECONDS = Histogram("crm_stage_seconds", "Time spent per pipeline stage", ["stage"])
+LLM_FIRST_TOKEN_SECONDS = Histogram("crm_llm_first_token_seconds",
+                                    "Time from sending an LLM request to its first text delta")
+LLM_CALLS = Counter("crm_llm_calls_total", "LLM calls by kind and outcome", ["kind", "outcome"])
+LLM_RETRIES = Counter("crm_llm_retries_total", "LLM calls repeated after a failed one", ["reason"])
+PROMPT_TOKENS = Counter("crm_prompt_tokens_total", "Tokens in the prompts built")
+LLM_INPUT_BYTES = Counter("crm_llm_input_bytes_total", "Prompt bytes sent to the LLM")
+LLM_OUTPUT_BYTES = Counter("crm_llm_output_bytes_total", "Response bytes received from the LLM")
+JSON_REPAIRS = Counter("crm_json_repairs_total", "LLM answers that needed json_repair", ["outcome"])
+
+
+# ---------------- spans and per-request breakdown ----------------
+
+class Timings:
+    """
+    Seconds per stage for one request, summed over repeated stages
+    (e.g. every chunk's "llm"), shared by the threads working for it.
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage, seconds):
+        with self._lock:
+            total, count = self.stages.get(stage, (0.0, 0))
+            self.stages[stage] = (total + seconds, count + 1)
+
+    def server_timing(self):
+        """
+        Server-Timing header value: `llm;dur=812.4;desc="2x", ...` (ms).
+        """
+        with self._lock:
+            stages = list(self.stages.items())
+        return ", ".join(
+            f"{stage};dur={total * 1000:.1f}" + (f';desc="{count}x"' if count > 1 else "")
+            for stage, (total, count) in stages
+        )
+
+
+_timings = contextvars.ContextVar("crm_timings", default=None)
+
+
+@contextmanager
+def collect():
+    """
+    Record the spans of the current context (the request, and the
+    threads and tasks it starts) into a fresh Timings.
+    """
+    timings = Timings()
+    token = _timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _timings.reset(token)
+
+
+def current_timings():
+    """
+    The Timings collecting the current request's spans, or None.
+    """
+    return _timings.get()
+
+
+def record(stage, seconds, histogram=None):
+    """
+    Add one stage's duration to its histogram (crm_stage_seconds unless
+    given) and to the current request's breakdown.
+    """
+    if histogram is None:
+        STAGE_SECONDS.observe(seconds, stage=stage)
+    else:
+        histogram.observe(seconds)
+    timings = _timings.get()
+    if timings is not None:
+        timings.add(stage, seconds)
+
+
+@contextmanager
+def span(stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - start)
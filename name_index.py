@@ -0,0 +1,182 @@
+from array import array
+from collections import Counter, defaultdict
+from fractions import Fraction
+from math import ceil, floor
+
+from rapidfuzz import fuzz, process
+
+
+def normalize_name(name):
+    return (name or "").lower()
+
+
+def _key(tokens):
+    # token_set_ratio compares sorted, de-duplicated tokens when two
+    # names share no token; blocking works on that same string.
+    return " ".join(sorted(tokens))
+
+
+def _gram_items(key):
+    """
+    Character bigrams of key, numbered per occurrence so that multiset
+    overlap between two keys becomes plain set overlap.
+    """
+    seen = defaultdict(int)
+    items = []
+    for i in range(len(key) - 1):
+        gram = key[i:i + 2]
+        items.append((gram, seen[gram]))
+        seen[gram] += 1
+    return items
+
+
+class NameIndex:
+    """
+    Blocking index over the "name" field of a list of CRM records.
+
+    Names are lower-cased once at build time. match() only scores
+    records that can possibly reach the cutoff under
+    fuzz.token_set_ratio:
+
+    * records sharing a token with the query, and
+    * records whose sorted token string is within the length window
+      the cutoff allows and shares enough character bigrams with the
+      query's.
+
+    Candidates are then scored in one rapidfuzz.process.extract call, so
+    results are identical to scoring every record.
+    """
+
+    def __init__(self, records, field="name"):
+        self.records = records
+        self.field = field
+        self.names = []
+        self._tokens = defaultdict(lambda: array("i"))
+        self._grams = defaultdict(dict)     # item -> key length -> positions
+        self._by_len = defaultdict(lambda: array("i"))
+
+        for record in records or ():
+            self._index(record)
+
+    @classmethod
+    def from_names(cls, names):
+        """
+        Index bare names; positions then refer to the order of `names`.
+        """
+        index = cls(None)
+        for name in names:
+            index.add_name(name)
+        return index
+
+    def __len__(self):
+        return len(self.names)
+
+    def add(self, record):
+        """
+        Index a record that was appended to self.records.
+        """
+        self._index(record)
+
+    def update(self, pos, record, fields):
+        """
+        Re-index the record at pos for a pending update of `fields`.
+
+        Postings of the old name are left in place: they only add
+        candidates, and match() always scores the current name.
+        """
+        if self.field in fields:
+            self.update_name(pos, fields[self.field])
+
+    def update_name(self, pos, name):
+        name = normalize_name(name)
+        if name != self.names[pos]:
+            self.names[pos] = name
+            self._post(pos, name)
+
+    def add_name(self, name):
+        name = normalize_name(name)
+        self.names.append(name)
+        self._post(len(self.names) - 1, name)
+
+    def _index(self, record):
+        self.add_name(record.get(self.field))
+
+    def _post(self, pos, name):
+        tokens = set(name.split())
+        key = _key(tokens)
+
+        self._by_len[len(key)].append(pos)
+        for token in tokens:
+            self._tokens[token].append(pos)
+        for item in _gram_items(key):
+            self._grams[item].setdefault(len(key), array("i")).append(pos)
+
+    # ---------------- blocking ----------------
+
+    def candidates(self, query, score_cutoff):
+        """
+        Positions of every record that may score >= score_cutoff against
+        the (already normalized) query.
+        """
+        tokens = set(query.split())
+        if not tokens:
+            return []
+
+        p = Fraction(score_cutoff)
+        if p * 3 <= 200:
+            # Too loose for the bigram bound to prune anything
+            return range(len(self.names))
+
+        found = set()
+        for token in tokens:
+            found.update(self._tokens.get(token, ()))
+
+        key = _key(tokens)
+        lq = len(key)
+        items = _gram_items(key)
+        postings = [self._grams.get(item) or {} for item in items]
+
+        # ratio >= p bounds the length ratio of the two keys ...
+        lo = ceil(lq * p / (200 - p))
+        hi = floor(lq * (200 - p) / p)
+
+        for length in range(max(lo, 1), hi + 1):
+            # ... and means indel distance d <= (1 - p/100)(lq + length).
+            # The LCS then falls into at most d + 1 matching runs, so the
+            # keys share at least LCS - d - 1 bigrams.
+            need = ceil((lq + length) * (3 * p - 200) / 200 - 1)
+            if need <= 0:
+                found.update(self._by_len.get(length, ()))
+            elif need == 1:
+                for by_len in postings:
+                    found.update(by_len.get(length, ()))
+            elif need <= len(items):
+                counts = Counter()
+                for by_len in postings:
+                    counts.update(by_len.get(length, ()))
+                found.update(pos for pos, n in counts.items() if n >= need)
+
+        return sorted(found)
+
+    # ---------------- scoring ----------------
+
+    def match(self, query, score_cutoff):
+        """
+        [(position, score)] for records scoring >= score_cutoff, in
+        record order.
+        """
+        query = normalize_name(query)
+        positions = self.candidates(query, score_cutoff)
+        if not positions:
+            return []
+
+        names = self.names
+        hits = process.extract(
+            query,
+            [names[pos] for pos in positions],
+            scorer=fuzz.token_set_ratio,
+            processor=None,
+            score_cutoff=score_cutoff,
+            limit=None
+        )
+        return sorted((positions[i], score) for _, score, i in hits)
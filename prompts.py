@@ -0,0 +1,184 @@
+import json
+import os
+from collections.abc import Mapping
+
+# Token budget for the whole extraction prompt, and the cap on the reply.
+# The reply cap stays at the original 20000: a long transcript with many
+# contacts and deals yields a large JSON, and a truncated one only fails
+# validation and costs a retry.
+PROMPT_BUDGET = int(os.getenv("CRM_PROMPT_BUDGET", 3000))
+MAX_OUTPUT_TOKENS = int(os.getenv("CRM_MAX_OUTPUT_TOKENS", 20000))
+
+HEADER = (
+    "You are an intelligent CRM extraction assistant.\n"
+    "Return ONLY valid JSON. No explanations. Context records are compact "
+    "JSON; missing fields are unknown."
+)
+
+SCHEMA = (
+    '{"contacts":[{"temp_id":"c1","existing_id":null,"name":"string","job_title":"string",'
+    '"email":"string","phone":"string","decision_power":"yes/no/maybe/Unknown"}],'
+    '"companies":[{"temp_id":"co1","existing_id":null,"name":"string","industry":"string",'
+    '"size":"string","location":"string"}],'
+    '"deals":[{"temp_id":"d1","existing_id":null,"name":"string","value":"number or Unknown",'
+    '"currency":"string","stage":"string","timeline":"string","next_steps":"string",'
+    '"competitors":["string"]}],'
+    '"actions":[{"entity":"contact/company/deal","operation":"create/update",'
+    '"target_temp_id":"c1/co1/d1","reason":"string"}]}'
+)
+
+
+# ---------------- token estimate ----------------
+
+_encoding = None
+TOKENIZER = None        # set when the first count is made
+
+
+def _load_tokenizer():
+    # tiktoken takes a while to import and load; only pay for it when a
+    # prompt is actually measured
+    global _encoding, TOKENIZER
+    try:
+        import tiktoken
+        _encoding = tiktoken.get_encoding("o200k_base")
+        TOKENIZER = "tiktoken:o200k_base"
+    except Exception:
+        # No local tokenizer: ~4 characters per token for English/JSON
+        _encoding = False
+        TOKENIZER = "chars/4"
+
+
+def count_tokens(text):
+    if TOKENIZER is None:
+        _load_tokenizer()
+    if _encoding:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return (len(text) + 3) // 4
+
+
+def tokenizer_name():
+    if TOKENIZER is None:
+        _load_tokenizer()
+    return TOKENIZER
+
+
+# ---------------- serialization ----------------
+
+def drop_nulls(value):
+    """
+    Copy of value without None fields (recursively in dicts and lists).
+    """
+    if isinstance(value, Mapping):      # dicts and store records
+        return {k: drop_nulls(v) for k, v in value.items() if v is not None}
+    if isinstance(value, list):
+        return [drop_nulls(v) for v in value if v is not None]
+    return value
+
+
+def compact_json(value):
+    return json.dumps(drop_nulls(value), separators=(",", ":"), ensure_ascii=False)
+
+
+def _shorten(text, limit):
+    if text is None or len(text) <= limit:
+        return text
+    # Keep the start and the end; the middle of a summary is the least
+    # likely to hold names, amounts or next steps
+    head = limit * 2 // 3
+    tail = limit - head
+    return text[:head].rstrip() + " […] " + text[-tail:].lstrip()
+
+
+# ---------------- prompt ----------------
+
+def _render(meeting_notes, contacts, company, deals, meetings):
+    sections = [
+        ("header", HEADER),
+        ("contacts", "EXISTING CONTACTS:\n" + compact_json(contacts)),
+        ("company", "EXISTING COMPANY:\n" + compact_json(company)),
+        ("deals", "PREVIOUS DEALS:\n" + compact_json(deals)),
+        ("meetings", "PREVIOUS MEETINGS:\n" + compact_json(meetings)),
+        ("transcript", "NEW MEETING:\n" + meeting_notes),
+        ("schema", "JSON SCHEMA:\n" + SCHEMA),
+    ]
+    return "\n\n".join(text for _, text in sections), sections
+
+
+def build_compact_prompt(meeting_notes,
+                         existing_contacts,
+                         existing_company,
+                         previous_deals,
+                         previous_meetings,
+                         budget=None,
+                         summary_chars=400):
+    """
+    Same content as crm.build_crm_prompt, serialized compactly and cut
+    to fit `budget` tokens (default PROMPT_BUDGET).
+
+    Previous meeting summaries are capped at summary_chars, and
+    company_name fields that just repeat the matched company are left
+    out. Past the budget, trimming goes from least to most useful
+    context: the first meetings, then the first deals, then the last
+    contacts. The new transcript, the company record and the schema are
+    never cut: a transcript too long for the budget is for the chunked
+    path (see transcript_fits), and one that still doesn't fit goes out
+    whole, marked "over_budget" in the report.
+
+    Returns (prompt, report) where report holds the total and
+    per-section token counts, the budget, the trimming steps taken and
+    the tokenizer used.
+    """
+    budget = budget or PROMPT_BUDGET
+    company_name = (existing_company or {}).get("name")
+
+    def slim(records):
+        # Record versions are bookkeeping for writers, not context
+        return [{k: v for k, v in r.items()
+                 if k != "version" and not (k == "company_name" and v == company_name)}
+                for r in records or []]
+
+    contacts = slim(existing_contacts)
+    deals = slim(previous_deals)
+    meetings = [dict(m, summary=_shorten(m["summary"], summary_chars))
+                if isinstance(m.get("summary"), str) else m
+                for m in slim(previous_meetings)]
+    trimmed = []
+
+    def render():
+        prompt, _ = _render(meeting_notes, contacts, existing_company, deals, meetings)
+        return prompt, count_tokens(prompt)
+
+    prompt, tokens = render()
+
+    # Meetings and deals come least useful first (oldest, or least relevant
+    # with retrieval; see crm.get_crm_context);
+    # contacts have no age, so the last ones in lookup order go first
+    for label, items, end in (("meetings", meetings, 0), ("deals", deals, 0),
+                              ("contacts", contacts, -1)):
+        dropped = 0
+        while tokens > budget and items:
+            items.pop(end)
+            dropped += 1
+            prompt, tokens = render()
+        if dropped:
+            trimmed.append(f"dropped {dropped} {label}")
+
+    _, sections = _render(meeting_notes, contacts, existing_company, deals, meetings)
+    report = {
+        "tokens": tokens,
+        "budget": budget,
+        "over_budget": tokens > budget,
+        "sections": {name: count_tokens(text) for name, text in sections},
+        "trimmed": trimmed,
+        "tokenizer": tokenizer_name(),
+    }
+    return prompt, report
+
+
+def transcript_fits(meeting_notes, budget=None):
+    """
+    Whether a prompt holding just meeting_notes (no CRM context) fits
+    `budget` tokens; if not, the transcript should be extracted in chunks.
+    """
+    prompt, _ = _render(meeting_notes, [], None, [], [])
+    return count_tokens(prompt) <= (budget or PROMPT_BUDGET)
@@ -0,0 +1,163 @@
+import sys
+from collections.abc import MutableMapping
+
+# Longer strings are free text (summaries, notes) that rarely repeat
+INTERN_CHARS = 80
+
+
+def _intern(value):
+    if type(value) is str:
+        return sys.intern(value) if len(value) <= INTERN_CHARS else value
+    if type(value) is list:
+        return [_intern(v) for v in value]
+    return value
+
+
+class Record(MutableMapping):
+    """
+    A CRM record held in __slots__ instead of a dict.
+
+    It reads and writes like the dict it was loaded from (get, [], in,
+    items, update, setdefault, dict(record), ...), so code handling
+    records doesn't change, but it carries no per-record hash table,
+    and the values of INTERNED fields (stages, currencies, company
+    names, "Unknown") are interned, so a value repeated across a million
+    records is stored once. A field that was never set is absent, as in
+    the dict; keys outside FIELDS go to a small dict of extras.
+
+    json.dump can't serialize it directly: pass default=plain.
+    """
+
+    __slots__ = ("_extra",)
+
+    FIELDS = ()
+    INTERNED = frozenset()
+
+    def __init_subclass__(cls):
+        super().__init_subclass__()
+        cls._fields = frozenset(cls.FIELDS)
+
+    def __init__(self, data=()):
+        self._extra = None
+        fields, interned = self._fields, self.INTERNED
+        for key, value in (data.items() if hasattr(data, "items") else data):
+            # __setitem__ inlined for the common case: loads convert millions
+            if key in fields:
+                setattr(self, key, _intern(value) if key in interned else value)
+            else:
+                self[key] = value
+
+    def __getitem__(self, key):
+        if key in self._fields:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        if self._extra is not None and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        if key in self._fields:
+            return getattr(self, key, default)
+        return self._extra.get(key, default) if self._extra else default
+
+    def __contains__(self, key):
+        if key in self._fields:
+            return hasattr(self, key)
+        return bool(self._extra) and key in self._extra
+
+    def __setitem__(self, key, value):
+        if key in self._fields:
+            setattr(self, key, _intern(value) if key in self.INTERNED else value)
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+
+    def __delitem__(self, key):
+        if key in self._fields:
+            try:
+                delattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        elif self._extra and key in self._extra:
+            del self._extra[key]
+        else:
+            raise KeyError(key)
+
+    def __iter__(self):
+        for key in self.FIELDS:
+            if hasattr(self, key):
+                yield key
+        if self._extra:
+            yield from self._extra
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({dict(self)!r})"
+
+    def __reduce__(self):
+        return type(self), (dict(self),)
+
+
+# Field order is the order records are written back in
+
+class Company(Record):
+    FIELDS = ("company_id", "name", "industry", "size", "location", "version")
+    INTERNED = frozenset({"name", "industry", "size", "location"})
+    __slots__ = FIELDS
+
+
+class Contact(Record):
+    FIELDS = ("contact_id", "name", "job_title", "email", "phone", "decision_power",
+              "company_id", "company_name", "version")
+    INTERNED = frozenset({"name", "job_title", "decision_power", "company_id", "company_name"})
+    __slots__ = FIELDS
+
+
+class Deal(Record):
+    FIELDS = ("deal_id", "company_name", "deal_name", "value", "currency", "stage",
+              "timeline", "next_steps", "competitors", "version")
+    INTERNED = frozenset({"company_name", "currency", "stage", "timeline", "next_steps",
+                          "competitors"})
+    __slots__ = FIELDS
+
+
+class Meeting(Record):
+    FIELDS = ("meeting_id", "contact_name", "company_name", "timestamp", "summary",
+              "outcome", "deal_linked", "version")
+    INTERNED = frozenset({"contact_name", "company_name", "outcome", "deal_linked"})
+    __slots__ = FIELDS
+
+
+RECORD_TYPES = {"companies": Company, "contacts": Contact, "deals": Deal, "meetings": Meeting}
+
+
+def to_record(name, record):
+    """
+    record as the dataset's Record type (itself if it already is one).
+    """
+    cls = RECORD_TYPES[name]
+    return record if isinstance(record, cls) else cls(record)
+
+
+def compact(name, records):
+    """
+    Convert a list of dicts to Records in place, each dict being freed
+    as soon as it is converted, and return the list.
+    """
+    for i, record in enumerate(records):
+        records[i] = to_record(name, record)
+    return records
+
+
+def plain(obj):
+    """
+    json default= hook: a Record is written as the dict it stands for.
+    """
+    if isinstance(obj, Record):
+        return dict(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
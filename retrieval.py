@@ -0,0 +1,193 @@
+import os
+import re
+
+import numpy as np
+
+from dedup import company_key
+
+RETRIEVAL_DIM = int(os.getenv("CRM_RETRIEVAL_DIM", 256))
+
+# Text each dataset is searched on; company_name is the group, not text
+TEXT_FIELDS = {
+    "meetings": ("summary", "outcome", "contact_name"),
+    "deals": ("deal_name", "stage", "timeline", "next_steps", "competitors"),
+}
+GROUP_FIELD = "company_name"
+
+STOPWORDS = frozenset("""
+a an and are as at be but by for from had has have he her his i in is it its
+of on or our she so that the their them they this to was we were will with
+you your not no yes can could would should do did done been being than then
+""".split())
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+def features(text):
+    """
+    Words of a text, minus stopwords. (Word pairs were tried too: at a
+    few hundred buckets their collisions cost more recall than they add.)
+    """
+    return [w for w in _WORD.findall(text.lower()) if w not in STOPWORDS]
+
+
+def _text(record, fields):
+    parts = []
+    for field in fields:
+        value = record.get(field)
+        if isinstance(value, list):
+            parts.extend(str(v) for v in value if v is not None)
+        elif value is not None:
+            parts.append(str(value))
+    return " ".join(parts)
+
+
+class RetrievalIndex:
+    """
+    Hashed TF-IDF vectors over the text of a list of CRM records, for
+    finding the records most relevant to a new meeting.
+
+    Each record is a row of a float16 matrix (half the memory of
+    float32; scoring upcasts): its words hashed into `dim` buckets,
+    weighted 1 + log(tf) and L2-normalized. Buckets come from hash(),
+    which is salted per process, so the index lives in memory only.
+    IDF is applied on the query side only, so rows never need
+    re-weighting as records are added. Rows are also grouped by
+    company_name, normalized as dedup does ("Nexora A.I.", "NEXORA AI
+    Inc" -> "nexora ai"), so records filed under variants of a company
+    name are found with it; closer typos are for dedup.py to merge.
+
+    Kept current by the store like its other indexes: add() appends a
+    row, update() recomputes one.
+    """
+
+    dtype = np.float16
+
+    def __init__(self, records, fields, dim=RETRIEVAL_DIM, batch=10000):
+        self.fields = fields
+        self.dim = dim
+        self.size = 0
+        self.vectors = np.zeros((max(16, len(records)), dim), dtype=self.dtype)
+        self.df = np.zeros(dim, dtype=np.int64)     # rows with a nonzero bucket
+        self.groups = {}                            # company_key -> rows
+        self._group_of = []                         # row -> company_key
+
+        for start in range(0, len(records), batch):
+            self._append(records[start:start + batch])
+
+    def __len__(self):
+        return self.size
+
+    # ---------------- vectors ----------------
+
+    def _buckets(self, text):
+        return [hash(f) % self.dim for f in features(text)]
+
+    def _rows(self, texts):
+        """
+        Normalized vectors for texts, built with one bincount.
+        """
+        counts = np.zeros(len(texts) * self.dim, dtype=np.float32)
+        flat = []
+        for i, text in enumerate(texts):
+            base = i * self.dim
+            flat.extend(base + b for b in self._buckets(text))
+        if flat:
+            counts += np.bincount(np.array(flat, dtype=np.int64), minlength=counts.size)
+        rows = counts.reshape(len(texts), self.dim)
+        nonzero = rows > 0
+        rows[nonzero] = 1 + np.log(rows[nonzero])
+        norms = np.linalg.norm(rows, axis=1, keepdims=True)
+        np.divide(rows, norms, out=rows, where=norms > 0)
+        return rows
+
+    def _append(self, records):
+        rows = self._rows([_text(r, self.fields) for r in records])
+        end = self.size + len(records)
+        if end > len(self.vectors):
+            # Grow by an eighth, as lists do: doubling a large matrix doubles memory
+            grown = np.zeros((max(end, len(self.vectors) * 9 // 8), self.dim), dtype=self.dtype)
+            grown[:self.size] = self.vectors[:self.size]
+            self.vectors = grown
+        self.vectors[self.size:end] = rows
+        self.df += (rows > 0).sum(axis=0)
+        for pos, record in enumerate(records, start=self.size):
+            self._join(pos, record.get(GROUP_FIELD))
+        self.size = end
+
+    def _join(self, pos, name):
+        key = company_key(name) if name else None
+        if pos == len(self._group_of):
+            self._group_of.append(key)
+        else:
+            self._group_of[pos] = key
+        if key:
+            self.groups.setdefault(key, []).append(pos)
+
+    # ---------------- incremental maintenance (store index protocol) ----------------
+
+    def add(self, record):
+        self._append([record])
+
+    def update(self, pos, record, fields):
+        """
+        Recompute row pos for a pending update of `fields`.
+        """
+        if any(f in fields for f in self.fields):
+            row = self._rows([_text(dict(record, **fields), self.fields)])[0]
+            self.df -= self.vectors[pos] > 0
+            self.df += row > 0
+            self.vectors[pos] = row
+        if GROUP_FIELD in fields and fields[GROUP_FIELD] != record.get(GROUP_FIELD):
+            old = self._group_of[pos]
+            if old:
+                self.groups[old].remove(pos)
+            self._join(pos, fields[GROUP_FIELD])
+
+    # ---------------- search ----------------
+
+    def query_vector(self, text):
+        q = np.zeros(self.dim, dtype=np.float32)
+        buckets = self._buckets(text)
+        if not buckets:
+            return q
+        counts = np.bincount(np.array(buckets), minlength=self.dim).astype(np.float32)
+        idf = np.log((1 + self.size) / (1 + self.df)) + 1
+        nonzero = counts > 0
+        q[nonzero] = (1 + np.log(counts[nonzero])) * idf[nonzero] ** 2
+        norm = np.linalg.norm(q)
+        return q / norm if norm else q
+
+    def _scores(self, vectors, q, block=65536):
+        # Upcast a block at a time, so a full scan never copies the matrix
+        return np.concatenate([vectors[i:i + block].astype(np.float32) @ q
+                               for i in range(0, len(vectors), block)] or [np.zeros(0, np.float32)])
+
+    def group_rows(self, company_name):
+        """
+        Rows filed under company_name or a variant of it (see above).
+        """
+        return self.groups.get(company_key(company_name), []) if company_name else []
+
+    def search(self, text, k, company_name=None):
+        """
+        [(row, score)] for the k rows most similar to text, best first;
+        ties go to the newer row. With company_name, only that
+        company's rows (see group_rows) are considered.
+        """
+        if company_name is not None:
+            rows = np.array(self.group_rows(company_name), dtype=np.int64)
+            if not len(rows):
+                return []
+            scores = self._scores(self.vectors[rows], self.query_vector(text))
+        else:
+            rows = None
+            scores = self._scores(self.vectors[:self.size], self.query_vector(text))
+
+        k = min(k, len(scores))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+        positions = top if rows is None else rows[top]
+        order = np.lexsort((-positions, -scores[top]))
+        return [(int(positions[i]), float(scores[top][i])) for i in order]
@@ -0,0 +1,201 @@
+import re
+
+from stream_parser import StreamParser
+
+# ---------------- extraction schema ----------------
+
+def _str(value):
+    return isinstance(value, str)
+
+
+def _opt_str(value):
+    return value is None or isinstance(value, str)
+
+
+def _opt_scalar(value):
+    return value is None or (isinstance(value, (str, int, float)) and not isinstance(value, bool))
+
+
+def _str_list(value):
+    return isinstance(value, list) and all(isinstance(v, str) for v in value)
+
+
+TYPE_NAMES = {_str: "a string", _opt_str: "a string or null",
+              _opt_scalar: "a number, string or null", _str_list: "a list of strings"}
+
+# list name -> (temp_id prefix, action entity, {field: check}); every
+# field is required (apply_actions reads them all), nulls where allowed
+SCHEMA = {
+    "contacts": ("c", "contact", {
+        "existing_id": _opt_str, "name": _str, "job_title": _opt_str,
+        "email": _opt_str, "phone": _opt_str, "decision_power": _opt_str,
+    }),
+    "companies": ("co", "company", {
+        "existing_id": _opt_str, "name": _str, "industry": _opt_str,
+        "size": _opt_str, "location": _opt_str,
+    }),
+    "deals": ("d", "deal", {
+        "existing_id": _opt_str, "name": _str, "value": _opt_scalar,
+        "currency": _opt_str, "stage": _opt_str, "timeline": _opt_str,
+        "next_steps": _opt_str, "competitors": _str_list,
+    }),
+}
+ACTION_FIELDS = {"entity": _str, "operation": _str, "target_temp_id": _str, "reason": _opt_str}
+OPERATIONS = ("create", "update")
+
+
+def _issue(section, path, reason):
+    return {"section": section, "path": path, "reason": reason}
+
+
+def _compile_entity(section, prefix, fields):
+    """
+    One checker per entity list, built once: a temp_id pattern and a
+    tuple of (field, check, message) to run over each item.
+    """
+    temp_id = re.compile(rf"{prefix}\d+$")
+    checks = tuple((field, check, f"must be {TYPE_NAMES[check]}") for field, check in fields.items())
+
+    def validate(item, index):
+        path = f"{section}[{index}]"
+        if not isinstance(item, dict):
+            return [_issue(section, path, "must be an object")]
+        issues = []
+        tid = item.get("temp_id")
+        if not (isinstance(tid, str) and temp_id.match(tid)):
+            issues.append(_issue(section, f"{path}.temp_id", f"must look like {prefix}1, {prefix}2, …"))
+        for field, check, message in checks:
+            if field not in item:
+                issues.append(_issue(section, f"{path}.{field}", "is missing"))
+            elif not check(item[field]):
+                issues.append(_issue(section, f"{path}.{field}", message))
+        return issues
+
+    return validate
+
+
+def _compile_action():
+    checks = tuple((field, check, f"must be {TYPE_NAMES[check]}") for field, check in ACTION_FIELDS.items())
+    entities = {entity: section for section, (_, entity, _) in SCHEMA.items()}
+
+    def validate(item, index):
+        path = f"actions[{index}]"
+        if not isinstance(item, dict):
+            return [_issue("actions", path, "must be an object")]
+        issues = []
+        for field, check, message in checks:
+            if field not in item:
+                if field != "reason":
+                    issues.append(_issue("actions", f"{path}.{field}", "is missing"))
+            elif not check(item[field]):
+                issues.append(_issue("actions", f"{path}.{field}", message))
+        if isinstance(item.get("entity"), str) and item["entity"] not in entities:
+            issues.append(_issue("actions", f"{path}.entity", "must be contact, company or deal"))
+        if isinstance(item.get("operation"), str) and item["operation"] not in OPERATIONS:
+            issues.append(_issue("actions", f"{path}.operation", "must be create or update"))
+        return issues
+
+    return validate
+
+
+VALIDATORS = {section: _compile_entity(section, prefix, fields)
+              for section, (prefix, _, fields) in SCHEMA.items()}
+VALIDATORS["actions"] = _compile_action()
+SECTIONS = tuple(VALIDATORS)
+
+
+def validate_entity(section, item, index=0):
+    """
+    Issues of one streamed entity on its own (no cross references).
+    """
+    validator = VALIDATORS.get(section)
+    return validator(item, index) if validator else []
+
+
+def validate_extraction(data):
+    """
+    All schema issues of an extraction, as
+    [{"section": "actions", "path": "actions[1].target_temp_id", "reason": "..."}].
+    An empty list means apply_actions can take it as is.
+    """
+    if not isinstance(data, dict):
+        return [_issue(None, "$", "must be a JSON object")]
+
+    issues = []
+    temp_ids = {}
+    for section in SECTIONS:
+        items = data.get(section)
+        if not isinstance(items, list):
+            issues.append(_issue(section, section, "is missing" if items is None else "must be a list"))
+            continue
+        seen = set()
+        for i, item in enumerate(items):
+            issues += VALIDATORS[section](item, i)
+            tid = item.get("temp_id") if isinstance(item, dict) else None
+            if section != "actions" and tid is not None:
+                if tid in seen:
+                    issues.append(_issue(section, f"{section}[{i}].temp_id", f"{tid} is used twice"))
+                seen.add(tid)
+        temp_ids[section] = seen
+
+    # Cross references: actions point at entities of their own type
+    entities = {entity: section for section, (_, entity, _) in SCHEMA.items()}
+    for i, action in enumerate(data.get("actions") or []):
+        if not isinstance(action, dict):
+            continue
+        section = entities.get(action.get("entity"))
+        target = action.get("target_temp_id")
+        if section in temp_ids and isinstance(target, str) and target not in temp_ids[section]:
+            issues.append(_issue("actions", f"actions[{i}].target_temp_id",
+                                 f"{target} is not a temp_id in {section}"))
+
+    # New deals are filed under the first company
+    deals = data.get("deals") if isinstance(data.get("deals"), list) else []
+    if any(isinstance(d, dict) and d.get("existing_id") is None for d in deals) and not data.get("companies"):
+        issues.append(_issue("companies", "companies", "a new deal needs at least one company"))
+
+    return issues
+
+
+# ---------------- checks on the live stream ----------------
+
+class StreamCheck:
+    """
+    Validates entities while the response streams in and decides when
+    an attempt is doomed, so it can be cut off instead of read to the end:
+
+    * no "{" within the first preamble_chars characters (prose answer),
+    * max_invalid streamed entities already broken.
+    """
+
+    def __init__(self, preamble_chars=200, max_invalid=3):
+        self.parser = StreamParser()
+        self.preamble_chars = preamble_chars
+        self.max_invalid = max_invalid
+        self.issues = []
+        self.invalid = 0
+        self.doomed = None
+        self._started = False
+        self._counts = {}
+
+    def feed(self, delta):
+        if not self._started:
+            head = self.parser.text()[:self.preamble_chars] + delta
+            self._started = "{" in head[:self.preamble_chars]
+            if not self._started and len(head) >= self.preamble_chars:
+                self.doomed = f"no JSON object in the first {self.preamble_chars} characters"
+
+        entities = self.parser.feed(delta)
+        for section, item in entities:
+            index = self._counts.get(section, 0)
+            self._counts[section] = index + 1
+            issues = validate_entity(section, item, index)
+            if issues:
+                self.invalid += 1
+                self.issues += issues
+        if self.doomed is None and self.invalid >= self.max_invalid:
+            self.doomed = f"{self.invalid} invalid entities while streaming"
+        return entities
+
+    def text(self):
+        return self.parser.text()
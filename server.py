@@ -1,15 +1,24 @@
+import json
 import logging
-from fastapi import FastAPI, HTTPException, Request
+import os
+import time
+from fastapi import FastAPI, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 import traceback
 
 # Import your CRM logic from crm.py
 from crm import (
-    load_companies, load_contacts, load_deals, load_meetings,
-    process_meeting, apply_actions
+    process_meeting_async, process_meetings_batch, stream_meeting_async,
+    apply_actions, apply_actions_bulk
 )
+from store import DATASETS, get_store
+from llm_cache import get_cache
+from jobs import JOBS_DB, QueueFull, get_job_queue
+from metrics import REGISTRY, SERVER_TIMING, CallbackMetric, Histogram, collect, current_timings
 
 # -------------------------------------------------------
 # Logging Setup
@@ -28,6 +37,69 @@ app.add_middleware(
     allow_headers=["*"]
 )
 
+# -------------------------------------------------------
+# Request timing (Prometheus histograms, Server-Timing)
+# -------------------------------------------------------
+REQUEST_SECONDS = Histogram("crm_http_request_seconds", "HTTP request latency until the response starts",
+                            ["method", "route", "status"])
+CallbackMetric("crm_llm_cache_lookups_total", "Extraction cache lookups by result", "counter", ["result"],
+               lambda: {(k,): v for k, v in get_cache().info().items()
+                        if k in ("memory_hits", "disk_hits", "misses", "coalesced")})
+CallbackMetric("crm_store_writes_total", "Store writes, and the commits they were grouped into",
+               "counter", ["kind"], lambda: {(k,): v for k, v in get_store().write_stats.items()})
+CallbackMetric("crm_jobs", "Extraction jobs by status", "gauge", ["status"],
+               lambda: {(k,): v for k, v in get_job_queue(run_extraction_job).counts().items()}
+               if os.path.exists(JOBS_DB) else {})
+
+
+# Responses whose body is written after the headers go out: no stage
+# has run yet when the header would be sent, so they end with a
+# "timing" event instead (see timing_trailer)
+STREAMING_TYPES = ("text/event-stream", "application/x-ndjson")
+
+
+def wants_timing(request):
+    return SERVER_TIMING or request.headers.get("x-crm-timing") == "1"
+
+
+def server_timing(timings, elapsed):
+    stages = timings.server_timing()
+    return (stages + ", " if stages else "") + f"total;dur={elapsed * 1000:.1f}"
+
+
+def timing_trailer(request, start):
+    """
+    Server-Timing value for a streamed response whose body is done,
+    timed from `start`; None unless the request asked for timings.
+    """
+    timings = current_timings()
+    if timings is None or not wants_timing(request):
+        return None
+    return server_timing(timings, time.perf_counter() - start)
+
+
+@app.middleware("http")
+async def time_request(request: Request, call_next):
+    """
+    Observe every request's latency; with CRM_SERVER_TIMING=1 or an
+    "X-CRM-Timing: 1" request header, also return the per-stage
+    breakdown (context, prompt, llm, parse, apply, ...) as Server-Timing.
+    """
+    start = time.perf_counter()
+    with collect() as timings:
+        response = await call_next(request)
+    elapsed = time.perf_counter() - start
+
+    route = request.scope.get("route")
+    REQUEST_SECONDS.observe(elapsed, method=request.method,
+                            route=getattr(route, "path", "unmatched"), status=response.status_code)
+    if wants_timing(request) and not response.headers.get("content-type", "").startswith(STREAMING_TYPES):
+        response.headers["Server-Timing"] = server_timing(timings, elapsed)
+        # Lets the browser frontend (another origin) read the header
+        response.headers["Timing-Allow-Origin"] = "*"
+    return response
+
+
 # -------------------------------------------------------
 # Pydantic Models
 # -------------------------------------------------------
@@ -37,10 +109,24 @@ class ExtractRequest(BaseModel):
     contact_name: Optional[str] = "Unknown"
 
 
+class JobRequest(ExtractRequest):
+    priority: Optional[int] = 0      # higher runs first
+
+
+class BatchExtractRequest(BaseModel):
+    items: List[ExtractRequest]
+    concurrency: Optional[int] = 8   # LLM calls in flight at once
+
+
 class ApplyRequest(BaseModel):
     gpt_json: Dict[str, Any]   # contact/company/deal arrays
 
 
+class BulkApplyRequest(BaseModel):
+    payloads: List[Dict[str, Any]]
+    format: Optional[str] = "gpt"   # "gpt" (extraction schema) or "frontend"
+
+
 # -------------------------------------------------------
 # HELPERS
 # -------------------------------------------------------
@@ -138,15 +224,16 @@ async def extract(req: ExtractRequest):
 
     log.info("Running extraction…")
 
+    store = get_store()
+
     try:
-        result = process_meeting(
+        # Context lookup runs in a worker thread and the LLM call is
+        # awaited, so slow completions don't hold up other requests
+        result = await process_meeting_async(
             meeting_text,
             req.company_name or "Unknown",
             req.contact_name or "Unknown",
-            load_companies(),
-            load_contacts(),
-            load_deals(),
-            load_meetings()
+            store=store
         )
     except Exception as e:
         log.error("process_meeting failed: %s", traceback.format_exc())
@@ -155,6 +242,190 @@ async def extract(req: ExtractRequest):
     return {"extracted": result}
 
 
+# -------------------------------------------------------
+# STREAMING EXTRACT ENDPOINT   (HTML → entities as they arrive, SSE)
+# -------------------------------------------------------
+def sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.post("/extract/stream")
+async def extract_stream(req: ExtractRequest, request: Request):
+
+    start = time.perf_counter()
+    meeting_text = req.meeting_text.strip()
+    if not meeting_text:
+        raise HTTPException(status_code=400, detail="Meeting summary is empty")
+
+    log.info("Running streaming extraction…")
+
+    async def events():
+        # "entity" per contact/company/deal/action as soon as it is
+        # complete, then "done" with the full (authoritative) result,
+        # and "timing" with the stage breakdown when asked for
+        try:
+            async for event in stream_meeting_async(
+                meeting_text,
+                req.company_name or "Unknown",
+                req.contact_name or "Unknown",
+                get_store()
+            ):
+                if event[0] == "entity":
+                    yield sse("entity", {"type": event[1], "item": event[2]})
+                else:
+                    yield sse("done", {"extracted": event[1]})
+        except Exception:
+            log.error("streaming extraction failed: %s", traceback.format_exc())
+            yield sse("error", {"detail": "LLM extraction failed"})
+        timing = timing_trailer(request, start)
+        if timing:
+            yield sse("timing", {"server_timing": timing})
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+# -------------------------------------------------------
+# BATCH EXTRACT ENDPOINT   (bulk transcripts → NDJSON stream)
+# -------------------------------------------------------
+@app.post("/extract/batch")
+async def extract_batch(req: BatchExtractRequest, request: Request):
+
+    start = time.perf_counter()
+    if not req.items:
+        raise HTTPException(status_code=400, detail="No meetings to extract")
+
+    items = [
+        (item.meeting_text.strip(), item.company_name or "Unknown", item.contact_name or "Unknown")
+        for item in req.items
+    ]
+    concurrency = min(max(req.concurrency or 1, 1), 64)
+
+    log.info("Running batch extraction of %d meetings…", len(items))
+
+    async def lines():
+        # One JSON object per line, written as each meeting finishes;
+        # a last {"server_timing": ...} line when timings were asked for
+        async for result in process_meetings_batch(items, get_store(), concurrency):
+            if not result["ok"]:
+                log.error("batch item %d failed: %s", result["index"], result["error"])
+            yield json.dumps(result) + "\n"
+        timing = timing_trailer(request, start)
+        if timing:
+            yield json.dumps({"server_timing": timing}) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+# -------------------------------------------------------
+# EXTRACTION JOBS   (enqueue now, poll for the result)
+# -------------------------------------------------------
+async def run_extraction_job(payload):
+    result = await process_meeting_async(
+        payload["meeting_text"],
+        payload["company_name"] or "Unknown",
+        payload["contact_name"] or "Unknown",
+        store=get_store()
+    )
+    return {"extracted": result}
+
+
+async def job_queue():
+    queue = get_job_queue(run_extraction_job)
+    await queue.start()
+    return queue
+
+
+@app.on_event("startup")
+async def resume_jobs():
+    # Jobs queued before a restart start running again right away;
+    # otherwise the queue is created by the first /jobs request
+    if os.path.exists(JOBS_DB):
+        await job_queue()
+
+
+@app.on_event("shutdown")
+async def stop_jobs():
+    if os.path.exists(JOBS_DB):
+        await get_job_queue(run_extraction_job).stop()
+
+
+@app.post("/jobs", status_code=202)
+async def submit_job(req: JobRequest):
+
+    meeting_text = req.meeting_text.strip()
+    if not meeting_text:
+        raise HTTPException(status_code=400, detail="Meeting summary is empty")
+
+    queue = await job_queue()
+    try:
+        job = await queue.submit({
+            "meeting_text": meeting_text,
+            "company_name": req.company_name,
+            "contact_name": req.contact_name
+        }, priority=req.priority or 0)
+    except QueueFull as e:
+        raise HTTPException(status_code=429, detail=f"Job queue is full: {e}")
+
+    log.info("Queued extraction job %s", job["job_id"])
+    return job
+
+
+@app.get("/jobs")
+async def list_jobs(status: Optional[str] = None, limit: int = Query(50, ge=1, le=1000)):
+    queue = await job_queue()
+    return {"jobs": await queue.list(status, limit)}
+
+
+@app.get("/jobs/stats")
+async def job_stats():
+    """
+    Queue depth, jobs per status and recent queue wait times.
+    """
+    queue = await job_queue()
+    return await queue.stats()
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str, wait: float = Query(0, ge=0, le=60)):
+    """
+    Job status, with the result once done. wait=<seconds> long-polls:
+    the response comes as soon as the job finishes, or after `wait`.
+    """
+    queue = await job_queue()
+    job = await queue.get(job_id, wait)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    return job
+
+
+@app.get("/jobs/{job_id}/result")
+async def get_job_result(job_id: str, wait: float = Query(0, ge=0, le=60)):
+    """
+    Just the extraction ({"extracted": ...}); 202 with the status while
+    the job is pending, 409 if it failed or was cancelled.
+    """
+    queue = await job_queue()
+    job = await queue.get(job_id, wait)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    if job["status"] in ("queued", "running"):
+        return JSONResponse({"job_id": job_id, "status": job["status"]}, status_code=202)
+    if job["status"] != "done":
+        detail = f"Job {job['status']}" + (f": {job['error']}" if job.get("error") else "")
+        raise HTTPException(status_code=409, detail=detail)
+    return job["result"]
+
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    queue = await job_queue()
+    job = await queue.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    return job
+
+
 # -------------------------------------------------------
 # APPLY ENDPOINT   (HTML → Apply to CRM JSON files)
 # -------------------------------------------------------
@@ -166,30 +437,165 @@ async def apply(req: ApplyRequest):
     # Convert HTML CRM table → GPT schema
     gpt_payload = convert_frontend_payload_to_gpt(incoming)
 
+    store = get_store()
+
     try:
-        temp_map = apply_actions(gpt_payload)
+        applied = await run_in_threadpool(apply_actions, gpt_payload, store=store)
     except Exception as e:
         log.error("apply_actions failed: %s", traceback.format_exc())
         raise HTTPException(status_code=500, detail="CRM update failed")
 
-    updated_state = {
-        "companies": load_companies(),
-        "contacts": load_contacts(),
-        "deals": load_deals(),
-        "meetings": load_meetings()
+    # Only the records this apply touched; GET /crm-state?since=<rev>
+    # catches a client up on everything else
+    return {
+        "mapping": applied["mapping"],
+        "unknown_ids": applied["unknown_ids"],
+        "conflicts": applied["conflicts"],
+        "revision": applied["revision"],
+        "changed": applied["changed"]
     }
 
-    return {"mapping": temp_map, "crm_state": updated_state}
+
+# -------------------------------------------------------
+# BULK APPLY ENDPOINT   (many extractions → one commit)
+# -------------------------------------------------------
+@app.post("/apply/bulk")
+async def apply_bulk(req: BulkApplyRequest):
+
+    if req.format not in ("gpt", "frontend"):
+        raise HTTPException(status_code=400, detail="format must be 'gpt' or 'frontend'")
+
+    payloads = req.payloads
+    if req.format == "frontend":
+        payloads = [convert_frontend_payload_to_gpt(p) for p in payloads]
+
+    try:
+        applied = await run_in_threadpool(apply_actions_bulk, payloads, store=get_store())
+    except Exception as e:
+        log.error("apply_actions_bulk failed: %s", traceback.format_exc())
+        raise HTTPException(status_code=500, detail="CRM update failed")
+
+    # Only what changed; GET /crm-state still has everything
+    return applied
 
 
 # -------------------------------------------------------
 # CRM STATE ENDPOINT
 # -------------------------------------------------------
+def _split(value):
+    return [v.strip() for v in value.split(",") if v.strip()] if value else None
+
+
+def crm_state_view(store, since=None, datasets=None, offset=0, limit=None, fields=None):
+    """
+    Body of GET /crm-state, built under the store lock so the revision
+    matches the records.
+
+    * since=<rev>: only the records changed after that revision, as
+      {"revision", "since", "changes": {dataset: [...]}}; if the store
+      no longer knows that far back, a full state with "reset": true.
+    * otherwise {"revision", <dataset>: [...]} for every dataset (or just
+      the ones asked for), sliced by offset/limit and projected to fields;
+      "page" says where each slice sits when a limit is given.
+    """
+    names = datasets or list(DATASETS)
+    with store.lock:
+        if since is not None:
+            revision, changes = store.changes_since(since)
+            if changes is not None:
+                return {"revision": revision, "since": since,
+                        "changes": {n: r for n, r in changes.items() if n in names}}
+
+        body = {"revision": store.current_revision()}
+        if since is not None:
+            body["reset"] = True
+        pages = {}
+        for name in names:
+            total, body[name] = store.page(name, offset, limit, fields)
+            end = offset + len(body[name])
+            pages[name] = {"offset": offset, "limit": limit, "total": total,
+                           "next": end if end < total else None}
+        if limit is not None:
+            body["page"] = pages
+        return body
+
+
 @app.get("/crm-state")
-async def crm_state():
-    return {
-        "companies": load_companies(),
-        "contacts": load_contacts(),
-        "deals": load_deals(),
-        "meetings": load_meetings()
-    }
+async def crm_state(request: Request,
+                    since: Optional[int] = Query(None, ge=0),
+                    dataset: Optional[str] = None,
+                    offset: int = Query(0, ge=0),
+                    limit: Optional[int] = Query(None, ge=1, le=5000),
+                    fields: Optional[str] = None):
+
+    store = get_store()
+    datasets = _split(dataset)
+    unknown = [d for d in datasets or [] if d not in DATASETS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"unknown dataset: {', '.join(unknown)}")
+
+    # The body is a function of the revision and the query, so a client
+    # holding the same revision for this URL gets a 304 and no body
+    revision = await run_in_threadpool(store.current_revision)
+    etag = f'"{revision}"'
+    if etag in [t.strip() for t in request.headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=304, headers={"ETag": etag})
+
+    body = await run_in_threadpool(crm_state_view, store, since, datasets, offset, limit, _split(fields))
+    return JSONResponse(body, headers={"ETag": f'"{body["revision"]}"'})
+
+
+# -------------------------------------------------------
+# ANALYTICS ENDPOINTS   (pipeline numbers over the deals)
+# -------------------------------------------------------
+def _analytics(query, *args):
+    import analytics        # NumPy; loaded on the first analytics request
+    return getattr(analytics, query)(get_store(), *args)
+
+
+@app.get("/analytics/summary")
+async def analytics_summary():
+    return await run_in_threadpool(_analytics, "summary")
+
+
+@app.get("/analytics/pipeline/{group}")
+async def analytics_pipeline(
+    group: str,
+    limit: int = Query(50, ge=1, le=1000),
+    open_only: bool = False
+):
+    """
+    Deal value (in the base currency), counts and win rates per stage,
+    company or competitor, largest first.
+    """
+    try:
+        return await run_in_threadpool(_analytics, "pipeline", group, limit, open_only)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+# -------------------------------------------------------
+# LLM CACHE STATS
+# -------------------------------------------------------
+@app.get("/cache-stats")
+async def cache_stats():
+    return await run_in_threadpool(get_cache().info)
+
+
+# -------------------------------------------------------
+# METRICS   (Prometheus scrape)
+# -------------------------------------------------------
+@app.get("/metrics")
+async def metrics():
+    body = await run_in_threadpool(REGISTRY.render)
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+# -------------------------------------------------------
+# Entry point (uvicorn is only needed to run, not to import)
+# -------------------------------------------------------
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run("server:app",
+                host=os.getenv("CRM_HOST", "127.0.0.1"),
+                port=int(os.getenv("CRM_PORT", 8000)))
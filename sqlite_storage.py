@@ -0,0 +1,364 @@
+import json
+import os
+import sqlite3
+import threading
+
+from locks import FileLock
+from name_index import NameIndex
+from records import plain
+from store import DATASETS, load_json, normalize_records, save_json
+
+# dataset -> indexed columns copied out of each record (besides the id).
+# The full record is kept as JSON in the "data" column.
+COLUMNS = {
+    "companies": ["name"],
+    "contacts":  ["name", "company_id", "company_name"],
+    "deals":     ["company_name"],
+    "meetings":  ["company_name", "deal_linked"],
+}
+
+
+# Most recent rows of a company ranked per query when crm_context() is
+# given the meeting text; older ones are left out of retrieval
+RETRIEVAL_CANDIDATES = int(os.getenv("CRM_RETRIEVAL_CANDIDATES", 1000))
+
+
+def _column_value(value):
+    if value is None or isinstance(value, (str, int, float)):
+        return value
+    return json.dumps(value)
+
+
+class SQLiteStorage:
+    """
+    Storage backend keeping the CRM in one SQLite database (WAL mode).
+
+    Each dataset is a table with an insertion-order key (seq), a unique
+    primary-key column, indexed copies of the lookup columns in COLUMNS
+    and the full record as JSON. A store commit, i.e. one apply_actions
+    batch, is a single transaction of upserts.
+
+    crm_context() answers get_crm_context() with indexed queries instead
+    of loading the tables. Fuzzy name matching runs over a NameIndex of
+    just (seq, name), cached until another connection writes, as is the
+    map from company_key to the company_name spellings in deals and
+    meetings. Given the meeting text, it ranks the company's deals and
+    meetings (the latest RETRIEVAL_CANDIDATES of each) with a
+    RetrievalIndex built over just those rows.
+
+    Only those context reads skip loading. Everything else goes through
+    CRMStore, which holds the tables in memory like with the other
+    backends: apply_actions, /crm-state and analytics load the tables
+    (again after another process writes), and only the commit is
+    written per record, as upserts of the changed rows.
+
+    A new database is filled from the legacy JSON files on first open;
+    `python sqlite_storage.py migrate` re-imports them on demand.
+    """
+
+    def __init__(self, path="crm.sqlite3", json_paths=None):
+        json_paths = dict(json_paths or {})
+        self.path = path
+        self.json_paths = {name: json_paths.get(name, spec[0]) for name, spec in DATASETS.items()}
+
+        self._lock = threading.RLock()
+        self._write_lock = FileLock(path + ".lock")
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._names = {}        # dataset -> (NameIndex, [seq], {seq: pos})
+        self._groups = {}       # dataset -> {company_key: {company_name}}
+        self._names_version = self._data_version()
+
+        # Several workers may open a new database at once; one imports
+        with self._write_lock:
+            if self._create_schema():
+                self.import_json()
+
+    def _create_schema(self):
+        """
+        Create missing tables; True if the database was empty.
+        """
+        with self._lock:
+            existing = {row[0] for row in self._conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table'")}
+            if all(name in existing for name in DATASETS):
+                return False
+
+            with self._transaction():
+                for name, (_, id_field, _) in DATASETS.items():
+                    cols = "".join(f", {col} TEXT" for col in COLUMNS[name] if col != id_field)
+                    self._conn.execute(
+                        f"CREATE TABLE IF NOT EXISTS {name} ("
+                        f"seq INTEGER PRIMARY KEY, {id_field} TEXT UNIQUE{cols}, data TEXT NOT NULL)"
+                    )
+                    for col in COLUMNS[name]:
+                        self._conn.execute(
+                            f"CREATE INDEX IF NOT EXISTS {name}_{col} ON {name} ({col})"
+                        )
+            return True
+
+    def _transaction(self):
+        return _Transaction(self._conn)
+
+    def _data_version(self):
+        # Changes whenever another connection commits, never for our own
+        return self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    # ---------------- storage interface ----------------
+
+    def stamp(self, name):
+        with self._lock:
+            return self._data_version()
+
+    def load(self, name):
+        with self._lock:
+            rows = self._conn.execute(f"SELECT data FROM {name} ORDER BY seq")
+            return [json.loads(data) for (data,) in rows]
+
+    def _upsert(self, name, records):
+        id_field = DATASETS[name][1]
+        cols = [id_field] + [col for col in COLUMNS[name] if col != id_field]
+        updates = ", ".join(f"{col} = excluded.{col}" for col in cols[1:] + ["data"])
+        self._conn.executemany(
+            f"INSERT INTO {name} ({', '.join(cols)}, data) "
+            f"VALUES ({', '.join('?' * (len(cols) + 1))}) "
+            f"ON CONFLICT({id_field}) DO UPDATE SET {updates}",
+            ([_column_value(r.get(col)) for col in cols] + [json.dumps(r, default=plain)] for r in records)
+        )
+
+    def commit(self, changes):
+        with self._lock:
+            with self._transaction():
+                for name, records, changed in changes:
+                    if changed is None:
+                        self._conn.execute(f"DELETE FROM {name}")
+                        self._upsert(name, records)
+                    else:
+                        self._upsert(name, changed)
+            self._refresh_names(changes)
+
+    def wants_compaction(self):
+        return False
+
+    def compact(self, state):
+        with self._lock:
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def write_lock(self):
+        # SQLite's own locks only cover the commit; CRMStore's
+        # read-modify-write needs the whole span serialized
+        return self._write_lock
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+            self._write_lock.close()
+
+    # ---------------- indexed context queries ----------------
+
+    def _name_index(self, name):
+        """
+        (NameIndex, seqs) over a table's names; positions map to seqs.
+        """
+        self._check_version()
+        if name not in self._names:
+            seqs, names = [], []
+            for seq, record_name in self._conn.execute(f"SELECT seq, name FROM {name} ORDER BY seq"):
+                seqs.append(seq)
+                names.append(record_name)
+            self._names[name] = (NameIndex.from_names(names), seqs,
+                                 {seq: pos for pos, seq in enumerate(seqs)})
+        return self._names[name]
+
+    def _check_version(self):
+        # Another connection wrote: the cached names may be stale
+        version = self._data_version()
+        if version != self._names_version:
+            self._names.clear()
+            self._groups.clear()
+            self._names_version = version
+
+    def _group_names(self, name, company_name):
+        """
+        The company_name spellings in a table that dedup.company_key
+        files with company_name ("Nexora A.I.", "NEXORA AI Inc", ...).
+        """
+        from dedup import company_key
+
+        self._check_version()
+        if name not in self._groups:
+            groups = {}
+            for (value,) in self._conn.execute(
+                    f"SELECT DISTINCT company_name FROM {name} WHERE company_name IS NOT NULL"):
+                groups.setdefault(company_key(value), set()).add(value)
+            self._groups[name] = groups
+        return sorted(self._groups[name].get(company_key(company_name), ()))
+
+    def _relevant(self, name, company_name, query, k):
+        """
+        The k rows of company_name's group most similar to query, least
+        relevant first (see crm.find_relevant).
+        """
+        from retrieval import TEXT_FIELDS, RetrievalIndex
+
+        names = self._group_names(name, company_name)
+        if not names:
+            return []
+        rows = self._rows(name, f"company_name IN ({', '.join('?' * len(names))})", names,
+                          order="seq DESC", limit=RETRIEVAL_CANDIDATES)[::-1]
+        index = RetrievalIndex(rows, TEXT_FIELDS[name])
+        return [rows[pos] for pos, _ in reversed(index.search(query, k))]
+
+    def _refresh_names(self, changes):
+        """
+        Patch cached name indexes with a commit we just made.
+        """
+        from dedup import company_key
+
+        for name, _, changed in changes:
+            groups = self._groups.get(name)
+            if groups is not None:
+                if changed is None:
+                    del self._groups[name]
+                else:
+                    for record in changed:
+                        if record.get("company_name"):
+                            groups.setdefault(company_key(record["company_name"]), set()).add(
+                                record["company_name"])
+
+            if name not in self._names:
+                continue
+            if changed is None:
+                del self._names[name]
+                continue
+
+            index, seqs, positions = self._names[name]
+            id_field = DATASETS[name][1]
+            for record in changed:
+                row = self._conn.execute(
+                    f"SELECT seq FROM {name} WHERE {id_field} = ?", (record.get(id_field),)
+                ).fetchone()
+                if row is None:
+                    continue
+                pos = positions.get(row[0])
+                if pos is None:
+                    positions[row[0]] = len(seqs)
+                    seqs.append(row[0])
+                    index.add_name(record.get("name"))
+                else:
+                    index.update_name(pos, record.get("name"))
+
+    def _rows(self, name, where, params, order="seq", limit=None):
+        sql = f"SELECT data FROM {name} WHERE {where} ORDER BY {order}"
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+        return [json.loads(data) for (data,) in self._conn.execute(sql, params)]
+
+    def crm_context(self, meeting_company_name, meeting_contact_name, query=None, k=3):
+        """
+        Same result as get_crm_context() over the loaded tables. With
+        query (the meeting text), deals and meetings are the k most
+        relevant to it instead of the last three.
+        """
+        with self._lock:
+            company = None
+            index, seqs, _ = self._name_index("companies")
+            matches = index.match(meeting_company_name.lower().strip(), 80)
+            if matches:
+                pos, _ = max(matches, key=lambda m: (m[1], -m[0]))
+                company = self._rows("companies", "seq = ?", (seqs[pos],))[0]
+
+            company_name = company.get("name") if company else None
+            company_id = company.get("company_id") if company else None
+
+            index, seqs, _ = self._name_index("contacts")
+            contact_seqs = {seqs[pos] for pos, score in
+                            index.match(meeting_contact_name.lower(), 80) if score > 80}
+            if company_id:
+                contact_seqs.update(seq for (seq,) in self._conn.execute(
+                    "SELECT seq FROM contacts WHERE company_id = ?", (company_id,)))
+            if company_name:
+                contact_seqs.update(seq for (seq,) in self._conn.execute(
+                    "SELECT seq FROM contacts WHERE company_name = ?", (company_name,)))
+            # contact_id is unique here, so the first three seqs are the answer
+            first = sorted(contact_seqs)[:3]
+            contacts = self._rows(
+                "contacts", f"seq IN ({', '.join('?' * len(first))})", first
+            ) if first else []
+
+            deals, meetings = [], []
+            if query:
+                group = company_name or meeting_company_name
+                deals = self._relevant("deals", group, query, k)
+                meetings = self._relevant("meetings", group, query, k)
+            elif company_name:
+                deals = self._rows("deals", "company_name = ?", (company_name,),
+                                   order="seq DESC", limit=3)[::-1]
+                meetings = self._rows("meetings", "company_name = ?", (company_name,),
+                                      order="seq DESC", limit=3)[::-1]
+
+            return company, contacts, deals, meetings
+
+    # ---------------- import / export ----------------
+
+    def import_json(self, paths=None):
+        """
+        One-shot migration: replace the tables with the legacy JSON files.
+        """
+        paths = dict(paths or self.json_paths)
+        with self._lock:
+            with self._transaction():
+                for name in DATASETS:
+                    if name not in paths:
+                        continue
+                    records = normalize_records(load_json(paths[name]), DATASETS[name][1])
+                    self._conn.execute(f"DELETE FROM {name}")
+                    self._upsert(name, records)
+            # Our own writes don't move data_version: drop the caches here
+            self._names.clear()
+            self._groups.clear()
+
+    def export_json(self, paths=None):
+        paths = dict(paths or self.json_paths)
+        for name in DATASETS:
+            if name in paths:
+                save_json(paths[name], self.load(name))
+
+
+class _Transaction:
+    """
+    BEGIN IMMEDIATE ... COMMIT/ROLLBACK on an autocommit connection.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        return False
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Manage the CRM SQLite database.")
+    parser.add_argument("command", choices=["migrate", "export"],
+                        help="import the legacy JSON files, or write them back out")
+    parser.add_argument("--db", default="crm.sqlite3")
+    args = parser.parse_args()
+
+    existed = os.path.exists(args.db)
+    storage = SQLiteStorage(args.db)
+    if args.command == "migrate":
+        if existed:
+            storage.import_json()
+        counts = {name: len(storage.load(name)) for name in DATASETS}
+        print(f"Migrated into {args.db}: {counts}")
+    else:
+        storage.export_json()
+    storage.close()
@@ -0,0 +1,793 @@
+import json
+import os
+import threading
+import time
+from bisect import bisect_left, bisect_right, insort
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+
+from locks import FileLock
+from metrics import span
+from records import compact, plain, to_record
+
+
+# -------------------------------------------------------
+# JSON data layer
+# -------------------------------------------------------
+
+def normalize_records(records, id_field):
+    """
+    Converts dict-of-dicts → list-of-dicts.
+    Leaves list-of-dicts unchanged.
+    """
+    if isinstance(records, dict):
+        fixed = []
+        for key, val in records.items():
+            if id_field not in val:
+                # Generate ID from key if missing
+                val[id_field] = key
+            fixed.append(val)
+        return fixed
+
+    if isinstance(records, list):
+        return records
+
+    return []
+
+def load_json(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, "r") as f:
+        return json.load(f)
+
+def save_json(path, data):
+    # Write aside and rename, so readers never see a half-written file
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, indent=2, default=plain)
+    os.replace(tmp_path, path)
+
+def load_companies(path="existing_companies.json"):
+    data = load_json(path)
+    return normalize_records(data, "company_id")
+
+def load_contacts(path="existing_contacts.json"):
+    data = load_json(path)
+    return normalize_records(data, "contact_id")
+
+def load_deals(path="previous_deals.json"):
+    data = load_json(path)
+    return normalize_records(data, "deal_id")
+
+def load_meetings(path="previous_meetings.json"):
+    data = load_json(path)
+    return normalize_records(data, "meeting_id")
+
+
+# dataset name -> (default file, primary key, id prefix)
+DATASETS = {
+    "companies": ("existing_companies.json", "company_id", "CO"),
+    "contacts":  ("existing_contacts.json", "contact_id", "C"),
+    "deals":     ("previous_deals.json", "deal_id", "D"),
+    "meetings":  ("previous_meetings.json", "meeting_id", "M"),
+}
+
+
+def _file_stamp(path):
+    """
+    Cheap change signature for a file: (mtime_ns, size), or None if missing.
+    """
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+# -------------------------------------------------------
+# Storage backends
+# -------------------------------------------------------
+
+class JsonStorage:
+    """
+    The original layout: one pretty-printed JSON file per dataset, each
+    rewritten in full when it changes.
+
+    A storage backend provides:
+      load(name)             -> list of records
+      stamp(name)            -> value that changes when someone else
+                                modifies the dataset on disk
+      commit(changes)        -> persist [(name, records, changed)], where
+                                changed lists the added/updated records,
+                                or is None when the whole dataset changed
+      wants_compaction()     -> True when compact() should be called
+      compact(state)         -> fold {name: records} into a new snapshot
+      write_lock()           -> FileLock serializing writers across processes
+      close()
+    """
+
+    def __init__(self, paths=None):
+        paths = dict(paths or {})
+        self.paths = {name: paths.get(name, spec[0]) for name, spec in DATASETS.items()}
+        data_dir = os.path.dirname(os.path.abspath(self.paths["companies"]))
+        self._write_lock = FileLock(os.path.join(data_dir, ".crm.lock"))
+
+    def load(self, name):
+        return normalize_records(load_json(self.paths[name]), DATASETS[name][1])
+
+    def stamp(self, name):
+        return _file_stamp(self.paths[name])
+
+    def commit(self, changes):
+        for name, records, _ in changes:
+            save_json(self.paths[name], records)
+
+    def wants_compaction(self):
+        return False
+
+    def compact(self, state):
+        pass
+
+    def write_lock(self):
+        return self._write_lock
+
+    def close(self):
+        self._write_lock.close()
+
+
+# -------------------------------------------------------
+# Id allocation and indexes
+# -------------------------------------------------------
+
+class IdAllocator:
+    """
+    Hands out "<PREFIX>-<n>" ids from a per-prefix high-water mark.
+
+    Marks are seeded from the records on load and only ever move up, so
+    an id is never reissued even if the data is reloaded or records
+    disappear. Safe to share between threads.
+    """
+
+    def __init__(self, start=2000):
+        self.start = start          # mark for a prefix with no ids yet
+        self._marks = {}
+        self._lock = threading.Lock()
+
+    def seed(self, prefix, records, id_field):
+        nums = []
+        for item in records:
+            if id_field in item:
+                try:
+                    nums.append(int(item[id_field].split("-")[1]))
+                except:
+                    pass
+        high = max(nums or [self.start])
+        with self._lock:
+            self._marks[prefix] = max(self._marks.get(prefix, high), high)
+
+    def reserve(self, prefix, n):
+        """
+        Claim a block of n consecutive ids in one step.
+        """
+        with self._lock:
+            first = self._marks.get(prefix, self.start) + 1
+            self._marks[prefix] = first + n - 1
+        return [f"{prefix}-{num}" for num in range(first, first + n)]
+
+    def next(self, prefix):
+        return self.reserve(prefix, 1)[0]
+
+
+class FieldIndex:
+    """
+    value -> positions of the records holding it, in insertion order.
+    """
+
+    def __init__(self, records, field):
+        self.field = field
+        self._size = 0
+        self._positions = defaultdict(list)
+        for record in records:
+            self.add(record)
+
+    def add(self, record):
+        self._positions[record.get(self.field)].append(self._size)
+        self._size += 1
+
+    def update(self, pos, record, fields):
+        """
+        Move pos to its new value for a pending update of `fields`.
+        """
+        old_value = record.get(self.field)
+        if self.field not in fields or fields[self.field] == old_value:
+            return
+        self._positions[old_value].remove(pos)
+        insort(self._positions[fields[self.field]], pos)
+
+    def get(self, value):
+        return self._positions.get(value, [])
+
+
+# -------------------------------------------------------
+# In-memory store
+# -------------------------------------------------------
+
+class VersionConflict(Exception):
+    """
+    An update expected a record version that is no longer current.
+    """
+
+    def __init__(self, name, record_id, expected, actual):
+        super().__init__(f"{name} {record_id}: expected version {expected}, found {actual}")
+        self.name = name
+        self.record_id = record_id
+        self.expected = expected
+        self.actual = actual
+
+
+class _Dataset:
+    def __init__(self, name, id_field, id_prefix):
+        self.name = name
+        self.id_field = id_field
+        self.id_prefix = id_prefix
+        self.records = None     # list of records.Record, None until first read
+        self.stamp = None       # storage.stamp() when we last read/wrote
+        self.version = 0        # bumped on every reload or mutation
+        self.dirty = False      # in-memory changes not yet written
+        self.changed = {}       # id(record) -> record pending write, None = all
+        self.seq = None         # write-lock counter the records are current at
+
+
+class CRMStore:
+    """
+    Holds the four CRM datasets in memory.
+
+    Each dataset is parsed once, into compact records (records.py) that
+    read and write like the dicts they replace. Reads re-check the
+    storage stamp and reload only when the data changed on disk (e.g.
+    edited by the notebook); commit() writes the changes made in memory
+    through the storage backend (JsonStorage unless another one is
+    passed).
+
+    Records carry a "version" that add() starts at 1 and update() bumps,
+    so a client can pass the version it read and have a conflicting
+    update refused (VersionConflict) instead of silently overwriting.
+
+    Writers are serialized across processes by the storage's write lock,
+    and write() groups concurrent callers into one commit.
+
+    Every commit bumps `revision`, and a change log of primary keys lets
+    changes_since(rev) list just the records changed after a revision.
+    Revisions are the write counter of the storage's write lock, shared
+    by every process using the files, so a revision one server worker
+    handed out means the same to the others and to a restarted one.
+    Anything the log can't answer for (a restart, commits made by
+    another process, files edited by hand, which bump the counter too)
+    asks the caller to resync.
+    """
+
+    # Change-log entries kept before the oldest half is dropped
+    CHANGE_LOG_SIZE = 100000
+
+    def __init__(self, paths=None, storage=None):
+        self.storage = storage or JsonStorage(paths)
+        self._datasets = {
+            name: _Dataset(name, id_field, id_prefix)
+            for name, (_, id_field, id_prefix) in DATASETS.items()
+        }
+        self.ids = IdAllocator()
+        self.lock = threading.RLock()
+        self._tx_depth = 0
+        self._tx_owner = None       # thread running the outermost transaction
+        self._queue = []            # (fn, Future, Event) waiting for write()
+        self._queue_lock = threading.Lock()
+        self.write_stats = {"writes": 0, "commits": 0}
+        self._indexes = {}          # (dataset, key) -> (version, index)
+
+        self._locked = False        # holding the storage's write lock
+        write_lock = self._write_lock()
+        # Without a shared counter, the clock keeps revisions increasing across restarts
+        self.revision = write_lock.peek() if write_lock else time.time_ns() // 1000000
+        self._log_floor = self.revision     # oldest revision the log covers
+        self._log_revs = []                 # revision per entry, ascending
+        self._log = []                      # (dataset, primary key)
+
+    # ---------------- reads ----------------
+
+    def _dataset(self, name):
+        ds = self._datasets[name]
+        if ds.records is None:
+            self._load(ds)
+        elif (not ds.dirty and not self._tx_depth
+              and self.storage.stamp(ds.name) != ds.stamp):
+            # Inside a transaction the view stays fixed; freshness is
+            # checked once when the transaction starts.
+            self._load(ds)
+        return ds
+
+    def _load(self, ds):
+        reloading = ds.records is not None and not ds.dirty
+        loaded_seq = ds.seq
+        ds.stamp = self.storage.stamp(ds.name)
+        # Read before loading: a write landing in between makes us reload
+        # once more, never miss it
+        write_lock = self._write_lock()
+        ds.seq = write_lock.peek() if write_lock else None
+        with span("load"):
+            ds.records = compact(ds.name, self.storage.load(ds.name))
+        ds.version += 1
+        ds.dirty = False
+        ds.changed = {}
+        self.ids.seed(ds.id_prefix, ds.records, ds.id_field)
+
+        if ds.seq is not None and ds.seq > self.revision:
+            # Includes commits made elsewhere; the log can't list them
+            self._reset_log(ds.seq)
+        elif reloading and (ds.seq is None or ds.seq == loaded_seq):
+            # Changed behind our back without a commit: edited by hand
+            self._reset_log()
+
+    def records(self, name):
+        with self.lock:
+            return self._dataset(name).records
+
+    def version(self, name):
+        with self.lock:
+            return self._dataset(name).version
+
+    @property
+    def companies(self):
+        return self.records("companies")
+
+    @property
+    def contacts(self):
+        return self.records("contacts")
+
+    @property
+    def deals(self):
+        return self.records("deals")
+
+    @property
+    def meetings(self):
+        return self.records("meetings")
+
+    def _index(self, name, key, build):
+        with self.lock:
+            ds = self._dataset(name)
+            cached = self._indexes.get((name, key))
+            if cached is None or cached[0] != ds.version:
+                cached = (ds.version, build(ds.records))
+                self._indexes[(name, key)] = cached
+            return cached[1]
+
+    def name_index(self, name):
+        """
+        Fuzzy-match index over the dataset's "name" field, rebuilt only
+        when the dataset version changes.
+        """
+        from name_index import NameIndex    # rapidfuzz; only needed for lookups
+        return self._index(name, "name", NameIndex)
+
+    def field_index(self, name, field):
+        """
+        Exact-match index over one field, e.g. ("deals", "company_name")
+        or ("meetings", "deal_linked").
+        """
+        return self._index(name, ("field", field),
+                           lambda records: FieldIndex(records, field))
+
+    def deal_columns(self):
+        """
+        Columnar (NumPy) view of the deals for analytics, patched on
+        add()/update() like the other indexes.
+        """
+        from analytics import DealColumns   # numpy; only needed for analytics
+        return self._index("deals", "columns", DealColumns)
+
+    def retrieval_index(self, name):
+        """
+        Text search index over meetings or deals (retrieval.py), patched
+        on add()/update() like the other indexes.
+        """
+        from retrieval import TEXT_FIELDS, RetrievalIndex   # numpy; only needed for retrieval
+        return self._index(name, "retrieval",
+                           lambda records: RetrievalIndex(records, TEXT_FIELDS[name]))
+
+    def snapshot(self):
+        with self.lock:
+            return {name: self.records(name) for name in self._datasets}
+
+    def current_revision(self):
+        """
+        Revision after picking up any changes made elsewhere.
+        """
+        with self.lock:
+            write_lock = self._write_lock()
+            seq = write_lock.peek() if write_lock else None
+            for ds in self._datasets.values():
+                if (seq is not None and ds.records is not None and ds.seq != seq
+                        and not ds.dirty and not self._tx_depth):
+                    # Another process committed: whatever the file stamps say
+                    self._load(ds)
+                else:
+                    self._dataset(ds.name)
+            return self.revision
+
+    def page(self, name, offset=0, limit=None, fields=None):
+        """
+        (total, records) for a slice of one dataset in storage order,
+        copied and projected to `fields` (the id is always included).
+        """
+        with self.lock:
+            ds = self._dataset(name)
+            end = None if limit is None else offset + limit
+            rows = ds.records[offset:end]
+            if fields:
+                keep = [ds.id_field] + [f for f in fields if f != ds.id_field]
+                rows = [{f: r[f] for f in keep if f in r} for r in rows]
+            else:
+                rows = [dict(r) for r in rows]
+            return len(ds.records), rows
+
+    def changes_since(self, since):
+        """
+        (revision, {dataset: [records]}) with the current version of
+        every record changed after revision `since`, or (revision, None)
+        if the change log can't answer for `since` and a full resync is due.
+        """
+        with self.lock:
+            self.current_revision()
+            if since < self._log_floor or since > self.revision:
+                # Ahead of us: not a revision of these files (e.g. they were replaced)
+                return self.revision, None
+
+            keys = {}
+            for name, key in self._log[bisect_right(self._log_revs, since):]:
+                keys.setdefault(name, {})[key] = None
+            changes = {}
+            for name, ids in keys.items():
+                records = (self.get(name, key) for key in ids)
+                changes[name] = [dict(r) for r in records if r is not None]
+            return self.revision, changes
+
+    def _reset_log(self, revision=None):
+        """
+        Start the change log over at `revision`, or at a new revision
+        every process sees.
+        """
+        if revision is None:
+            revision = self._bump_shared() or self.revision + 1
+        self.revision = revision
+        self._log_floor = self.revision
+        self._log_revs.clear()
+        self._log.clear()
+
+    def _bump_shared(self):
+        """
+        Move the shared write counter on; returns it (None without one).
+        """
+        write_lock = self._write_lock()
+        if write_lock is None:
+            return None
+        if self._locked:
+            write_lock.bump()
+        else:
+            with write_lock:
+                write_lock.bump()
+        return write_lock.seq
+
+    def _log_commit(self, dirty):
+        # transaction() bumps the shared counter to this once committed
+        write_lock = self._write_lock()
+        revision = write_lock.seq + 1 if write_lock and self._locked else self.revision + 1
+        for ds in dirty:
+            if ds.changed is None:
+                self._reset_log(revision)
+                return
+        self.revision = revision
+        for ds in dirty:
+            for record in ds.changed.values():
+                self._log_revs.append(self.revision)
+                self._log.append((ds.name, record.get(ds.id_field)))
+
+        if len(self._log) > self.CHANGE_LOG_SIZE:
+            cut = len(self._log) // 2
+            # Keep whole revisions: a revision is either fully logged or not
+            self._log_floor = self._log_revs[cut]
+            cut = bisect_left(self._log_revs, self._log_floor)
+            del self._log_revs[:cut], self._log[:cut]
+
+    # ---------------- writes ----------------
+
+    def new_id(self, name):
+        return self.reserve_ids(name, 1)[0]
+
+    def reserve_ids(self, name, n):
+        """
+        Claim n fresh ids for a dataset, e.g. ahead of a bulk import.
+        """
+        with self.lock:
+            ds = self._dataset(name)    # make sure the allocator is seeded
+        return self.ids.reserve(ds.id_prefix, n)
+
+    def _advance_indexes(self, name, version, apply):
+        """
+        Carry indexes that are current at `version` over to the dataset's
+        new version, calling apply(index) to patch each one.
+        """
+        ds = self._datasets[name]
+        for (index_name, key), (index_version, index) in self._indexes.items():
+            if index_name == name and index_version == version:
+                apply(index)
+                self._indexes[(index_name, key)] = (ds.version, index)
+
+    def add(self, name, record):
+        """
+        Append a record (a dict or a Record) and return the stored Record.
+        """
+        with self.lock:
+            ds = self._dataset(name)
+            record = to_record(name, record)
+            record.setdefault("version", 1)
+            ds.records.append(record)
+            ds.version += 1
+            ds.dirty = True
+            self._changed(ds, record)
+
+            # Appends extend current indexes instead of invalidating them
+            self._advance_indexes(name, ds.version - 1,
+                                  lambda index: index.add(record))
+        return record
+
+    def get(self, name, record_id):
+        """
+        Record with the given primary key, or None.
+        """
+        with self.lock:
+            ds = self._dataset(name)
+            positions = self.field_index(name, ds.id_field).get(record_id)
+            return ds.records[positions[0]] if positions else None
+
+    def update(self, name, record_id, fields, expected_version=None):
+        """
+        Apply `fields` to the record with the given primary key, keeping
+        the indexes current, and bump its version. Returns the record, or
+        None if the id is unknown. With expected_version, raises
+        VersionConflict unless the record is still at that version
+        (records written before versions existed count as 0).
+        """
+        with self.lock:
+            ds = self._dataset(name)
+            positions = list(self.field_index(name, ds.id_field).get(record_id))
+            if not positions:
+                return None
+
+            records = [ds.records[pos] for pos in positions]
+            current = records[0].get("version", 0)
+            if expected_version is not None and expected_version != current:
+                raise VersionConflict(name, record_id, expected_version, current)
+            fields = dict(fields, version=current + 1)
+
+            def patch(index):
+                for pos, record in zip(positions, records):
+                    index.update(pos, record, fields)
+
+            ds.version += 1
+            ds.dirty = True
+            self._advance_indexes(name, ds.version - 1, patch)
+            for record in records:
+                record.update(fields)
+                self._changed(ds, record)
+
+            return ds.records[positions[0]]
+
+    def _changed(self, ds, record):
+        if ds.changed is not None:
+            ds.changed[id(record)] = record
+
+    def touch(self, name):
+        """
+        Mark a dataset as changed after records were updated in place.
+        """
+        with self.lock:
+            ds = self._dataset(name)
+            ds.version += 1
+            ds.dirty = True
+            ds.changed = None
+
+    def commit(self):
+        """
+        Write the pending changes; True if there were any.
+        """
+        with self.lock:
+            dirty = [ds for ds in self._datasets.values() if ds.dirty]
+            if not dirty:
+                return False
+
+            with span("save"):
+                self.storage.commit([
+                    (ds.name, ds.records,
+                     None if ds.changed is None else list(ds.changed.values()))
+                    for ds in dirty
+                ])
+            self._log_commit(dirty)
+            for ds in dirty:
+                ds.stamp = self.storage.stamp(ds.name)
+                ds.dirty = False
+                ds.changed = {}
+
+            if self.storage.wants_compaction():
+                self.compact()
+            return True
+
+    def compact(self):
+        """
+        Let the storage fold its write log into a new snapshot.
+        """
+        with self.lock:
+            # Copies, so the snapshot can be written while we keep mutating
+            state = {
+                name: [dict(record) for record in self._dataset(name).records]
+                for name in self._datasets
+            }
+            self.storage.compact(state)
+
+    def discard(self):
+        """
+        Drop uncommitted in-memory changes; next read reloads from disk.
+        """
+        with self.lock:
+            for ds in self._datasets.values():
+                if ds.dirty:
+                    ds.records = None
+                    ds.dirty = False
+                    ds.changed = {}
+
+    def close(self):
+        self.storage.close()
+
+    def _write_lock(self):
+        write_lock = getattr(self.storage, "write_lock", None)
+        return write_lock() if write_lock else None
+
+    @contextmanager
+    def transaction(self):
+        """
+        Hold the store lock, and the storage's write lock, for a
+        read-modify-write and commit on success. Nested transactions join
+        the outermost one.
+        """
+        with self.lock:
+            if self._tx_depth:
+                self._tx_depth += 1
+                try:
+                    yield self
+                finally:
+                    self._tx_depth -= 1
+                return
+
+            write_lock = self._write_lock()
+            with write_lock or nullcontext():
+                self._locked = write_lock is not None
+                seq = write_lock.seq if write_lock else None
+                try:
+                    for ds in self._datasets.values():
+                        if ds.records is not None and ds.seq != seq and not ds.dirty:
+                            # Another process wrote since we loaded; don't rely
+                            # on file stamps having noticed
+                            self._load(ds)
+                        else:
+                            self._dataset(ds.name)
+                except BaseException:
+                    self._locked = False
+                    raise
+
+                self._tx_depth = 1
+                self._tx_owner = threading.get_ident()
+                try:
+                    yield self
+                except BaseException:
+                    self.discard()
+                    raise
+                else:
+                    if self.commit() and write_lock:
+                        write_lock.bump()
+                    for ds in self._datasets.values():
+                        ds.seq = write_lock.seq if write_lock else None
+                finally:
+                    self._tx_depth = 0
+                    self._tx_owner = None
+                    self._locked = False
+
+    def write(self, fn):
+        """
+        Run fn(store) in a transaction and return (fn's result, revision
+        that includes it).
+
+        Callers queue up; the one at the head of the queue runs everything
+        queued so far in a single transaction and commit (group commit),
+        then hands over to the next head. If any fn raises, the group is
+        rolled back and its members are retried one by one, so only the
+        failing one sees the error. Results should be copies: records may
+        change again as soon as the group commits. Don't call it while
+        holding store.lock outside a transaction: the leader needs it.
+        """
+        if self._tx_depth and self._tx_owner == threading.get_ident():
+            # Already inside our own transaction: just join it
+            return fn(self), self.revision
+
+        from concurrent.futures import Future
+
+        slot, turn = Future(), threading.Event()
+        with self._queue_lock:
+            self._queue.append((fn, slot, turn))
+            if len(self._queue) == 1:
+                turn.set()
+        turn.wait()     # our turn to lead, or a leader already ran us
+        if slot.done():
+            return slot.result()
+
+        with self._queue_lock:
+            group = list(self._queue)
+        try:
+            with self.lock:
+                self._write_group([(f, s) for f, s, _ in group])
+        finally:
+            with self._queue_lock:
+                del self._queue[:len(group)]
+                if self._queue:
+                    self._queue[0][2].set()
+            for _, _, waiting in group:
+                waiting.set()
+        return slot.result()
+
+    def _write_group(self, group):
+        try:
+            with self.transaction():
+                results = [fn(self) for fn, _ in group]
+        except Exception as e:
+            if len(group) == 1:
+                group[0][1].set_exception(e)
+            else:
+                for item in group:
+                    self._write_group([item])
+            return
+        except BaseException as e:
+            for _, slot in group:
+                slot.set_exception(e)
+            raise
+
+        self.write_stats["writes"] += len(group)
+        self.write_stats["commits"] += 1
+        for (_, slot), result in zip(group, results):
+            slot.set_result((result, self.revision))
+
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+def _default_storage():
+    mode = os.getenv("CRM_STORAGE", "json")
+    if mode == "json":
+        return JsonStorage()
+    if mode == "journal":
+        from journal import JournalStorage
+        return JournalStorage()
+    if mode == "sqlite":
+        from sqlite_storage import SQLiteStorage
+        return SQLiteStorage()
+    raise ValueError(f"Unknown CRM_STORAGE mode: {mode}")
+
+
+def get_store():
+    """
+    Process-wide store over the default files. CRM_STORAGE=journal keeps
+    them in an append-only journal instead of rewriting the JSON files,
+    CRM_STORAGE=sqlite in a SQLite database (crm.sqlite3).
+    """
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = CRMStore(storage=_default_storage())
+        return _default_store
@@ -0,0 +1,97 @@
+import json
+
+# Top-level lists of the extraction whose items are streamed out
+ENTITY_LISTS = ("contacts", "companies", "deals", "actions")
+
+
+class StreamParser:
+    """
+    Incremental scanner over a streamed extraction JSON object.
+
+    feed() takes text deltas as they arrive and returns the entities
+    completed by that delta, as (list name, dict) pairs, e.g.
+    ("contacts", {...}) once the contact's closing brace is seen. Only
+    the text of the entity being read is kept apart; the full response
+    is a list of deltas joined once by text().
+
+    Anything before the first "{" (e.g. a ```json fence) is skipped. An
+    entity that fails to parse is left to the final extract_json pass.
+    """
+
+    def __init__(self, lists=ENTITY_LISTS):
+        self.lists = set(lists)
+        self.parts = []
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.key_chars = None       # characters of a top-level key being read
+        self.expect_key = False
+        self.key = None             # last top-level key
+        self.list_key = None        # top-level list we are inside
+        self.item = None            # characters of the entity being read
+
+    def text(self):
+        return "".join(self.parts)
+
+    def feed(self, delta):
+        self.parts.append(delta)
+        done = []
+        item_start = 0 if self.item is not None else None
+
+        for i, ch in enumerate(delta):
+            if self.depth == 0 and ch != "{":
+                # Outside the root object (preamble, fences, trailing text)
+                continue
+            if self.in_string:
+                if self.key_chars is not None and not (self.escape or ch in '"\\'):
+                    self.key_chars.append(ch)
+                if self.escape:
+                    self.escape = False
+                elif ch == "\\":
+                    self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+                    if self.key_chars is not None:
+                        self.key = "".join(self.key_chars)
+                        self.key_chars = None
+                continue
+
+            if ch == '"':
+                self.in_string = True
+                if self.depth == 1 and self.expect_key:
+                    self.key_chars = []
+                    self.expect_key = False
+            elif ch in "{[":
+                self.depth += 1
+                if self.depth == 1:
+                    self.expect_key = True
+                elif self.depth == 2 and ch == "[" and self.key in self.lists:
+                    self.list_key = self.key
+                elif self.depth == 3 and ch == "{" and self.list_key is not None:
+                    self.item = []
+                    item_start = i
+            elif ch in "}]":
+                if self.depth == 3 and ch == "}" and self.item is not None:
+                    self.item.append(delta[item_start:i + 1])
+                    entity = self._parse("".join(self.item))
+                    if entity is not None:
+                        done.append((self.list_key, entity))
+                    self.item = None
+                    item_start = None
+                elif self.depth == 2:
+                    self.list_key = None
+                self.depth = max(0, self.depth - 1)
+            elif ch == "," and self.depth == 1:
+                self.expect_key = True
+
+        if self.item is not None and item_start is not None:
+            self.item.append(delta[item_start:])
+        return done
+
+    @staticmethod
+    def _parse(text):
+        try:
+            value = json.loads(text)
+        except ValueError:
+            return None
+        return value if isinstance(value, dict) else None
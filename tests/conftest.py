@@ -0,0 +1,50 @@
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from store import DATASETS
+
+COMPANIES = [
+    {"company_id": "CO-2001", "name": "Mercury Consulting", "industry": "Consulting",
+     "size": "SMB", "location": "Berlin, Germany"},
+    {"company_id": "CO-2002", "name": "Nexora AI", "industry": "SaaS", "size": None, "location": None},
+]
+CONTACTS = [
+    {"contact_id": "C-1001", "name": "Liu Wei", "job_title": "CTO", "email": "liu@mercury.example",
+     "phone": None, "decision_power": "yes", "company_name": "Mercury Consulting"},
+    {"contact_id": "C-1002", "name": "Priya Shah", "job_title": "CMO", "email": None,
+     "phone": None, "decision_power": "Unknown", "company_name": "Nexora AI"},
+]
+DEALS = [
+    {"deal_id": "D-3001", "company_name": "Mercury Consulting", "deal_name": "Mercury Analytics",
+     "value": 50000, "currency": "EUR", "stage": "Discovery", "timeline": None,
+     "next_steps": "Send proposal", "competitors": ["HubSpot"]},
+]
+MEETINGS = [
+    {"meeting_id": "M-4001", "contact_name": "Liu Wei", "company_name": "Mercury Consulting",
+     "timestamp": "2025-01-10T12:00:00Z", "summary": "Intro call about analytics.",
+     "outcome": "Proposal requested", "deal_linked": "D-3001"},
+]
+
+
+def write_datasets(directory, data=None):
+    """
+    Write the four datasets as JSON files under directory; returns
+    {dataset: path} for CRMStore / the storage backends.
+    """
+    data = data or {"companies": COMPANIES, "contacts": CONTACTS, "deals": DEALS, "meetings": MEETINGS}
+    paths = {}
+    for name, (filename, _, _) in DATASETS.items():
+        paths[name] = str(directory / filename)
+        with open(paths[name], "w") as f:
+            json.dump(data.get(name, []), f)
+    return paths
+
+
+@pytest.fixture
+def paths(tmp_path):
+    return write_datasets(tmp_path)
@@ -0,0 +1,108 @@
+import math
+from collections import defaultdict
+
+import pytest
+from fastapi.testclient import TestClient
+
+import analytics
+import server
+from analytics import DealColumns
+from store import CRMStore
+
+DEALS = [
+    {"deal_id": "D-1", "company_name": "Acme", "value": 1000, "currency": "USD", "stage": "Discovery",
+     "competitors": ["HubSpot", "Salesforce"]},
+    {"deal_id": "D-2", "company_name": "Acme", "value": "2,500", "currency": "eur", "stage": "Closed Won",
+     "competitors": ["HubSpot"]},
+    {"deal_id": "D-3", "company_name": "Globex", "value": "Unknown", "currency": "USD", "stage": "closed-lost",
+     "competitors": []},
+    {"deal_id": "D-4", "company_name": "Globex", "value": 300, "currency": "XYZ", "stage": "Won",
+     "competitors": ["Salesforce", "Salesforce"]},
+    {"deal_id": "D-5", "company_name": "Initech", "value": 700.5, "currency": "GBP", "stage": "Negotiation",
+     "competitors": None},
+]
+
+
+def reference(deals, by, open_only=False):
+    """
+    The same grouping as DealColumns.group_by, one deal at a time.
+    """
+    groups = defaultdict(lambda: {"deals": 0, "value": 0.0, "won": 0, "lost": 0})
+    for deal in deals:
+        amount = analytics._amount(deal.get("value"))
+        rate = analytics.FX_RATES.get(analytics._currency(deal.get("currency")), math.nan)
+        amount = amount * rate / analytics.FX_RATES[analytics.BASE_CURRENCY]
+        stage = analytics._stage_key(deal.get("stage"))
+        won, lost = stage in analytics.WON_STAGES, stage in analytics.LOST_STAGES
+        if open_only and (won or lost):
+            continue
+        if by == "competitor":
+            labels = DealColumns._competitor_names(deal.get("competitors"))
+        else:
+            labels = [deal.get("stage" if by == "stage" else "company_name")]
+        for label in labels:
+            g = groups[label]
+            g["deals"] += 1
+            g["value"] += 0.0 if math.isnan(amount) else amount
+            g["won"] += won
+            g["lost"] += lost
+    return {label: dict(g, value=round(g["value"], 2),
+                        win_rate=round(g["won"] / (g["won"] + g["lost"]), 4) if g["won"] + g["lost"] else None)
+            for label, g in groups.items()}
+
+
+def as_dict(groups, by):
+    return {g[by]: {k: v for k, v in g.items() if k != by} for g in groups}
+
+
+@pytest.mark.parametrize("by", analytics.GROUPS)
+@pytest.mark.parametrize("open_only", [False, True])
+def test_group_by_matches_a_plain_aggregate(by, open_only):
+    groups = DealColumns(DEALS).group_by(by, open_only=open_only)
+    assert as_dict(groups, by) == reference(DEALS, by, open_only)
+    values = [g["value"] for g in groups]
+    assert values == sorted(values, reverse=True)
+
+
+def test_updates_and_adds_match_a_rebuild():
+    deals = [dict(d) for d in DEALS]
+    columns = DealColumns(deals)
+    columns.group_by("competitor")              # fill the cache
+
+    change = {"stage": "Closed Lost", "value": 400, "competitors": ["Zoho"]}
+    columns.update(0, deals[0], change)
+    deals[0].update(change)
+    deals.append({"deal_id": "D-6", "company_name": "Initech", "value": 50, "currency": "USD",
+                  "stage": "Discovery", "competitors": ["HubSpot"]})
+    columns.add(deals[-1])
+
+    rebuilt = DealColumns(deals)
+    for by in analytics.GROUPS:
+        assert as_dict(columns.group_by(by), by) == as_dict(rebuilt.group_by(by), by) == reference(deals, by)
+    assert columns.summary() == rebuilt.summary()
+
+
+def test_summary_totals():
+    summary = DealColumns(DEALS).summary()
+    eur = analytics.FX_RATES["EUR"]
+    assert summary["deals"] == 5
+    assert summary["won"] == 2 and summary["lost"] == 1
+    assert summary["win_rate"] == round(2 / 3, 4)
+    assert summary["unpriced"] == 1 and summary["unconverted"] == 1
+    assert summary["won_value"] == round(2500 * eur, 2)
+    assert summary["pipeline_value"] == round(1000 + 700.5 * analytics.FX_RATES["GBP"], 2)
+
+
+def test_pipeline_endpoint_bounds_limit(paths, monkeypatch):
+    store = CRMStore(paths)
+    monkeypatch.setattr(server, "get_store", lambda: store)
+    client = TestClient(server.app)
+    try:
+        reply = client.get("/analytics/pipeline/company", params={"limit": 1})
+        assert reply.status_code == 200
+        assert [g["company"] for g in reply.json()["groups"]] == ["Mercury Consulting"]
+        assert client.get("/analytics/pipeline/company", params={"limit": 0}).status_code == 422
+        assert client.get("/analytics/pipeline/company", params={"limit": 10 ** 6}).status_code == 422
+        assert client.get("/analytics/pipeline/region").status_code == 400
+    finally:
+        store.close()
@@ -0,0 +1,113 @@
+import pytest
+
+from conftest import write_datasets
+from crm import apply_actions, apply_actions_bulk
+from store import CRMStore, load_json
+
+
+@pytest.fixture
+def store(paths):
+    store = CRMStore(paths)
+    yield store
+    store.close()
+
+
+def extraction(**sections):
+    data = {"contacts": [], "companies": [], "deals": [], "actions": []}
+    data.update(sections)
+    return data
+
+
+COMPANY = {"temp_id": "co1", "existing_id": None, "name": "Orbit Labs", "industry": "SaaS",
+           "size": "SMB", "location": "Oslo"}
+CONTACT = {"temp_id": "c1", "existing_id": None, "name": "Anna Li", "job_title": "CEO", "email": None,
+           "phone": None, "decision_power": "High"}
+DEAL = {"temp_id": "d1", "existing_id": None, "name": "Orbit pilot", "value": 1000, "currency": "USD",
+        "stage": "Discovery", "timeline": None, "next_steps": None, "competitors": []}
+
+
+def test_new_records_get_ids_and_are_saved(store, paths):
+    result = apply_actions(extraction(companies=[COMPANY], contacts=[CONTACT], deals=[DEAL]), store=store)
+
+    assert result["mapping"] == {"co1": "CO-2003", "c1": "C-1003", "d1": "D-3002"}
+    assert result["unknown_ids"] == [] and result["conflicts"] == []
+    assert [r["contact_id"] for r in result["changed"]["contacts"]] == ["C-1003"]
+    contact = store.get("contacts", "C-1003")
+    assert (contact["company_id"], contact["company_name"]) == ("CO-2003", "Orbit Labs")
+    assert store.get("deals", "D-3002")["company_name"] == "Orbit Labs"
+    assert load_json(paths["companies"])[-1]["name"] == "Orbit Labs"
+
+
+def test_updates_by_existing_id_and_unknown_ids(store):
+    known = dict(CONTACT, existing_id="C-1002", job_title="CEO")
+    unknown = dict(CONTACT, temp_id="c2", existing_id="C-9999")
+    deal = dict(DEAL, existing_id="D-3001", stage="Proposal")
+
+    result = apply_actions(extraction(contacts=[known, unknown], deals=[deal]), store=store)
+
+    assert result["mapping"] == {"c1": "C-1002", "d1": "D-3001"}
+    assert result["unknown_ids"] == [{"entity": "contact", "temp_id": "c2", "existing_id": "C-9999"}]
+    assert store.get("contacts", "C-1002")["job_title"] == "CEO"
+    assert store.get("deals", "D-3001")["stage"] == "Proposal"
+    assert store.get("contacts", "C-9999") is None
+    assert len(store.contacts) == 2
+
+
+def test_store_opened_from_paths_is_closed(paths):
+    result = apply_actions(extraction(companies=[COMPANY]), paths["companies"], paths["contacts"],
+                           paths["deals"])
+    assert result["mapping"] == {"co1": "CO-2003"}
+
+    # The write lock was released: another store can commit straight away
+    store = CRMStore(paths)
+    with store.transaction():
+        store.add("companies", {"company_id": store.new_id("companies"), "name": "Next"})
+    assert store.get("companies", "CO-2004")["name"] == "Next"
+    store.close()
+
+
+def test_bulk_resolves_temp_ids_per_payload_in_one_commit(store, paths):
+    payloads = [
+        extraction(companies=[COMPANY], contacts=[CONTACT], deals=[DEAL]),
+        extraction(companies=[dict(COMPANY, name="Zenith AG")], contacts=[dict(CONTACT, name="Bo Ek")]),
+        extraction(contacts=[dict(CONTACT, existing_id="C-1001", job_title="CEO")]),
+    ]
+    commits = store.write_stats["commits"]
+
+    result = apply_actions_bulk(payloads, store=store)
+
+    assert store.write_stats["commits"] == commits + 1
+    assert [r["mapping"] for r in result["results"]] == [
+        {"co1": "CO-2003", "c1": "C-1003", "d1": "D-3002"},
+        {"co1": "CO-2004", "c1": "C-1004"},
+        {"c1": "C-1001"},
+    ]
+    assert store.get("contacts", "C-1004")["company_name"] == "Zenith AG"
+    assert sorted(r["contact_id"] for r in result["changed"]["contacts"]) == ["C-1001", "C-1003", "C-1004"]
+    assert result["revision"] == store.revision
+    assert [c["name"] for c in load_json(paths["companies"])][-2:] == ["Orbit Labs", "Zenith AG"]
+
+
+def test_bulk_skips_invalid_payloads_and_applies_the_rest(store):
+    broken = extraction(companies=[dict(COMPANY, name=None)])
+    result = apply_actions_bulk([broken, extraction(companies=[COMPANY])], store=store)
+
+    first, second = result["results"]
+    assert (first["index"], first["ok"]) == (0, False)
+    assert first["errors"] == ["companies[0].name: must be a string"]
+    assert (second["index"], second["ok"], second["mapping"]) == (1, True, {"co1": "CO-2003"})
+    assert len(store.companies) == 3
+
+
+def test_bulk_matches_applying_one_at_a_time(tmp_path):
+    payloads = [extraction(companies=[dict(COMPANY, name=f"Co {i}")], contacts=[dict(CONTACT, name=f"P {i}")],
+                           deals=[dict(DEAL, existing_id="D-3001", value=i)]) for i in range(5)]
+    (tmp_path / "one").mkdir()
+    (tmp_path / "bulk").mkdir()
+    one, bulk = write_datasets(tmp_path / "one"), write_datasets(tmp_path / "bulk")
+    for payload in payloads:
+        apply_actions(payload, one["companies"], one["contacts"], one["deals"])
+    apply_actions_bulk(payloads, bulk["companies"], bulk["contacts"], bulk["deals"])
+
+    for name in ("companies", "contacts", "deals"):
+        assert load_json(one[name]) == load_json(bulk[name])
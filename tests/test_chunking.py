@@ -0,0 +1,101 @@
+from chunking import merge_extractions, speaker_turns, split_transcript
+
+
+def chunk(contacts=(), companies=(), deals=(), actions=()):
+    return {"contacts": list(contacts), "companies": list(companies),
+            "deals": list(deals), "actions": list(actions)}
+
+
+def test_entities_are_matched_by_name_and_renumbered():
+    first = chunk(contacts=[{"temp_id": "c1", "existing_id": None, "name": "Liu Wei", "email": None}],
+                  companies=[{"temp_id": "co1", "existing_id": None, "name": "Mercury Consulting"}])
+    second = chunk(contacts=[{"temp_id": "c1", "existing_id": None, "name": "Priya Shah", "email": None},
+                             {"temp_id": "c2", "existing_id": None, "name": " liu  WEI ",
+                              "email": "liu@mercury.example"}])
+
+    merged = merge_extractions([first, second])
+
+    assert [(c["temp_id"], c["name"]) for c in merged["contacts"]] == [("c1", "Liu Wei"), ("c2", "Priya Shah")]
+    assert merged["contacts"][0]["email"] == "liu@mercury.example"
+    assert [c["temp_id"] for c in merged["companies"]] == ["co1"]
+
+
+def test_existing_id_wins_over_name():
+    first = chunk(companies=[{"temp_id": "co1", "existing_id": "CO-2001", "name": "Mercury",
+                              "industry": "Unknown"}])
+    second = chunk(companies=[{"temp_id": "co1", "existing_id": "CO-2001", "name": "Mercury Consulting",
+                               "industry": "Consulting"}])
+
+    merged = merge_extractions([first, second])
+
+    assert len(merged["companies"]) == 1
+    # First non-empty value wins; "Unknown" counts as empty
+    assert merged["companies"][0]["name"] == "Mercury"
+    assert merged["companies"][0]["industry"] == "Consulting"
+
+
+def test_competitors_are_unioned():
+    first = chunk(deals=[{"temp_id": "d1", "existing_id": None, "name": "Rollout", "competitors": ["HubSpot"]}])
+    second = chunk(deals=[{"temp_id": "d1", "existing_id": None, "name": "rollout",
+                           "competitors": ["Zoho", "HubSpot"]}])
+
+    merged = merge_extractions([first, second])
+
+    assert merged["deals"][0]["competitors"] == ["HubSpot", "Zoho"]
+
+
+def test_actions_follow_renumbering_and_are_deduplicated():
+    first = chunk(contacts=[{"temp_id": "c1", "existing_id": None, "name": "Liu Wei"}],
+                  actions=[{"entity": "contact", "operation": "create", "target_temp_id": "c1"}])
+    second = chunk(contacts=[{"temp_id": "c1", "existing_id": None, "name": "Priya Shah"},
+                             {"temp_id": "c2", "existing_id": None, "name": "Liu Wei"}],
+                   actions=[{"entity": "contact", "operation": "create", "target_temp_id": "c1"},
+                            {"entity": "contact", "operation": "create", "target_temp_id": "c2"}])
+
+    merged = merge_extractions([first, second])
+
+    assert [(a["operation"], a["target_temp_id"]) for a in merged["actions"]] == [
+        ("create", "c1"), ("create", "c2")]
+    names = {c["temp_id"]: c["name"] for c in merged["contacts"]}
+    assert names == {"c1": "Liu Wei", "c2": "Priya Shah"}
+
+
+def test_merge_is_deterministic():
+    chunks = [chunk(contacts=[{"temp_id": "c1", "existing_id": None, "name": n}]) for n in ("A", "B", "a")]
+    assert merge_extractions(chunks) == merge_extractions(chunks)
+
+
+def test_chunk_reports_are_kept():
+    first = dict(chunk(), meta={"ok": True})
+    second = dict(chunk(), meta={"ok": False})
+    assert merge_extractions([first, second])["meta"] == {"ok": False, "chunks": [{"ok": True}, {"ok": False}]}
+    assert "meta" not in merge_extractions([chunk()])
+
+
+TRANSCRIPT = "\n".join(f"{name} ({role}): " + f"Point {i} about the rollout. " * 20
+                        for i, (name, role) in enumerate([("Ravi", "CIO"), ("Anita", "CFO"), ("Sonal", "Compliance")] * 4))
+
+
+def test_chunks_keep_turns_whole_and_overlap_by_one():
+    turns = speaker_turns(TRANSCRIPT)
+    chunks = split_transcript(TRANSCRIPT, chunk_chars=1500)
+
+    assert len(turns) == 12 and len(chunks) > 1
+    assert all(len(chunk) <= 1500 for chunk in chunks)
+    parts = [chunk.split("\n\n") for chunk in chunks]
+    assert all(part in turns for chunk in parts for part in chunk)
+    for before, after in zip(parts, parts[1:]):
+        assert after[0] == before[-1]
+    # Every turn is in some chunk, in order
+    assert list(dict.fromkeys(t for chunk in parts for t in chunk)) == turns
+
+
+def test_a_turn_too_long_for_a_chunk_is_cut_at_sentences():
+    chunks = split_transcript("Ravi: " + "This is one sentence. " * 100, chunk_chars=300)
+    assert len(chunks) > 1
+    assert all(len(chunk) <= 300 for chunk in chunks)
+    assert all(chunk.rstrip().endswith(".") for chunk in chunks)
+
+
+def test_paragraphs_without_speakers_are_turns():
+    assert speaker_turns("first part\n\n\nsecond part") == ["first part", "second part"]
@@ -0,0 +1,87 @@
+import pytest
+
+from conftest import write_datasets
+from dedup import build_plan, apply_plan, company_key
+from store import CRMStore
+
+COMPANIES = [
+    {"company_id": "CO-2001", "name": "Nexora A.I.", "industry": None},
+    {"company_id": "CO-2002", "name": "NEXORA AI Inc", "industry": "SaaS"},
+    {"company_id": "CO-2003", "name": "Mercury Consulting", "industry": "Consulting"},
+]
+CONTACTS = [
+    {"contact_id": "C-1001", "name": "Priya Shah", "company_id": "CO-2001", "company_name": "Nexora A.I.",
+     "email": None},
+    {"contact_id": "C-1002", "name": "Priya  Shah", "company_name": "NEXORA AI Inc", "email": "priya@nexora.example"},
+    {"contact_id": "C-1003", "name": "Liu Wei", "company_name": "Mercury Consulting", "email": "liu@mercury.example"},
+    {"contact_id": "C-1004", "name": "L. Wei", "company_name": "Orbit Labs", "email": "LIU@mercury.example"},
+    {"contact_id": "C-1005", "name": "Priya Shah", "company_name": "Mercury Consulting", "email": None},
+]
+DEALS = [{"deal_id": "D-3001", "company_name": "Nexora A.I.", "stage": "Lead"}]
+MEETINGS = [{"meeting_id": "M-4001", "company_name": "Nexora A.I.", "contact_name": "Priya Shah"}]
+
+
+def clusters(plan, kind):
+    return sorted((c["keep"], sorted(c["merge"])) for c in plan[kind])
+
+
+def test_company_key_ignores_punctuation_case_and_legal_suffixes():
+    assert company_key("Nexora A.I.") == company_key("NEXORA AI Inc") == "nexora ai"
+    assert company_key("Mercury Consulting") != company_key("Mercury Energy")
+
+
+def test_plan_merges_name_variants_and_shared_emails():
+    plan = build_plan(COMPANIES, CONTACTS, workers=1)
+
+    # The record with more fields filled in is kept
+    assert clusters(plan, "companies") == [("CO-2002", ["CO-2001"])]
+    # Same person at the merged company; same email at another company.
+    # A namesake at a different company, without an email match, stays.
+    assert clusters(plan, "contacts") == [("C-1001", ["C-1002"]), ("C-1003", ["C-1004"])]
+    assert plan["stats"]["contacts"]["records"] == len(CONTACTS)
+
+
+def test_plan_without_duplicates_is_empty():
+    plan = build_plan(COMPANIES[2:], CONTACTS[2:3], workers=1)
+    assert plan["companies"] == [] and plan["contacts"] == []
+
+
+@pytest.fixture
+def store(tmp_path):
+    paths = write_datasets(tmp_path, {"companies": COMPANIES, "contacts": CONTACTS,
+                                      "deals": DEALS, "meetings": MEETINGS})
+    store = CRMStore(paths)
+    yield store
+    store.close()
+
+
+def test_apply_plan_merges_and_rewrites_references(store, tmp_path):
+    plan = build_plan(store.companies, store.contacts, workers=1)
+    result = apply_plan(plan, store)
+
+    assert result["merged"] == {"companies": 1, "contacts": 2}
+    assert [c["company_id"] for c in store.companies] == ["CO-2002", "CO-2003"]
+    assert [c["contact_id"] for c in store.contacts] == ["C-1001", "C-1003", "C-1005"]
+
+    priya = store.get("contacts", "C-1001")
+    assert priya["email"] == "priya@nexora.example"     # filled in from C-1002
+    assert (priya["company_id"], priya["company_name"]) == ("CO-2002", "NEXORA AI Inc")
+    assert store.get("deals", "D-3001")["company_name"] == "NEXORA AI Inc"
+    meeting = store.get("meetings", "M-4001")
+    assert (meeting["company_name"], meeting["contact_name"]) == ("NEXORA AI Inc", "Priya Shah")
+
+    # Written through, and the versions moved so stale clients conflict
+    reopened = CRMStore(store.storage.paths)
+    assert len(reopened.companies) == 2
+    assert reopened.get("companies", "CO-2002")["version"] == 1
+    reopened.close()
+
+
+def test_apply_plan_skips_clusters_that_are_gone(store):
+    plan = build_plan(store.companies, store.contacts, workers=1)
+    with store.transaction():
+        store.records("companies")[:] = [c for c in store.companies if c["company_id"] != "CO-2001"]
+        store.touch("companies")
+
+    result = apply_plan(plan, store)
+    assert result["merged"]["companies"] == 0
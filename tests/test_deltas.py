@@ -0,0 +1,114 @@
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+import server
+from store import CRMStore
+
+
+@pytest.fixture
+def workers(paths):
+    # Two server workers: separate stores over the same files
+    stores = CRMStore(paths), CRMStore(paths)
+    yield stores
+    for store in stores:
+        store.close()
+
+
+def add_company(store, company_id):
+    _, revision = store.write(lambda s: s.add("companies", {"company_id": company_id, "name": company_id}))
+    return revision
+
+
+def test_changes_since_lists_only_later_changes(workers):
+    store, _ = workers
+    start = store.current_revision()
+    first = add_company(store, "CO-2003")
+    add_company(store, "CO-2004")
+
+    revision, changes = store.changes_since(first)
+    assert revision == store.revision
+    assert [c["company_id"] for c in changes["companies"]] == ["CO-2004"]
+    assert store.changes_since(revision) == (revision, {})
+    assert [c["company_id"] for c in store.changes_since(start)[1]["companies"]] == ["CO-2003", "CO-2004"]
+
+
+def test_revisions_are_shared_between_workers(workers):
+    a, b = workers
+    a.current_revision()
+    b.current_revision()
+
+    revision = add_company(b, "CO-2003")
+    # A revision handed out by b means the same to a: a has the change too
+    assert a.current_revision() == revision
+    assert [c["company_id"] for c in a.companies][-1] == "CO-2003"
+
+    # A delta a can't list (b's commit) is a resync, never an empty delta
+    since = add_company(a, "CO-2004")
+    latest = add_company(b, "CO-2005")
+    assert a.changes_since(since) == (latest, None)
+    assert a.changes_since(latest) == (latest, {})
+
+
+def test_worker_started_later_agrees(workers, paths):
+    a, _ = workers
+    add_company(a, "CO-2003")
+    time.sleep(0.01)
+    late = CRMStore(paths)
+    assert late.current_revision() == a.current_revision()
+
+    since = late.current_revision()
+    add_company(late, "CO-2004")
+    # A since handed out by the later worker still finds the change here
+    assert a.changes_since(since)[1] is None
+    assert [c["company_id"] for c in a.companies][-1] == "CO-2004"
+    late.close()
+
+
+def test_revision_ahead_of_the_files_asks_for_a_resync(workers):
+    store, _ = workers
+    revision = store.current_revision()
+    assert store.changes_since(revision + 1000) == (revision, None)
+
+
+def test_hand_edits_move_the_revision(workers, paths):
+    a, b = workers
+    revision = a.current_revision()
+    b.current_revision()
+    with open(paths["deals"], "w") as f:
+        f.write("[]")
+
+    assert a.changes_since(revision)[1] is None
+    assert b.current_revision() > revision
+    assert a.deals == [] and b.deals == []
+
+
+@pytest.fixture
+def client(workers, monkeypatch):
+    monkeypatch.setattr(server, "get_store", lambda: workers[0])
+    return TestClient(server.app)
+
+
+def test_crm_state_delta_and_etag(client, workers):
+    full = client.get("/crm-state")
+    assert full.status_code == 200
+    assert full.headers["etag"] == f'"{full.json()["revision"]}"'
+    assert [c["company_id"] for c in full.json()["companies"]] == ["CO-2001", "CO-2002"]
+
+    unchanged = client.get("/crm-state", headers={"If-None-Match": full.headers["etag"]})
+    assert unchanged.status_code == 304
+
+    # A commit by the other worker changes the ETag and shows up in the delta
+    add_company(workers[1], "CO-2003")
+    changed = client.get("/crm-state", headers={"If-None-Match": full.headers["etag"]})
+    assert changed.status_code == 200
+    delta = client.get("/crm-state", params={"since": full.json()["revision"]}).json()
+    assert delta["reset"] is True
+    assert [c["company_id"] for c in delta["companies"]] == ["CO-2001", "CO-2002", "CO-2003"]
+
+    # This worker's own commit comes back as a delta
+    since = delta["revision"]
+    add_company(workers[0], "CO-2004")
+    delta = client.get("/crm-state", params={"since": since}).json()
+    assert delta["changes"] == {"companies": [{"company_id": "CO-2004", "name": "CO-2004", "version": 1}]}
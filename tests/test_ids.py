@@ -0,0 +1,43 @@
+import threading
+
+from store import CRMStore, IdAllocator
+
+
+def test_ids_continue_from_the_highest_existing_one():
+    ids = IdAllocator()
+    ids.seed("C", [{"contact_id": "C-1007"}, {"contact_id": "C-1003"}, {"contact_id": "bad"}, {}], "contact_id")
+    assert ids.next("C") == "C-1008"
+    assert ids.reserve("C", 3) == ["C-1009", "C-1010", "C-1011"]
+    # A prefix with no ids yet starts above the default mark
+    assert ids.next("D") == "D-2001"
+
+
+def test_ids_are_never_reissued():
+    ids = IdAllocator()
+    ids.seed("CO", [{"company_id": "CO-2005"}], "company_id")
+    assert ids.next("CO") == "CO-2006"
+    # Reloaded data without the records handed out (e.g. not committed yet)
+    ids.seed("CO", [{"company_id": "CO-2005"}], "company_id")
+    assert ids.next("CO") == "CO-2007"
+
+
+def test_concurrent_allocation_is_unique():
+    ids = IdAllocator()
+    got = []
+
+    def take():
+        got.extend(ids.next("C") for _ in range(500))
+
+    threads = [threading.Thread(target=take) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(set(got)) == len(got) == 4000
+
+
+def test_store_ids_follow_the_loaded_data(paths):
+    store = CRMStore(paths)
+    assert store.new_id("companies") == "CO-2003"
+    assert store.reserve_ids("deals", 2) == ["D-3002", "D-3003"]
+    store.close()
@@ -0,0 +1,231 @@
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+from jobs import JobQueue, QueueFull
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+async def echo(payload):
+    if payload.get("fail"):
+        raise ValueError("bad payload")
+    await asyncio.sleep(payload.get("sleep", 0))
+    return {"echo": payload}
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "jobs.sqlite3")
+
+
+def queue(path, **kwargs):
+    kwargs.setdefault("poll", 0.05)
+    return JobQueue(path, echo, **kwargs)
+
+
+def test_job_runs_to_done(path):
+    async def main():
+        q = queue(path)
+        await q.start()
+        job = await q.submit({"n": 1})
+        assert job["status"] == "queued"
+        done = await q.get(job["job_id"], wait=5)
+        await q.stop()
+        q.close()
+        return done
+
+    done = run(main())
+    assert done["status"] == "done"
+    assert done["result"] == {"echo": {"n": 1}}
+    assert done["started"] is not None and done["finished"] >= done["started"]
+
+
+def test_failure_is_recorded(path):
+    async def main():
+        q = queue(path)
+        await q.start()
+        job = await q.submit({"fail": True})
+        failed = await q.get(job["job_id"], wait=5)
+        await q.stop()
+        q.close()
+        return failed
+
+    failed = run(main())
+    assert failed["status"] == "failed"
+    assert failed["error"] == "ValueError: bad payload"
+    assert "result" not in failed
+
+
+def test_higher_priority_runs_first(path):
+    async def main():
+        q = queue(path, workers=1)
+        low = await q.submit({"n": "low"}, priority=0)
+        high = await q.submit({"n": "high"}, priority=5)
+        await q.start()
+        low, high = await q.get(low["job_id"], wait=5), await q.get(high["job_id"], wait=5)
+        await q.stop()
+        q.close()
+        return low, high
+
+    low, high = run(main())
+    assert high["started"] <= low["started"]
+
+
+def test_queue_full(path):
+    async def main():
+        q = queue(path, max_queued=1)
+        await q.submit({})
+        with pytest.raises(QueueFull):
+            await q.submit({})
+        q.close()
+
+    run(main())
+
+
+def test_cancel_queued_and_running(path):
+    async def main():
+        q = queue(path, workers=1)
+        await q.start()
+        running = await q.submit({"sleep": 30})
+        queued = await q.submit({})
+        while (await q.get(running["job_id"]))["status"] != "running":
+            await asyncio.sleep(0.01)
+
+        cancelled = [await q.cancel(queued["job_id"]), await q.cancel(running["job_id"])]
+        again = await q.cancel(queued["job_id"])
+        counts = q.counts()
+        waiters = dict(q._waiters)
+        await q.stop()
+        q.close()
+        return cancelled, again, counts, waiters
+
+    cancelled, again, counts, waiters = run(main())
+    assert [job["status"] for job in cancelled] == ["cancelled", "cancelled"]
+    assert again["status"] == "cancelled"
+    assert counts["cancelled"] == 2 and counts["running"] == 0
+    assert waiters == {}
+
+
+def test_wait_timeout_leaves_no_waiter(path):
+    async def main():
+        q = queue(path)
+        job = await q.submit({})
+        timed_out = await asyncio.gather(q.get(job["job_id"], wait=0.05), q.get(job["job_id"], wait=0.05))
+        unknown = await q.get("nope", wait=0.05)
+        waiters = dict(q._waiters)
+        q.close()
+        return timed_out, unknown, waiters
+
+    timed_out, unknown, waiters = run(main())
+    assert [job["status"] for job in timed_out] == ["queued", "queued"]
+    assert unknown is None
+    assert waiters == {}
+
+
+def test_stopped_jobs_are_requeued_on_restart(path):
+    async def main():
+        q = queue(path, workers=1)
+        await q.start()
+        job = await q.submit({"sleep": 30})
+        while (await q.get(job["job_id"]))["status"] != "running":
+            await asyncio.sleep(0.01)
+        await q.stop()
+        assert (await q.get(job["job_id"]))["status"] == "running"
+
+        await q.start()
+        for _ in range(500):
+            if job["job_id"] in q._running:
+                break
+            await asyncio.sleep(0.01)
+        picked_up = job["job_id"] in q._running
+        await q.stop()
+        q.close()
+        return picked_up
+
+    assert run(main())
+
+
+@pytest.mark.skipif(os.name != "posix", reason="pid probe is POSIX only; the heartbeat decides elsewhere")
+def test_job_of_a_dead_process_is_requeued(path):
+    gone = subprocess.Popen([sys.executable, "-c", "pass"])
+    gone.wait()
+    q = queue(path)
+    job = run(q.submit({}))
+    q._claim()
+    q._execute("UPDATE jobs SET owner = ? WHERE id = ?", (f"{q.host}:{gone.pid}:dead", job["job_id"]))
+
+    assert q._recover() == 1
+    assert q._get(job["job_id"])["status"] == "queued"
+    q.close()
+
+
+def test_live_owner_keeps_its_job(path):
+    async def main():
+        a = queue(path, workers=1, lease=60)
+        await a.start()
+        job = await a.submit({"sleep": 30})
+        while (await a.get(job["job_id"]))["status"] != "running":
+            await asyncio.sleep(0.01)
+
+        # Another process opening the same file doesn't take it over
+        b = queue(path, workers=1, lease=60)
+        await b.start()
+        await asyncio.sleep(0.2)
+        taken = job["job_id"] in b._running
+        status = (await b.get(job["job_id"]))["status"]
+        await b.cancel(job["job_id"])
+        await b.stop()
+        await a.stop()
+        a.close()
+        b.close()
+        return taken, status
+
+    taken, status = run(main())
+    assert not taken
+    assert status == "running"
+
+
+def test_stale_heartbeat_is_requeued(path):
+    q = queue(path, lease=1)
+    job = run(q.submit({}))
+    q._claim()
+    assert q._recover() == 0        # our own running job
+
+    other = queue(path, lease=1)
+    q._execute("UPDATE jobs SET heartbeat = ? WHERE id = ?", (time.time() - 5, job["job_id"]))
+    assert other._recover() == 1
+    assert other._get(job["job_id"])["status"] == "queued"
+
+    # The old owner finishing late doesn't overwrite the requeued job
+    q._finish(job["job_id"], "done", {"late": True})
+    assert other._get(job["job_id"])["status"] == "queued"
+    q.close()
+    other.close()
+
+
+def test_wait_sees_a_job_finished_by_another_process(path):
+    async def main():
+        waiter = queue(path)            # no workers: only reads the row
+        worker = queue(path)
+        job = await waiter.submit({"n": 1})
+        await worker.start()
+        start = time.monotonic()
+        done = await waiter.get(job["job_id"], wait=30)
+        elapsed = time.monotonic() - start
+        waiters = dict(waiter._waiters)
+        await worker.stop()
+        waiter.close()
+        worker.close()
+        return done, elapsed, waiters
+
+    done, elapsed, waiters = run(main())
+    assert done["status"] == "done"
+    assert elapsed < 5
+    assert waiters == {}
@@ -0,0 +1,115 @@
+import os
+
+import pytest
+
+from journal import JournalStorage
+from store import CRMStore
+
+
+@pytest.fixture
+def journal(tmp_path, paths):
+    def open_storage(**kwargs):
+        return JournalStorage(str(tmp_path / "crm_snapshot.jsonl"), str(tmp_path / "crm_journal.jsonl"),
+                              json_paths=paths, sync_interval=0, **kwargs)
+    return open_storage
+
+
+def ids(records, id_field):
+    return [r[id_field] for r in records]
+
+
+def test_replay_applies_commits_over_legacy_files(journal):
+    store = CRMStore(storage=journal())
+    with store.transaction():
+        store.add("deals", {"deal_id": "D-3002", "company_name": "Nexora AI", "stage": "Lead"})
+    with store.transaction():
+        store.update("deals", "D-3001", {"stage": "Won"})
+    store.close()
+
+    storage = journal()
+    deals = storage.load("deals")
+    assert ids(deals, "deal_id") == ["D-3001", "D-3002"]
+    assert deals[0]["stage"] == "Won"
+    assert ids(storage.load("companies"), "company_id") == ["CO-2001", "CO-2002"]
+    storage.close()
+
+
+def test_replay_stops_at_a_torn_line(journal, tmp_path):
+    store = CRMStore(storage=journal())
+    with store.transaction():
+        store.update("companies", "CO-2002", {"size": "Mid"})
+    store.close()
+    with open(tmp_path / "crm_journal.jsonl", "a") as f:
+        f.write('{"ops": [{"ds": "companies", "put": [{"company_id": "CO-20')
+
+    storage = journal()
+    companies = storage.load("companies")
+    assert ids(companies, "company_id") == ["CO-2001", "CO-2002"]
+    assert companies[1]["size"] == "Mid"
+    storage.close()
+
+
+def test_commit_after_a_torn_line_survives(journal, tmp_path):
+    with open(tmp_path / "crm_journal.jsonl", "a") as f:
+        f.write('{"ops": [{"ds": "companies", "put": [{"company_id": "CO-20')
+
+    store = CRMStore(storage=journal())
+    with store.transaction():
+        store.add("companies", {"company_id": "CO-2003", "name": "Orbit Labs"})
+    store.close()
+
+    storage = journal()
+    assert ids(storage.load("companies"), "company_id") == ["CO-2001", "CO-2002", "CO-2003"]
+    storage.close()
+
+
+def test_tear_by_another_writer_is_cut_before_appending(journal, tmp_path):
+    store = CRMStore(storage=journal())
+    with store.transaction():
+        store.update("companies", "CO-2001", {"size": "Mid"})
+    # A process sharing the journal crashes mid-write
+    with open(tmp_path / "crm_journal.jsonl", "a") as f:
+        f.write('{"ops": [{"ds": "comp')
+    with store.transaction():
+        store.update("companies", "CO-2002", {"size": "Enterprise"})
+    store.close()
+
+    storage = journal()
+    assert [c["size"] for c in storage.load("companies")] == ["Mid", "Enterprise"]
+    storage.close()
+
+
+def test_replay_of_a_full_rewrite(journal):
+    store = CRMStore(storage=journal())
+    with store.transaction():
+        store.records("meetings").clear()
+        store.touch("meetings")
+    with store.transaction():
+        store.add("meetings", {"meeting_id": "M-4002", "company_name": "Nexora AI"})
+    store.close()
+
+    storage = journal()
+    assert ids(storage.load("meetings"), "meeting_id") == ["M-4002"]
+    storage.close()
+
+
+def test_compaction_keeps_the_same_state(journal, tmp_path):
+    store = CRMStore(storage=journal(compact_bytes=1))
+    with store.transaction():
+        store.add("contacts", {"contact_id": "C-1003", "name": "Anna Schmidt"})
+    store.storage.wait()
+    store.close()
+
+    assert os.path.exists(tmp_path / "crm_snapshot.jsonl")
+    assert not os.path.exists(tmp_path / "crm_journal.jsonl.compacting")
+    storage = journal()
+    assert ids(storage.load("contacts"), "contact_id") == ["C-1001", "C-1002", "C-1003"]
+    storage.close()
+
+
+def test_partial_import_keeps_other_datasets(journal, tmp_path):
+    storage = journal()
+    storage.import_json({"deals": storage.json_paths["deals"]})
+    assert ids(storage.load("meetings"), "meeting_id") == ["M-4001"]
+    assert ids(storage.load("deals"), "deal_id") == ["D-3001"]
+    storage.close()
@@ -0,0 +1,99 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from llm_cache import DiskTier, ExtractionCache, cache_key
+
+
+def test_key_covers_model_parameters_and_prompt():
+    request = {"model": "m", "temperature": 0.0, "input": [{"role": "user", "content": "hi"}]}
+    assert cache_key(request) == cache_key(dict(reversed(list(request.items()))))
+    assert cache_key(request) != cache_key(dict(request, temperature=0.5))
+    assert cache_key(request) != cache_key(dict(request, input=[{"role": "user", "content": "hi!"}]))
+
+
+def test_hits_are_fresh_copies():
+    cache = ExtractionCache()
+    calls = []
+    result = cache.get_or_call("k", lambda: calls.append(1) or {"contacts": []})
+    result["contacts"].append("mutated")
+
+    assert cache.get_or_call("k", lambda: calls.append(1)) == {"contacts": []}
+    assert calls == [1]
+    assert cache.info()["memory_hits"] == 1 and cache.info()["misses"] == 1
+
+
+def test_none_is_not_cached():
+    cache = ExtractionCache()
+    assert cache.get_or_call("k", lambda: None) is None
+    assert cache.get_or_call("k", lambda: {"ok": 1}) == {"ok": 1}
+
+
+def test_disk_tier_survives_a_new_cache(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    ExtractionCache(disk=DiskTier(path)).put("k", {"ok": 1})
+
+    cache = ExtractionCache(disk=DiskTier(path))
+    assert cache.get_or_call("k", lambda: pytest.fail("called")) == {"ok": 1}
+    assert cache.info()["disk_hits"] == 1
+
+
+def test_concurrent_threads_share_one_call():
+    cache = ExtractionCache()
+    calls = []
+
+    def call():
+        calls.append(1)
+        time.sleep(0.2)
+        return {"ok": 1}
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_call("k", call)))
+               for _ in range(5)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert calls == [1]
+    assert results == [{"ok": 1}] * 5
+    assert cache.info()["coalesced"] == 4
+
+
+def test_concurrent_tasks_share_one_call():
+    cache = ExtractionCache()
+    calls = []
+
+    async def call():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return {"ok": 1}
+
+    async def main():
+        return await asyncio.gather(*(cache.aget_or_call("k", call) for _ in range(5)))
+
+    assert asyncio.run(main()) == [{"ok": 1}] * 5
+    assert calls == [1]
+    assert cache.info()["coalesced"] == 4
+
+
+def test_waiters_make_their_own_call_when_the_shared_one_is_cancelled():
+    cache = ExtractionCache()
+
+    async def slow():
+        await asyncio.sleep(30)
+
+    async def quick():
+        return {"ok": 1}
+
+    async def main():
+        first = asyncio.create_task(cache.aget_or_call("k", slow))
+        await asyncio.sleep(0)
+        second = asyncio.create_task(cache.aget_or_call("k", quick))
+        await asyncio.sleep(0)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(main()) == {"ok": 1}
@@ -0,0 +1,66 @@
+import random
+
+import pytest
+from rapidfuzz import fuzz
+
+from crm import find_company, find_contacts
+from name_index import NameIndex
+
+WORDS = ["mercury", "nexora", "ai", "consulting", "labs", "global", "data", "systems",
+         "liu", "wei", "priya", "shah", "anna", "li", "group", "inc"]
+
+
+def names(seed, n=400):
+    rng = random.Random(seed)
+    out = []
+    for _ in range(n):
+        name = " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 3)))
+        if rng.random() < 0.3:
+            # a typo: drop, double or swap a character
+            i = rng.randrange(len(name))
+            name = rng.choice([name[:i] + name[i + 1:], name[:i] + name[i] + name[i:],
+                               name[:i] + name[i + 1:i + 2] + name[i:i + 1] + name[i + 2:]])
+        out.append(name.title() if rng.random() < 0.5 else name)
+    return out
+
+
+def linear(names, query, cutoff):
+    query = query.lower()
+    return [(pos, score) for pos, name in enumerate(names)
+            if (score := fuzz.token_set_ratio(query, name.lower())) >= cutoff]
+
+
+@pytest.mark.parametrize("cutoff", [60, 80, 90, 100])
+def test_match_equals_scoring_every_name(cutoff):
+    corpus = names(cutoff)
+    index = NameIndex.from_names(corpus)
+    for query in names(cutoff + 1, 60) + ["", "x", "Mercury Consulting"]:
+        assert index.match(query, cutoff) == linear(corpus, query, cutoff), query
+
+
+def test_updates_and_adds_are_matched():
+    records = [{"name": name} for name in names(7, 100)]
+    index = NameIndex(records)
+    index.update(3, records[3], {"name": "Zephyr Robotics"})
+    records[3] = {"name": "Zephyr Robotics"}
+    records.append({"name": "Zephyr Robotic"})
+    index.add(records[-1])
+
+    corpus = [r["name"] for r in records]
+    assert index.match("zephyr robotics", 80) == linear(corpus, "zephyr robotics", 80)
+    assert [pos for pos, _ in index.match("zephyr robotics", 80)] == [3, len(records) - 1]
+
+
+def test_finders_agree_with_and_without_the_index():
+    corpus = names(11, 300)
+    companies = [{"company_id": f"CO-{i}", "name": name} for i, name in enumerate(corpus)]
+    contacts = [{"contact_id": f"C-{i}", "name": name, "company_name": corpus[(i * 7) % len(corpus)]}
+                for i, name in enumerate(corpus)]
+    company_index, contact_index = NameIndex(companies), NameIndex(contacts)
+
+    for query in names(12, 80):
+        assert find_company(companies, query, company_index) is find_company(companies, query)
+        company = find_company(companies, query)
+        company_name = company["name"] if company else None
+        assert find_contacts(contacts, query, index=contact_index, company_name=company_name) \
+            == find_contacts(contacts, query, company_name=company_name)
@@ -0,0 +1,53 @@
+import crm
+import prompts
+from prompts import build_compact_prompt, transcript_fits
+
+COMPANY = {"company_id": "CO-2001", "name": "Mercury Consulting", "industry": "Consulting"}
+CONTACTS = [{"contact_id": f"C-{1000 + i}", "name": f"Contact {i}", "job_title": "CTO",
+             "company_name": "Mercury Consulting", "version": 2} for i in range(5)]
+DEALS = [{"deal_id": f"D-{3000 + i}", "deal_name": f"Deal {i}", "stage": "Discovery",
+          "company_name": "Mercury Consulting", "value": None} for i in range(5)]
+MEETINGS = [{"meeting_id": f"M-{4000 + i}", "summary": f"Meeting {i}. " + "Discussed pricing. " * 40,
+             "company_name": "Mercury Consulting"} for i in range(5)]
+NOTES = "Liu Wei (CTO): We want analytics for the sales team and a proposal by Friday."
+
+
+def test_context_is_compact():
+    prompt, report = build_compact_prompt(NOTES, CONTACTS, COMPANY, DEALS, MEETINGS, budget=100000)
+    assert report["trimmed"] == [] and not report["over_budget"]
+    assert NOTES in prompt
+    assert '"version"' not in prompt and '"value":null' not in prompt
+    # company_name only repeats the matched company
+    assert prompt.count("Mercury Consulting") == 1
+
+
+def test_oldest_context_goes_first():
+    _, full = build_compact_prompt(NOTES, CONTACTS, COMPANY, DEALS, MEETINGS, budget=100000)
+    budget = full["tokens"] - full["sections"]["meetings"] // 2
+    prompt, report = build_compact_prompt(NOTES, CONTACTS, COMPANY, DEALS, MEETINGS, budget=budget)
+
+    assert report["tokens"] <= budget
+    assert report["trimmed"] and report["trimmed"][0].endswith("meetings")
+    assert "M-4004" in prompt and "M-4000" not in prompt
+    assert len(DEALS) == 5 and len(MEETINGS) == 5       # callers' lists are left alone
+
+
+def test_transcript_is_never_cut():
+    notes = "Anna (CMO): " + " ".join(f"point {i} about the rollout." for i in range(400))
+    prompt, report = build_compact_prompt(notes, CONTACTS, COMPANY, DEALS, MEETINGS, budget=500)
+
+    assert notes in prompt
+    assert report["over_budget"]
+    assert report["trimmed"] == ["dropped 5 meetings", "dropped 5 deals", "dropped 5 contacts"]
+    assert '"name":"Mercury Consulting"' in prompt      # the company record stays
+
+
+def test_over_budget_transcripts_are_chunked(monkeypatch):
+    notes = "\n\n".join(f"Speaker {i % 2}: " + "A long point about the rollout plan. " * 10
+                        for i in range(20))
+    assert len(notes) < crm.CHUNK_THRESHOLD
+    assert transcript_fits(notes) and not crm._long_transcript(notes)
+
+    monkeypatch.setattr(prompts, "PROMPT_BUDGET", 600)
+    assert not transcript_fits(notes)
+    assert crm._long_transcript(notes)
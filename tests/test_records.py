@@ -0,0 +1,78 @@
+import copy
+import json
+import pickle
+import random
+
+import pytest
+
+from records import Contact, Deal, compact, plain
+from store import CRMStore, load_json
+
+KEYS = list(Contact.FIELDS) + ["source", "notes"]
+
+
+def test_record_behaves_like_the_dict_it_was_built_from():
+    rng = random.Random(0)
+    data = {"contact_id": "C-1", "name": "Liu Wei", "source": "import"}
+    record, expected = Contact(data), dict(data)
+
+    for _ in range(2000):
+        key = rng.choice(KEYS)
+        op = rng.choice(["set", "del", "pop", "setdefault", "update"])
+        value = rng.choice([None, "x", "Unknown", 3, ["a"]])
+        if op == "set":
+            record[key] = value
+            expected[key] = value
+        elif op == "del":
+            if key in expected:
+                del record[key]
+                del expected[key]
+            else:
+                with pytest.raises(KeyError):
+                    del record[key]
+        elif op == "pop":
+            assert record.pop(key, "missing") == expected.pop(key, "missing")
+        elif op == "setdefault":
+            assert record.setdefault(key, value) == expected.setdefault(key, value)
+        else:
+            record.update({key: value})
+            expected.update({key: value})
+
+        assert record == expected
+        assert len(record) == len(expected)
+        assert (key in record) == (key in expected)
+        assert record.get(key, "missing") == expected.get(key, "missing")
+        if key not in expected:
+            with pytest.raises(KeyError):
+                record[key]
+
+
+def test_copies_pickles_and_json():
+    deal = Deal({"deal_id": "D-1", "stage": "Discovery", "competitors": ["HubSpot"], "extra": 1})
+
+    assert pickle.loads(pickle.dumps(deal)) == deal
+    assert isinstance(copy.deepcopy(deal), Deal)
+    assert dict(deal) == {"deal_id": "D-1", "stage": "Discovery", "competitors": ["HubSpot"], "extra": 1}
+    assert json.loads(json.dumps(deal, default=plain)) == dict(deal)
+    assert not hasattr(deal, "__dict__")
+
+
+def test_short_interned_values_are_shared():
+    stage = "".join(["Disc", "overy"])         # built at run time: not interned by the compiler
+    a, b = Deal({"stage": "Discovery"}), Deal({"stage": stage})
+    assert a["stage"] is b["stage"]
+
+    records = compact("deals", [{"deal_id": "D-1"}, {"deal_id": "D-2"}])
+    assert all(isinstance(r, Deal) for r in records)
+
+
+def test_store_writes_back_what_it_read(paths):
+    before = {name: load_json(path) for name, path in paths.items()}
+    store = CRMStore(paths)
+    with store.transaction():
+        for name in before:
+            store.touch(name)
+    store.close()
+
+    for name, path in paths.items():
+        assert load_json(path) == before[name]
@@ -0,0 +1,81 @@
+import random
+
+import numpy as np
+
+from crm import get_crm_context
+from retrieval import TEXT_FIELDS, RetrievalIndex
+from store import CRMStore
+
+FIELDS = TEXT_FIELDS["meetings"]
+TOPICS = ["cloud migration budget", "cybersecurity audit findings", "invoice automation pilot",
+          "data residency compliance", "hiring plan for the sales team", "renewal pricing discount"]
+
+
+def meetings(seed, n=300):
+    rng = random.Random(seed)
+    companies = ["Mercury Consulting", "Nexora AI", "Orbit Labs"]
+    return [{"meeting_id": f"M-{i}", "company_name": rng.choice(companies),
+             "summary": f"Talked about the {rng.choice(TOPICS)} and the {rng.choice(TOPICS)}.",
+             "outcome": rng.choice(["Follow-up booked", "Proposal requested", None])}
+            for i in range(n)]
+
+
+def test_search_returns_the_top_k_of_all_scores():
+    records = meetings(1)
+    index = RetrievalIndex(records, FIELDS)
+    q = index.query_vector("security audit findings")
+    scores = index.vectors[:len(records)].astype(np.float32) @ q
+
+    hits = index.search("security audit findings", 10)
+    assert [score for _, score in hits] == sorted(scores.tolist(), reverse=True)[:10]
+    assert all(scores[pos] == score for pos, score in hits)
+    # Equal scores: newer rows first
+    assert all(a[0] > b[0] for a, b in zip(hits, hits[1:]) if a[1] == b[1])
+    assert all("audit" in records[pos]["summary"] for pos, _ in hits)
+
+
+def test_company_search_covers_name_variants_only():
+    records = meetings(2, 50) + [
+        {"meeting_id": "M-a", "company_name": "Nexora A.I.", "summary": "Kubernetes rollout", "outcome": None},
+        {"meeting_id": "M-b", "company_name": "NEXORA AI Inc", "summary": "Kubernetes costs", "outcome": None},
+        {"meeting_id": "M-c", "company_name": "Orbit Labs", "summary": "Kubernetes rollout", "outcome": None},
+    ]
+    index = RetrievalIndex(records, FIELDS)
+
+    hits = index.search("kubernetes rollout", 2, "Nexora AI")
+    assert [records[pos]["meeting_id"] for pos, _ in hits] == ["M-a", "M-b"]
+    assert all(records[pos]["company_name"] in ("Nexora AI", "Nexora A.I.", "NEXORA AI Inc")
+               for pos in index.group_rows("nexora ai"))
+    assert index.search("kubernetes", 3, "Unknown Co") == []
+
+
+def test_updates_and_adds_match_a_rebuild():
+    records = meetings(3, 100)
+    index = RetrievalIndex(records, FIELDS)
+    change = {"summary": "Kubernetes rollout review", "company_name": "Orbit Labs"}
+    index.update(5, records[5], change)
+    records[5] = dict(records[5], **change)
+    records.append({"meeting_id": "M-new", "company_name": "Orbit Labs", "summary": "Kubernetes plan"})
+    index.add(records[-1])
+
+    rebuilt = RetrievalIndex(records, FIELDS)
+    assert np.array_equal(index.df, rebuilt.df)
+    for company in (None, "Orbit Labs", "Nexora AI"):
+        assert index.search("kubernetes rollout", 5, company) == rebuilt.search("kubernetes rollout", 5, company)
+    assert [pos for pos, _ in index.search("kubernetes rollout", 2, "Orbit Labs")] == [5, 100]
+
+
+def test_context_picks_the_relevant_meetings_least_relevant_first(paths):
+    store = CRMStore(paths)
+    with store.transaction():
+        for i, topic in enumerate(TOPICS * 2):
+            store.add("meetings", {"meeting_id": f"M-5{i:03}", "company_name": "Mercury Consulting",
+                                   "summary": f"Discussed the {topic}.", "outcome": None})
+
+    _, _, _, found = get_crm_context("Mercury Consulting", "Liu Wei", store=store,
+                                     meeting_text="Next steps on the cybersecurity audit findings")
+    store.close()
+
+    assert len(found) == 3
+    assert [m["meeting_id"] for m in found[-2:]] == ["M-5001", "M-5007"]
+    assert all("cybersecurity" in m["summary"] for m in found[-2:])
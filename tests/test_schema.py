@@ -0,0 +1,144 @@
+import copy
+import json
+
+import pytest
+
+import crm
+import llm
+import llm_cache
+from llm import MockProvider
+from schema import validate_extraction
+
+VALID = {
+    "contacts": [{"temp_id": "c1", "existing_id": None, "name": "Liu Wei", "job_title": "CTO",
+                  "email": None, "phone": None, "decision_power": "yes"}],
+    "companies": [{"temp_id": "co1", "existing_id": "CO-2001", "name": "Mercury Consulting",
+                   "industry": None, "size": None, "location": None}],
+    "deals": [{"temp_id": "d1", "existing_id": None, "name": "Analytics rollout", "value": 50000,
+               "currency": "EUR", "stage": "Discovery", "timeline": None, "next_steps": None,
+               "competitors": ["HubSpot"]}],
+    "actions": [{"entity": "deal", "operation": "create", "target_temp_id": "d1", "reason": None},
+                {"entity": "contact", "operation": "update", "target_temp_id": "c1"}],
+}
+
+
+def paths(issues):
+    return [issue["path"] for issue in issues]
+
+
+def test_valid_extraction_has_no_issues():
+    assert validate_extraction(VALID) == []
+
+
+def test_not_an_object():
+    assert paths(validate_extraction([])) == ["$"]
+
+
+def test_missing_and_mistyped_sections():
+    data = copy.deepcopy(VALID)
+    del data["contacts"]
+    data["deals"] = {}
+    issues = validate_extraction(data)
+    assert {"section": "contacts", "path": "contacts", "reason": "is missing"} in issues
+    assert {"section": "deals", "path": "deals", "reason": "must be a list"} in issues
+
+
+def test_field_checks():
+    data = copy.deepcopy(VALID)
+    contact = data["contacts"][0]
+    contact["temp_id"] = "x1"
+    del contact["email"]
+    data["deals"][0]["competitors"] = "HubSpot"
+    data["actions"][0]["operation"] = "delete"
+
+    assert sorted(paths(validate_extraction(data))) == [
+        "actions[0].operation", "actions[1].target_temp_id",
+        "contacts[0].email", "contacts[0].temp_id", "deals[0].competitors",
+    ]
+
+
+def test_duplicate_temp_id():
+    data = copy.deepcopy(VALID)
+    data["contacts"].append(dict(data["contacts"][0], name="Priya Shah"))
+    assert paths(validate_extraction(data)) == ["contacts[1].temp_id"]
+
+
+def test_action_target_must_exist_in_its_own_section():
+    data = copy.deepcopy(VALID)
+    data["actions"][0]["target_temp_id"] = "c1"
+    issues = validate_extraction(data)
+    assert paths(issues) == ["actions[0].target_temp_id"]
+    assert issues[0]["reason"] == "c1 is not a temp_id in deals"
+
+
+def test_new_deal_needs_a_company():
+    data = copy.deepcopy(VALID)
+    data["companies"] = []
+    assert paths(validate_extraction(data)) == ["companies"]
+
+    data["deals"][0]["existing_id"] = "D-3001"
+    assert validate_extraction(data) == []
+
+
+class Scripted(MockProvider):
+    """
+    Answers with the given texts in turn, recording the prompts.
+    """
+
+    def __init__(self, texts):
+        super().__init__()
+        self.texts = list(texts)
+        self.prompts = []
+
+    def text(self, request):
+        self.prompts.append(request["input"][-1]["content"])
+        return self.texts.pop(0)
+
+
+@pytest.fixture
+def scripted(monkeypatch):
+    monkeypatch.setattr(llm_cache, "_default_cache", llm_cache.ExtractionCache(16))
+    monkeypatch.setattr(crm, "_backoff", lambda attempt: 0)
+    providers = []
+
+    def use(*texts):
+        providers.append(Scripted(texts))
+        llm.set_provider(providers[-1])
+        return providers[-1]
+
+    old = llm.set_provider(None)
+    yield use
+    llm.set_provider(old)
+
+
+def test_schema_errors_get_a_targeted_repair(scripted):
+    broken = copy.deepcopy(VALID)
+    broken["deals"][0]["competitors"] = "HubSpot"
+    provider = scripted(json.dumps(broken), json.dumps({"deals": VALID["deals"]}))
+
+    data = crm.generate_with_retries("prompt")
+
+    assert [(a["kind"], a["outcome"]) for a in data["meta"]["attempts"]] == [("generate", "invalid"),
+                                                                           ("repair", "ok")]
+    assert {k: v for k, v in data.items() if k != "meta"} == VALID
+    assert "deals[0].competitors" in provider.prompts[1]
+    assert '"contacts"' not in provider.prompts[1].split("SECTIONS TO FIX:")[1].split("TEMP_IDS")[0]
+
+
+def test_prose_is_regenerated_with_feedback(scripted):
+    provider = scripted("I could not find any CRM data in this meeting, sorry. " * 5, json.dumps(VALID))
+
+    data = crm.generate_with_retries("prompt")
+
+    assert [a["outcome"] for a in data["meta"]["attempts"]] == ["aborted", "ok"]
+    assert provider.prompts[1].startswith("prompt\n\nYOUR PREVIOUS ANSWER WAS REJECTED:")
+
+
+def test_exhausted_retries_return_the_empty_extraction(scripted):
+    scripted("{}", "{}", "{}")
+
+    data = crm.generate_with_retries("prompt", retries=3)
+
+    assert data["meta"]["ok"] is False and data["meta"]["failure"]
+    assert len(data["meta"]["attempts"]) == 3
+    assert validate_extraction({k: v for k, v in data.items() if k != "meta"}) == []
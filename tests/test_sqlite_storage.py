@@ -0,0 +1,82 @@
+import json
+import os
+import shutil
+
+import pytest
+
+from crm import get_crm_context
+from sqlite_storage import SQLiteStorage
+from store import DATASETS, CRMStore
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+
+
+@pytest.fixture
+def bundled(tmp_path):
+    """
+    The bundled datasets, copied so the tests can write to them.
+    """
+    paths = {}
+    for name, (filename, _, _) in DATASETS.items():
+        paths[name] = str(tmp_path / filename)
+        shutil.copy(os.path.join(ROOT, filename), paths[name])
+    return paths
+
+
+@pytest.fixture
+def stores(bundled, tmp_path):
+    json_store = CRMStore(bundled)
+    sqlite_store = CRMStore(storage=SQLiteStorage(str(tmp_path / "crm.sqlite3"), bundled))
+    yield json_store, sqlite_store
+    json_store.close()
+    sqlite_store.close()
+
+
+def ids(records):
+    return [r.get("contact_id") or r.get("deal_id") or r.get("meeting_id") for r in records]
+
+
+def same(a, b):
+    company_a, *lists_a = a
+    company_b, *lists_b = b
+    assert company_a == company_b
+    assert [ids(x) for x in lists_a] == [ids(x) for x in lists_b]
+
+
+def test_first_open_imports_the_json_files(stores):
+    json_store, sqlite_store = stores
+    for name in DATASETS:
+        assert [dict(r) for r in sqlite_store.records(name)] == [dict(r) for r in json_store.records(name)]
+
+
+def test_crm_context_matches_the_loaded_tables(stores):
+    json_store, sqlite_store = stores
+    queries = {(m["company_name"], m["contact_name"]) for m in json_store.meetings}
+    queries |= {("mercury consulting", "liu"), ("No Such Company", "Nobody")}
+    for company_name, contact_name in sorted(queries):
+        same(get_crm_context(company_name, contact_name, store=json_store),
+             sqlite_store.storage.crm_context(company_name, contact_name))
+
+
+def test_crm_context_sees_new_commits(stores):
+    _, sqlite_store = stores
+    company = sqlite_store.companies[0]
+    with sqlite_store.transaction():
+        sqlite_store.add("meetings", {"meeting_id": "M-9001", "company_name": company["name"],
+                                      "contact_name": "Someone", "summary": "New meeting."})
+    _, _, _, meetings = sqlite_store.storage.crm_context(company["name"], "Someone")
+    assert ids(meetings)[-1] == "M-9001"
+
+
+def test_reimport_drops_cached_groups(stores, bundled):
+    _, sqlite_store = stores
+    storage = sqlite_store.storage
+    name = sqlite_store.meetings[0]["company_name"]
+    assert storage._relevant("meetings", name, "pricing", 3)
+
+    # Filed under a spelling of the company the cached groups haven't seen
+    with open(bundled["meetings"], "w") as f:
+        json.dump([{"meeting_id": "M-9001", "company_name": name.upper() + " Inc",
+                    "summary": "Pricing call."}], f)
+    storage.import_json({"meetings": bundled["meetings"]})
+    assert ids(storage._relevant("meetings", name, "pricing", 3)) == ["M-9001"]
@@ -0,0 +1,178 @@
+import threading
+import time
+
+import pytest
+
+from crm import get_crm_context
+from store import CRMStore, VersionConflict, load_json
+
+
+@pytest.fixture
+def store(paths):
+    store = CRMStore(paths)
+    yield store
+    store.close()
+
+
+def test_add_is_written_through_on_commit(store, paths):
+    with store.transaction():
+        store.add("companies", {"company_id": "CO-2003", "name": "Orbit Labs"})
+
+    saved = load_json(paths["companies"])
+    assert [c["name"] for c in saved] == ["Mercury Consulting", "Nexora AI", "Orbit Labs"]
+
+    reopened = CRMStore(paths)
+    assert [c["company_id"] for c in reopened.companies] == ["CO-2001", "CO-2002", "CO-2003"]
+    reopened.close()
+
+
+def test_records_are_parsed_once(store):
+    assert store.companies is store.companies
+    assert store.records("deals") is store.deals
+
+
+def test_failed_transaction_is_rolled_back(store, paths):
+    with pytest.raises(RuntimeError):
+        with store.transaction():
+            store.companies[1]["size"] = "Enterprise"
+            store.touch("companies")
+            raise RuntimeError("boom")
+
+    assert store.companies[1]["size"] is None
+    assert load_json(paths["companies"])[1]["size"] is None
+
+
+def test_changes_on_disk_are_picked_up(paths):
+    store = CRMStore(paths)
+    other = CRMStore(paths)
+    assert len(store.meetings) == 1
+
+    with other.transaction():
+        other.add("meetings", {"meeting_id": "M-4002", "company_name": "Nexora AI"})
+
+    assert [m["meeting_id"] for m in store.meetings] == ["M-4001", "M-4002"]
+    store.close()
+    other.close()
+
+
+def test_field_indexes_follow_adds_and_updates(store):
+    deals = store.field_index("deals", "company_name")
+    assert deals.get("Mercury Consulting") == [0]
+
+    with store.transaction():
+        store.add("deals", {"deal_id": "D-3002", "company_name": "Nexora AI"})
+        store.update("deals", "D-3001", {"company_name": "Nexora AI"})
+
+    assert store.field_index("deals", "company_name") is deals
+    assert deals.get("Mercury Consulting") == []
+    assert deals.get("Nexora AI") == [0, 1]
+
+
+def test_context_from_indexes_matches_scans(store):
+    with store.transaction():
+        for i in range(5):
+            store.add("deals", {"deal_id": f"D-31{i:02}", "company_name": "Mercury Consulting"})
+            store.add("meetings", {"meeting_id": f"M-41{i:02}", "company_name": "Nexora AI"})
+        store.add("contacts", {"contact_id": "C-1003", "name": "Anna Li", "company_id": "CO-2002"})
+
+    lists = (store.companies, store.contacts, store.deals, store.meetings)
+    for company, contact in [("Mercury Consulting", "Liu Wei"), ("nexora ai", "Anna Li"),
+                             ("Mercury Consultng", "Priya Shah"), ("Unknown", "Unknown")]:
+        assert get_crm_context(company, contact, store=store) == get_crm_context(company, contact, *lists)
+
+
+def test_update_bumps_the_version(store):
+    with store.transaction():
+        store.update("deals", "D-3001", {"stage": "Proposal"})
+    assert store.get("deals", "D-3001")["version"] == 1     # written before versions existed: 0, then bumped
+
+
+def test_update_with_stale_version_conflicts(store):
+    with store.transaction():
+        store.update("contacts", "C-1001", {"job_title": "CEO"}, expected_version=0)
+
+    with pytest.raises(VersionConflict) as info:
+        with store.transaction():
+            store.update("contacts", "C-1001", {"job_title": "COO"}, expected_version=0)
+    assert (info.value.expected, info.value.actual) == (0, 1)
+    assert store.get("contacts", "C-1001")["job_title"] == "CEO"
+
+
+def test_write_commits_and_reports_revision(store):
+    before = store.current_revision()
+    result, revision = store.write(lambda s: s.update("companies", "CO-2001", {"size": "Mid"})["version"])
+
+    assert result == 1
+    assert revision > before
+    current, changes = store.changes_since(before)
+    assert current == revision
+    assert [c["company_id"] for c in changes["companies"]] == ["CO-2001"]
+
+
+def test_write_failure_only_reaches_its_caller(store):
+    def conflicting(s):
+        s.update("contacts", "C-1002", {"name": "Priya S."}, expected_version=5)
+
+    with pytest.raises(VersionConflict):
+        store.write(conflicting)
+    assert store.get("contacts", "C-1002")["name"] == "Priya Shah"
+
+
+def write_concurrently(store, n, failing=None):
+    """
+    n threads each adding a company through store.write(); the one
+    numbered `failing` also makes a stale update. Returns ({thread:
+    company_id}, {thread: error}).
+    """
+    def add(i):
+        def fn(s):
+            time.sleep(0.01)    # long enough for the others to queue up
+            if i == failing:
+                s.update("contacts", "C-1001", {}, expected_version=99)
+            return s.add("companies", {"company_id": f"CO-3{i:03}", "name": f"Co {i}"})["company_id"]
+        return fn
+
+    results, errors = {}, {}
+
+    def run(i):
+        try:
+            results[i] = store.write(add(i))[0]
+        except VersionConflict as e:
+            errors[i] = e
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results, errors
+
+
+def test_concurrent_writes_are_grouped_into_fewer_commits(store, paths):
+    results, errors = write_concurrently(store, 20)
+
+    assert errors == {} and len(results) == 20
+    assert store.write_stats["writes"] == 20
+    assert store.write_stats["commits"] < 20
+    assert {c["company_id"] for c in load_json(paths["companies"])} >= set(results.values())
+
+
+def test_a_failing_write_does_not_fail_its_group(store, paths):
+    results, errors = write_concurrently(store, 20, failing=3)
+
+    assert list(errors) == [3]
+    assert sorted(results) == [i for i in range(20) if i != 3]
+    saved = {c["company_id"] for c in load_json(paths["companies"])}
+    assert saved >= set(results.values()) and "CO-3003" not in saved
+
+
+def test_apply_reports_version_conflicts(store):
+    from crm import apply_actions
+    contact = {"temp_id": "c1", "existing_id": "C-1001", "version": 3, "name": "Liu Wei", "job_title": "CEO",
+               "email": None, "phone": None, "decision_power": "yes"}
+    result = apply_actions({"contacts": [contact], "companies": [], "deals": [], "actions": []}, store=store)
+
+    assert result["conflicts"] == [{"entity": "contact", "temp_id": "c1", "existing_id": "C-1001",
+                                    "expected_version": 3, "current_version": 0}]
+    assert result["mapping"] == {}
+    assert store.get("contacts", "C-1001")["job_title"] == "CTO"
@@ -0,0 +1,106 @@
+import asyncio
+import copy
+import json
+
+import pytest
+
+import crm
+import llm
+import llm_cache
+from llm import SAMPLE_EXTRACTION, MockProvider
+from store import CRMStore
+from stream_parser import StreamParser
+
+
+def feed_all(parser, deltas):
+    return [event for delta in deltas for event in parser.feed(delta)]
+
+
+def split(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+TEXT = "```json\n" + json.dumps({
+    "contacts": [{"name": "A {b}", "note": "say \"hi\" [x]"}, {"name": "C", "tags": {"x": [1, {"y": 2}]}}],
+    "summary": {"contacts": [{"not": "streamed"}]},
+    "deals": [],
+    "actions": [{"entity": "contact", "operation": "create"}],
+}) + "\n```"
+
+
+@pytest.mark.parametrize("size", [1, 3, 7, len(TEXT)])
+def test_parser_emits_each_entity_once_whatever_the_split(size):
+    parser = StreamParser()
+    events = feed_all(parser, split(TEXT, size))
+    assert events == [
+        ("contacts", {"name": "A {b}", "note": "say \"hi\" [x]"}),
+        ("contacts", {"name": "C", "tags": {"x": [1, {"y": 2}]}}),
+        ("actions", {"entity": "contact", "operation": "create"}),
+    ]
+    assert parser.text() == TEXT
+
+
+def test_parser_skips_entities_that_do_not_parse():
+    parser = StreamParser()
+    events = feed_all(parser, ['{"contacts": [{"name": "A", }, ', '{"name": "B"}]}'])
+    assert events == [("contacts", {"name": "B"})]
+
+
+class Scripted(MockProvider):
+    """
+    Answers with the given texts in turn, recording the prompts.
+    """
+
+    def __init__(self, texts):
+        super().__init__(chunks=5)
+        self.texts = list(texts)
+        self.prompts = []
+
+    def text(self, request):
+        self.prompts.append(request["input"][-1]["content"])
+        return self.texts.pop(0)
+
+
+def stream(paths, provider):
+    async def main():
+        store = CRMStore(paths)
+        old = llm.set_provider(provider)
+        try:
+            return [event async for event in crm.stream_meeting_async(
+                "Met Liu Wei about the analytics rollout.", "Mercury Consulting", "Liu Wei", store)]
+        finally:
+            llm.set_provider(old)
+            store.close()
+    return asyncio.run(main())
+
+
+def test_rejected_stream_gets_a_targeted_repair(paths, monkeypatch):
+    monkeypatch.setattr(llm_cache, "_default_cache", llm_cache.ExtractionCache(16))
+    broken = copy.deepcopy(SAMPLE_EXTRACTION)
+    broken["contacts"][0]["name"] = None
+    fixed = {"contacts": SAMPLE_EXTRACTION["contacts"]}
+    provider = Scripted([json.dumps(broken), json.dumps(fixed)])
+
+    events = stream(paths, provider)
+    kind, data = events[-1]
+    assert kind == "done"
+    assert [a["kind"] for a in data["meta"]["attempts"]] == ["generate", "repair"]
+    assert data["meta"]["ok"] and not data["meta"]["cached"]
+    assert data["contacts"] == SAMPLE_EXTRACTION["contacts"]
+    assert data["deals"] == SAMPLE_EXTRACTION["deals"]
+    assert len(provider.prompts) == 2
+    assert "Fix ONLY these sections" in provider.prompts[1]
+
+    # The repaired extraction is cached: the same meeting streams no call
+    again = stream(paths, Scripted([]))
+    assert again[-1][1]["meta"]["cached"]
+
+
+def test_valid_stream_streams_entities_and_is_a_single_call(paths, monkeypatch):
+    monkeypatch.setattr(llm_cache, "_default_cache", llm_cache.ExtractionCache(16))
+    provider = Scripted([json.dumps(SAMPLE_EXTRACTION)])
+
+    events = stream(paths, provider)
+    assert [e[1] for e in events[:-1]] == ["contacts", "companies", "deals", "actions"]
+    assert [a["outcome"] for a in events[-1][1]["meta"]["attempts"]] == ["ok"]
+    assert len(provider.prompts) == 1
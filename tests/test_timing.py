@@ -0,0 +1,59 @@
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+import llm
+import llm_cache
+import server
+from llm import MockProvider
+from store import CRMStore
+
+MEETING = {"meeting_text": "Met Liu Wei about the analytics rollout.",
+           "company_name": "Mercury Consulting", "contact_name": "Liu Wei"}
+
+
+@pytest.fixture
+def client(paths, monkeypatch):
+    store = CRMStore(paths)
+    monkeypatch.setattr(server, "get_store", lambda: store)
+    monkeypatch.setattr(llm_cache, "_default_cache", llm_cache.ExtractionCache(16))
+    old = llm.set_provider(MockProvider())
+    yield TestClient(server.app, headers={"X-CRM-Timing": "1"})
+    llm.set_provider(old)
+    store.close()
+
+
+def stages(value):
+    return {part.split(";")[0].strip() for part in value.split(",")}
+
+
+def test_plain_response_has_the_header(client):
+    reply = client.post("/extract", json=MEETING)
+    assert reply.status_code == 200
+    assert {"context", "llm", "total"} <= stages(reply.headers["Server-Timing"])
+
+
+def test_stream_sends_timings_as_its_last_event(client):
+    reply = client.post("/extract/stream", json=MEETING)
+    assert "Server-Timing" not in reply.headers
+    blocks = [b for b in reply.text.split("\n\n") if b]
+    assert blocks[-2].startswith("event: done")
+    assert blocks[-1].startswith("event: timing")
+    timing = json.loads(blocks[-1].split("data: ", 1)[1])["server_timing"]
+    assert {"context", "llm", "total"} <= stages(timing)
+
+
+def test_batch_sends_timings_as_its_last_line(client):
+    reply = client.post("/extract/batch", json={"items": [MEETING, MEETING]})
+    assert "Server-Timing" not in reply.headers
+    lines = [json.loads(line) for line in reply.text.splitlines()]
+    assert sorted(line["index"] for line in lines[:-1]) == [0, 1]
+    assert {"llm", "total"} <= stages(lines[-1]["server_timing"])
+
+
+def test_no_trailer_unless_asked(client):
+    client.headers.pop("X-CRM-Timing")
+    reply = client.post("/extract/stream", json=MEETING)
+    assert "event: timing" not in reply.text
+    assert "Server-Timing" not in client.post("/extract", json=MEETING).headers